@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import fire_numpy
+import fire_parity
+import metrics
+import server
+import state_sync
+import wire_format
+from fire_bands import BandFireEngine
+from sim_grid import Grid
+
+MAPS = fire_parity.MAPS
+SIZES = "120x90,240x180"
+RESULTS = os.path.join(server.BASE_DIR, "bench_results.json")
+SEED = 1234
+
+
+def use_grid(grid):
+    # The stamp helpers read the grid and its size from module globals
+    server.grid = grid
+    server.COLS = grid.cols
+    server.ROWS = grid.rows
+
+
+def new_grid(cols, rows):
+    return Grid(cols, rows, list(server.FUEL_PROPERTIES)
+                + list(server.STAMP_TYPES))
+
+
+def load_bundled(path):
+    map_grid = fire_parity.load_map(path)
+    use_grid(new_grid(len(map_grid[0]), len(map_grid)))
+    server.load_map_grid(map_grid)
+
+
+def build_synthetic(cols, rows):
+    # Grass with rows of trees, a few lakes and houses; all draws come
+    # from the seeded server generator, so a size always builds the same map
+    use_grid(new_grid(cols, rows))
+    for x in range(0, cols, 3):
+        for y in range(0, rows, 3):
+            server.place_stamp(x, y, "grass")
+    for y in range(4, rows - 12, 22):
+        for x in range(6, cols, 14):
+            server.place_stamp(x, y, "tree")
+    for n in range(max(1, cols * rows // 4000)):
+        server.place_stamp(server.rng.randrange(cols),
+                           server.rng.randrange(rows),
+                           "lake" if n % 2 else "house")
+
+
+def select_engine(name, workers):
+    server.numpy_engine = None
+    server.band_engine = None
+    if name == "numpy":
+        server.numpy_engine = fire_numpy.NumpyFireEngine(
+            server.FUEL_PROPERTIES, server.WIND, server.WIND_STRENGTH,
+            seed=SEED)
+    elif name == "bands":
+        server.band_engine = BandFireEngine(
+            server.FUEL_PROPERTIES, server.WIND, server.WIND_STRENGTH,
+            workers, server.rng)
+
+
+def run_scenario(build, steps):
+    server.rng.seed(SEED)
+    build()
+    grid = server.grid
+    for x, y in fire_parity.ignition_cells(grid.snapshot()):
+        server.place_stamp(x, y, "ignite")
+    server.running_sim = True
+
+    stats = {name: metrics.Stat() for name in
+             ("update_fire", "capture", "diff", "json_dumps", "encode_bin",
+              "keyframe_json")}
+    publisher = state_sync.StatePublisher()
+    clock = time.perf_counter
+    bytes_json = bytes_bin = 0
+    for step in range(steps):
+        t0 = clock()
+        server.update_fire()
+        t1 = clock()
+        frame = server.capture_state()
+        t2 = clock()
+        update = publisher.publish(frame, step)
+        t3 = clock()
+        bytes_json += len(update.payload(wire_format.WIRE_JSON))
+        t4 = clock()
+        bytes_bin += len(update.payload(wire_format.WIRE_BIN))
+        t5 = clock()
+        stats["update_fire"].add(t1 - t0)
+        stats["capture"].add(t2 - t1)
+        stats["diff"].add(t3 - t2)
+        stats["json_dumps"].add(t4 - t3)
+        stats["encode_bin"].add(t5 - t4)
+    # What every joining client costs with the JSON protocol
+    for _ in range(3):
+        t0 = clock()
+        json.dumps(publisher.keyframe().to_json())
+        stats["keyframe_json"].add(clock() - t0)
+
+    return {
+        "cols": grid.cols,
+        "rows": grid.rows,
+        "steps": steps,
+        "burning_end": sum(1 for v in grid.intensity if v > 8),
+        "bytes_json": bytes_json,
+        "bytes_bin": bytes_bin,
+        "ms": {name: s.summary(1000.0) for name, s in stats.items()},
+    }
+
+
+def compare(results, baseline, max_slowdown):
+    # Median timings against an earlier results file; True when none regressed
+    ok = True
+    for name, scenario in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        for key, summary in scenario["ms"].items():
+            before = old["ms"].get(key, {}).get("p50")
+            after = summary.get("p50")
+            if not before or after is None:
+                continue
+            ratio = after / before
+            slow = ratio > max_slowdown
+            ok = ok and not slow
+            print("  {:<24} {:<14} {:>8.3f} -> {:>8.3f} ms x{:.2f}{}".format(
+                name, key, before, after, ratio, "  SLOWER" if slow else ""))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the fire step and state encoding without sockets")
+    parser.add_argument("--steps", type=int, default=40)
+    parser.add_argument("--sizes", default=SIZES,
+                        help="synthetic map sizes, e.g. 120x90,240x180")
+    parser.add_argument("--engine", default="python",
+                        choices=("python", "numpy", "bands"))
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--out", default=RESULTS)
+    parser.add_argument("--baseline", default=None,
+                        help="earlier results file to compare against")
+    parser.add_argument("--max-slowdown", type=float, default=1.25)
+    args = parser.parse_args()
+
+    if args.engine == "numpy" and not fire_numpy.available():
+        print("numpy is not installed")
+        return 2
+    select_engine(args.engine, args.workers)
+
+    scenarios = [(os.path.basename(path),
+                  lambda path=path: load_bundled(path)) for path in MAPS]
+    for size in filter(None, args.sizes.split(",")):
+        cols, rows = (int(v) for v in size.lower().split("x"))
+        scenarios.append(("synthetic_" + size,
+                          lambda c=cols, r=rows: build_synthetic(c, r)))
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "engine": server.engine_name(),
+        "seed": SEED,
+        "scenarios": {},
+    }
+    for name, build in scenarios:
+        result = run_scenario(build, args.steps)
+        results["scenarios"][name] = result
+        ms = result["ms"]
+        print("{:<24} {:>4}x{:<4} fire p50={:>8.3f} capture={:.3f} "
+              "json={:.3f} bin={:.3f} keyframe_json={:.3f} ms".format(
+                  name, result["cols"], result["rows"],
+                  ms["update_fire"]["p50"], ms["capture"]["p50"],
+                  ms["json_dumps"]["p50"], ms["encode_bin"]["p50"],
+                  ms["keyframe_json"]["p50"]))
+    if server.band_engine is not None:
+        server.band_engine.close()
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print("Results written to {}".format(args.out))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_slowdown):
+            print("REGRESSION")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
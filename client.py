@@ -17,6 +17,11 @@ import pygame
 import tkinter as tk
 from tkinter import filedialog
 
+import client_state
+import textures
+import wire_format
+from grid_renderer import EXPOSE_EVENTS, GridRenderer
+
 if sys.platform == "win32" and sys.stdout.encoding.lower() != 'utf-8':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
@@ -79,9 +84,6 @@ tiny_font = get_ui_font(13)
 
 SWITCH_TO_SANDBOX_EVENT = pygame.USEREVENT + 1
 
-TEXTURE_DIR = os.path.join(BASE_DIR, "textures")
-TEXTURES = {}
-fire_texture = None
 
 # Fallback цвета для клеток без текстур
 CELL_COLORS = {
@@ -99,84 +101,9 @@ CELL_COLORS = {
 }
 
 
-def load_textures():
-    global TEXTURES, fire_texture
-    os.makedirs(TEXTURE_DIR, exist_ok=True)
-    TEXTURES = {}
-
-    try:
-        fire_texture = pygame.image.load(
-            os.path.join(BASE_DIR, "fire.png")).convert_alpha()
-    except Exception:
-        fire_texture = pygame.Surface((CELL, CELL), pygame.SRCALPHA)
-        fire_texture.fill((255, 100, 0, 180))
-
-    for filename in os.listdir(TEXTURE_DIR):
-        if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            continue
-        key = os.path.splitext(filename)[0].lower()
-        path = os.path.join(TEXTURE_DIR, filename)
-        try:
-            img = pygame.image.load(path).convert_alpha()
-            if key == "firecar":
-                TEXTURES["firecar"] = pygame.transform.scale(img, (64, 128))
-            elif key in ("road", "road_straight"):
-                TEXTURES["road"] = pygame.transform.scale(
-                    img, (CELL * 4, CELL * 4))
-            elif key in ("road_right", "road_turn"):
-                TEXTURES["road_right"] = pygame.transform.scale(
-                    img, (CELL * 5, CELL * 5))
-            elif key == "wood":
-                # wood.png используется для wall и wood_floor
-                TEXTURES["wood"] = pygame.transform.scale(img, (CELL, CELL))
-                TEXTURES["wall"] = pygame.transform.scale(img, (CELL, CELL))
-                TEXTURES["wood_floor"] = pygame.transform.scale(
-                    img, (CELL, CELL))
-            else:
-                TEXTURES[key] = pygame.transform.scale(img, (CELL, CELL))
-        except Exception as e:
-            print("Error loading {}: {}".format(filename, e))
-
-    # Если нет текстуры trunk/foliage — создаём цветные заглушки
-    if "trunk" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["trunk"])
-        TEXTURES["trunk"] = s
-    if "foliage" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["foliage"])
-        TEXTURES["foliage"] = s
-    if "grass" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["grass"])
-        TEXTURES["grass"] = s
-    if "water" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["water"])
-        TEXTURES["water"] = s
-    if "hydrant" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["hydrant"])
-        TEXTURES["hydrant"] = s
-    if "stone" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["stone"])
-        TEXTURES["stone"] = s
-    if "concrete" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["concrete"])
-        TEXTURES["concrete"] = s
-    if "floor" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["floor"])
-        TEXTURES["floor"] = s
-    if "wall" not in TEXTURES:
-        s = pygame.Surface((CELL, CELL))
-        s.fill(CELL_COLORS["wall"])
-        TEXTURES["wall"] = s
-
-
-load_textures()
+# Все размеры текстур готовятся один раз, при отрисовке только blit
+atlas = textures.load(CELL, CELL_COLORS)
+TEXTURES = atlas.textures
 
 TOOLS = [
     "grass", "tree", "lake", "house", "wall", "floor", "wood_floor",
@@ -245,7 +172,8 @@ try:
     auth_data = {
         'type': 'AUTH',
         'password': SERVER_PASSWORD,
-        'role': PLAYER_ROLE
+        'role': PLAYER_ROLE,
+        'wire': [wire_format.WIRE_BIN]
     }
     msg = json.dumps(auth_data).encode('utf-8')
     client.sendall(struct.pack('>I', len(msg)) + msg)
@@ -272,13 +200,16 @@ def send_to_server(data):
         pass
 
 
-server_grid = [[[0, 0, "empty"] for _ in range(COLS)] for _ in range(ROWS)]
+# Поток сети публикует готовые кадры, цикл забирает последний в take_state
+net_state = client_state.ClientState(COLS, ROWS)
+state_version = None
+server_grid = net_state.current().grid
+grid_cells = None  # изменившиеся с прошлого кадра клетки; None — неизвестно
 edit_mode = True
 running_sim = False
 
 
 def receive_thread():
-    global server_grid, edit_mode, running_sim
     while True:
         try:
             raw = recv_exact(client, 4)
@@ -288,13 +219,12 @@ def receive_thread():
             data = recv_exact(client, msglen)
             if not data:
                 break
-            state = json.loads(data.decode('utf-8'))
+            state = wire_format.decode(data, net_state.type_names)
             msg_type = state.get('type', '')
 
-            if msg_type == 'STATE_UPDATE':
-                server_grid = state['grid']
-                edit_mode = state['edit_mode']
-                running_sim = state['running_sim']
+            if msg_type in ('STATE_UPDATE', 'STATE_DELTA'):
+                if not net_state.apply(state):
+                    send_to_server({'type': 'RESYNC'})
             elif msg_type == 'START_GAME':
                 print("[CLIENT] START_GAME received")
                 pygame.event.post(
@@ -319,6 +249,7 @@ def save_map():
             initialdir=MAPS_DIR)
         root.destroy()
         if filepath:
+            # Сетка пришла по bin1: топливо в ней округлено вверх до целого
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(
                     {"cols": COLS, "rows": ROWS, "grid": server_grid},
@@ -347,67 +278,96 @@ def load_map():
         print("Load error: {}".format(e))
 
 
-def draw_textured_cell(surface, rect, fuel, intensity, ctype, gx, gy):
-    x, y = rect.x, rect.y
+def textured_cell_look(fuel, intensity, ctype):
+    # Поверхности клетки по порядку от её левого верхнего угла;
+    # None для горящей клетки: её рисует fire_look каждый кадр
 
     # Многоклеточные объекты
     if ctype == "firecar_root":
         if "firecar" in TEXTURES:
-            surface.blit(TEXTURES["firecar"], (x, y))
-        else:
-            pygame.draw.rect(surface, (200, 30, 30), (x, y, 64, 128))
-        return
+            return (TEXTURES["firecar"],)
+        return (atlas.solid((200, 30, 30), (64, 128)),)
     elif ctype == "firecar_part":
-        return
+        return ()
 
     if ctype == "road_straight_root":
         if "road" in TEXTURES:
-            surface.blit(TEXTURES["road"], (x, y))
-        else:
-            pygame.draw.rect(surface, (60, 60, 65),
-                             (x, y, CELL * 4, CELL * 4))
-        return
+            return (TEXTURES["road"],)
+        return (atlas.solid((60, 60, 65), (CELL * 4, CELL * 4)),)
     elif ctype == "road_straight_part":
-        return
+        return ()
 
     if ctype == "road_turn_root":
         if "road_right" in TEXTURES:
-            surface.blit(TEXTURES["road_right"], (x, y))
-        else:
-            pygame.draw.rect(surface, (60, 60, 65),
-                             (x, y, CELL * 5, CELL * 5))
-        return
+            return (TEXTURES["road_right"],)
+        return (atlas.solid((60, 60, 65), (CELL * 5, CELL * 5)),)
     elif ctype == "road_turn_part":
-        return
+        return ()
 
     # Огонь
     if intensity > 8:
-        scaled = pygame.transform.scale(fire_texture, (CELL, CELL))
-        ox = random.randint(-3, 3)
-        oy = -random.randint(0, 5) - int(intensity // 10)
-        surface.blit(scaled, (x + ox, y + oy))
-        return
+        return None
 
     # Обычные клетки — ищем текстуру
     texture_key = ctype.replace("_root", "")
-    if texture_key.endswith("_part"):
-        return
+    if texture_key.endswith("_part") or texture_key == "empty":
+        return ()
 
     if texture_key in TEXTURES:
-        surface.blit(TEXTURES[texture_key], rect)
-    else:
-        # Fallback цвет
-        color = CELL_COLORS.get(texture_key, (30, 25, 20))
-        if texture_key != "empty":
-            pygame.draw.rect(surface, color, rect)
+        return (TEXTURES[texture_key],)
+    # Fallback цвет
+    return (atlas.solid(CELL_COLORS.get(texture_key, (30, 25, 20))),)
+
+
+def fire_look(intensity):
+    ox = random.randint(-3, 3)
+    oy = -random.randint(0, 5) - int(intensity // 10)
+    return atlas.fire_frame(), (ox, oy)
+
+
+renderer = GridRenderer(screen, COLS, ROWS, CELL, (12, 22, 45),
+                        textured_cell_look, fire_look)
+mark = renderer.mark
+PANEL_RECT = pygame.Rect(GRID_WIDTH, 0, PANEL_WIDTH, HEIGHT)
+
+
+def take_state():
+    # Кадр рисуется по одному согласованному состоянию сервера
+    global state_version, server_grid, grid_cells, edit_mode, running_sim
+    frame = net_state.current()
+    if frame.version == state_version:
+        grid_cells = ()
+        return
+    grid_cells = net_state.changes(state_version, frame)
+    state_version = frame.version
+    server_grid = frame.grid
+    edit_mode = frame.fields.get('edit_mode', True)
+    running_sim = frame.fields.get('running_sim', False)
 
 
 def draw_grid():
-    for y in range(ROWS):
-        for x in range(COLS):
-            fuel, intensity, ctype = server_grid[y][x]
-            rect = pygame.Rect(x * CELL, y * CELL, CELL, CELL)
-            draw_textured_cell(screen, rect, fuel, intensity, ctype, x, y)
+    # Перерисовываются только изменившиеся и горящие клетки
+    renderer.draw(server_grid, cells=grid_cells)
+
+
+stamp_previews = {}
+
+
+def stamp_preview(tool, fits):
+    # Подложка превью штампа, создаётся один раз на инструмент
+    preview = stamp_previews.get((tool, fits))
+    if preview is None:
+        w, h = MULTI_CELL_SIZES[tool]
+        preview = pygame.Surface((w * CELL, h * CELL), pygame.SRCALPHA)
+        if fits:
+            preview.fill((100, 255, 100, 45))
+            if tool in atlas.ghosts:
+                preview.blit(atlas.ghosts[tool], (0, 0))
+        else:
+            preview.fill((255, 80, 80, 50))
+        preview = preview.convert_alpha()
+        stamp_previews[(tool, fits)] = preview
+    return preview
 
 
 def draw_multi_cell_preview():
@@ -422,21 +382,11 @@ def draw_multi_cell_preview():
     fits = (0 <= gx <= COLS - w) and (0 <= gy <= ROWS - h)
     pw = w * CELL
     ph = h * CELL
-    preview = pygame.Surface((pw, ph), pygame.SRCALPHA)
-    if fits:
-        preview.fill((100, 255, 100, 45))
-        border_color = (80, 255, 80)
-        tkey = current_tool
-        if tkey in TEXTURES:
-            ghost = TEXTURES[tkey].copy()
-            ghost.set_alpha(120)
-            preview.blit(ghost, (0, 0))
-    else:
-        preview.fill((255, 80, 80, 50))
-        border_color = (255, 60, 60)
-    screen.blit(preview, (gx * CELL, gy * CELL))
-    pygame.draw.rect(screen, border_color,
-                     (gx * CELL, gy * CELL, pw, ph), 2)
+    preview = stamp_preview(current_tool, fits)
+    border_color = (80, 255, 80) if fits else (255, 60, 60)
+    mark(screen.blit(preview, (gx * CELL, gy * CELL)))
+    mark(pygame.draw.rect(screen, border_color,
+                          (gx * CELL, gy * CELL, pw, ph), 2))
 
 
 def draw_ui():
@@ -526,10 +476,8 @@ def draw_ui():
                     # Мини-превью цвета/текстуры
                     preview_rect = pygame.Rect(
                         item_rect.x + 4, item_rect.y + 4, 20, 20)
-                    if item in TEXTURES:
-                        mini = pygame.transform.scale(
-                            TEXTURES[item], (20, 20))
-                        screen.blit(mini, preview_rect)
+                    if item in atlas.thumbs:
+                        screen.blit(atlas.thumbs[item], preview_rect)
                     elif item in CELL_COLORS:
                         pygame.draw.rect(
                             screen, CELL_COLORS[item], preview_rect,
@@ -615,10 +563,14 @@ running = True
 should_switch = False
 
 while running:
+    take_state()
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
 
+        if event.type in EXPOSE_EVENTS:
+            renderer.invalidate()
+
         if event.type == SWITCH_TO_SANDBOX_EVENT:
             should_switch = True
             running = False
@@ -693,10 +645,9 @@ while running:
                     send_to_server({'type': 'R'})
                 if (last_finish_rect
                         and last_finish_rect.collidepoint(event.pos)):
-                    send_to_server({
-                        'type': 'HOST_READY',
-                        'final_grid': server_grid
-                    })
+                    # Сервер стартует со своей сетки: присланная по bin1
+                    # хранит топливо, округлённое вверх
+                    send_to_server({'type': 'HOST_READY'})
 
     if not running:
         break
@@ -714,11 +665,10 @@ while running:
                     'tool': current_tool
                 })
 
-    screen.fill((12, 22, 45))
     draw_grid()
     draw_multi_cell_preview()
     draw_ui()
-    pygame.display.flip()
+    renderer.present([PANEL_RECT])
     clock.tick(FPS)
 
 # После выхода из цикла
@@ -0,0 +1,143 @@
+import json
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+OUTBOX_LIMIT = 256
+# Merges of a waiting state update in a row before a keyframe is sent
+# instead
+COALESCE_KEYFRAME = 8
+
+
+def frame(payload):
+    return struct.pack(">I", len(payload)) + payload
+
+
+def encode_msg(data):
+    return frame(json.dumps(data).encode("utf-8"))
+
+
+class ClientConn:
+    # A connected client with a bounded outbound queue drained by its own
+    # writer thread, so a slow socket only ever delays this client.
+
+    def __init__(self, sock, addr, role, wire, limit=OUTBOX_LIMIT):
+        self.sock = sock
+        self.addr = addr
+        self.role = role
+        self.wire = wire
+        self.limit = limit
+        self.outbox = deque()
+        self.pending_state = None
+        self.pending_update = None
+        self.cond = threading.Condition()
+        self.closed = False
+        self.close_reason = ""
+        self.behind_since = None
+        self.bytes_sent = 0
+        self.coalesced = 0
+        self.coalesce_run = 0   # merges since the outbox was last empty
+        self.wants_stats = False
+        self.writer = None
+
+    def start(self):
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def send(self, packet):
+        with self.cond:
+            return self.enqueue(packet, False)
+
+    def send_msg(self, data):
+        return self.send(encode_msg(data))
+
+    def send_state(self, update, latest_keyframe=None):
+        # update: a state_sync.StateUpdate. One still waiting in the queue
+        # is merged with it into a single delta from the base the client
+        # has; latest_keyframe() is sent instead when they cannot be merged
+        # or after COALESCE_KEYFRAME merges in a row.
+        with self.cond:
+            pending = self.pending_state
+            if pending is not None and latest_keyframe is not None:
+                for i, item in enumerate(self.outbox):
+                    if item is pending:
+                        del self.outbox[i]
+                        break
+                self.coalesced += 1
+                self.coalesce_run += 1
+                if self.behind_since is None:
+                    self.behind_since = time.monotonic()
+                merged = self.pending_update.merge(update)
+                if merged is None or self.coalesce_run >= COALESCE_KEYFRAME:
+                    merged = latest_keyframe()
+                update = merged
+            return self.enqueue(update.packet(self.wire), True, update)
+
+    def enqueue(self, packet, is_state, update=None):
+        if self.closed:
+            return False
+        if len(self.outbox) >= self.limit:
+            self.close_locked("outbox full")
+            return False
+        item = (is_state, packet)
+        self.outbox.append(item)
+        if is_state:
+            self.pending_state = item
+            self.pending_update = update
+        self.cond.notify()
+        return True
+
+    def taken(self, item):
+        # Call with cond held once item left the outbox
+        if item is self.pending_state:
+            self.pending_state = None
+            self.pending_update = None
+
+    def lagging(self, now, timeout):
+        behind = self.behind_since
+        return behind is not None and now - behind > timeout
+
+    def queued(self):
+        return len(self.outbox)
+
+    def write_loop(self):
+        while True:
+            with self.cond:
+                while not self.outbox and not self.closed:
+                    self.behind_since = None
+                    self.coalesce_run = 0
+                    self.cond.wait()
+                if self.closed:
+                    return
+                item = self.outbox.popleft()
+                self.taken(item)
+            try:
+                self.sock.sendall(item[1])
+            except OSError:
+                self.close("send failed")
+                return
+            self.bytes_sent += len(item[1])
+
+    def close(self, reason=""):
+        with self.cond:
+            self.close_locked(reason)
+
+    def close_locked(self, reason):
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        self.outbox.clear()
+        self.pending_state = None
+        self.pending_update = None
+        self.cond.notify_all()
+        self.abort()
+
+    def abort(self):
+        # Wakes the reader thread too; it owns closing the socket
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
@@ -0,0 +1,225 @@
+import threading
+
+from state_sync import StateMirror
+
+# Change sets kept for ClientState.changes; a render loop further behind
+# than this rescans the whole grid
+HISTORY = 16
+# Multi-cell objects: "<kind>_root" at the top left, "<kind>_part" for the
+# rest of a w x h block, as the server places them
+STAMP_SIZES = {
+    "firecar": (4, 8),
+    "road_straight": (4, 4),
+    "road_turn": (5, 5),
+}
+ROOT_TYPES = {kind + "_root": kind for kind in STAMP_SIZES}
+PART_TYPES = {kind + "_part": kind for kind in STAMP_SIZES}
+
+
+class ClientFrame:
+    # One published server state. Never modified after publishing, so the
+    # render loop can read it for a whole frame without locking.
+    __slots__ = ("version", "grid", "fields", "changed", "fire_changes",
+                 "objects", "burning", "hoses", "hoses_version")
+
+
+class ObjectIndex:
+    # Multi-cell objects on the grid. roots: (x, y) of a root -> kind;
+    # covers: (x, y) of every cell an object takes up -> its root. Copied
+    # on change, so a published index is never modified.
+
+    def __init__(self):
+        self.roots = {}
+        self.covers = {}
+
+    def object_at(self, x, y):
+        # (root, kind) of the object covering cell x, y, or None
+        root = self.covers.get((x, y))
+        if root is None:
+            return None
+        return root, self.roots[root]
+
+    def of_kind(self, kind):
+        # Roots of the objects of kind, in grid order
+        return sorted((r for r, k in self.roots.items() if k == kind),
+                      key=lambda r: (r[1], r[0]))
+
+    def updated(self, grid, cells):
+        # Index for grid after cells changed (None: built from scratch);
+        # self when no object was touched
+        if cells is None:
+            index = ObjectIndex()
+            for y, row in enumerate(grid):
+                for x, c in enumerate(row):
+                    if c[2] in ROOT_TYPES:
+                        index.add(grid, (x, y), ROOT_TYPES[c[2]])
+            return index
+
+        affected = set()
+        parts = []
+        for x, y in cells:
+            root = self.covers.get((x, y))
+            if root is not None:
+                affected.add(root)
+            ctype = grid[y][x][2]
+            if ctype in ROOT_TYPES:
+                affected.add((x, y))
+            elif ctype in PART_TYPES:
+                parts.append((x, y))
+        if not affected and not parts:
+            return self
+
+        index = ObjectIndex()
+        index.roots = dict(self.roots)
+        index.covers = dict(self.covers)
+        for root in affected:
+            parts.extend(index.remove(root))
+        for x, y in affected:
+            ctype = grid[y][x][2]
+            if ctype in ROOT_TYPES:
+                index.add(grid, (x, y), ROOT_TYPES[ctype])
+        # Parts left without an object may still lie under another one
+        for x, y in parts:
+            kind = PART_TYPES.get(grid[y][x][2])
+            if kind is not None and (x, y) not in index.covers:
+                root = index.find_root(x, y, kind)
+                if root is not None:
+                    index.covers[(x, y)] = root
+        return index
+
+    def find_root(self, x, y, kind):
+        # An object of kind whose block contains cell x, y
+        w, h = STAMP_SIZES[kind]
+        for (rx, ry), k in self.roots.items():
+            if k == kind and rx <= x < rx + w and ry <= y < ry + h:
+                return (rx, ry)
+        return None
+
+    def add(self, grid, root, kind):
+        rx, ry = root
+        w, h = STAMP_SIZES[kind]
+        part = kind + "_part"
+        self.roots[root] = kind
+        self.covers[root] = root
+        for y in range(ry, min(ry + h, len(grid))):
+            row = grid[y]
+            for x in range(rx, min(rx + w, len(row))):
+                if row[x][2] == part:
+                    self.covers[(x, y)] = root
+
+    def remove(self, root):
+        # Drops an object; returns the cells it covered
+        kind = self.roots.pop(root, None)
+        if kind is None:
+            return []
+        rx, ry = root
+        w, h = STAMP_SIZES[kind]
+        freed = []
+        for y in range(ry, ry + h):
+            for x in range(rx, rx + w):
+                if self.covers.get((x, y)) == root:
+                    del self.covers[(x, y)]
+                    freed.append((x, y))
+        return freed
+
+
+class ClientState:
+    # Client-side state store. The network thread applies keyframes and
+    # deltas to a back buffer, works out the derived indexes there and
+    # publishes the result as a new ClientFrame; the render loop takes the
+    # latest one with current().
+
+    def __init__(self, cols, rows):
+        self.mirror = StateMirror(cols, rows)
+        self.lock = threading.Lock()
+        self.history = {}   # version -> set of (x, y) changed, None: all
+        self.front = None
+        self.objects = ObjectIndex()
+        self.burning = set()
+        self.hoses = {}
+        self.hoses_version = 0
+        self.publish(self.mirror.grid, None, None)
+
+    @property
+    def type_names(self):
+        # For wire_format.decode, called on the network thread
+        return self.mirror.type_names
+
+    def current(self):
+        return self.front
+
+    def reset(self, grid):
+        # Replaces the grid with a local one, e.g. a map loaded from a file
+        # before the first keyframe
+        self.mirror.grid = grid
+        self.publish(grid, None, None)
+
+    def apply(self, msg):
+        # Returns False when the caller should send {"type": "RESYNC"}
+        mirror = self.mirror
+        seq = mirror.seq
+        if msg.get("type") == "STATE_DELTA":
+            # Deltas go to a copy: the published grid may be being drawn
+            mirror.grid = [row[:] for row in self.front.grid]
+        if not mirror.apply(msg):
+            mirror.grid = self.front.grid
+            return False
+        if mirror.seq == seq and msg.get("type") == "STATE_DELTA":
+            # Stale or waiting for a keyframe, nothing applied
+            mirror.grid = self.front.grid
+            return True
+        if "supply_hoses" in msg:
+            self.hoses = {(item[0], item[1]): (item[2], item[3])
+                          for item in msg["supply_hoses"]}
+            self.hoses_version += 1
+        if mirror.changed is None:
+            self.publish(mirror.grid, None, None)
+        else:
+            cells = set((x, y) for x, y, _, _ in mirror.changed)
+            self.publish(mirror.grid, cells, mirror.changed)
+        return True
+
+    def index(self, grid, cells):
+        # Keeps the object index and burning cell set up to date for the
+        # cells that changed, or for the whole grid when cells is None
+        self.objects = self.objects.updated(grid, cells)
+        if cells is None:
+            self.burning = set()
+            cells = ((x, y) for y in range(len(grid))
+                     for x in range(len(grid[y])))
+        for x, y in cells:
+            if grid[y][x][1] > 0:
+                self.burning.add((x, y))
+            else:
+                self.burning.discard((x, y))
+
+    def publish(self, grid, cells, fire_changes):
+        self.index(grid, cells)
+        frame = ClientFrame()
+        frame.grid = grid
+        frame.fields = dict(self.mirror.fields)
+        frame.changed = cells
+        frame.fire_changes = fire_changes
+        frame.objects = self.objects
+        frame.burning = tuple(self.burning)
+        frame.hoses = self.hoses
+        frame.hoses_version = self.hoses_version
+        with self.lock:
+            frame.version = self.front.version + 1 if self.front else 1
+            self.history[frame.version] = cells
+            self.history.pop(frame.version - HISTORY, None)
+            self.front = frame
+
+    def changes(self, since, frame):
+        # The (x, y) cells that may differ between the frame of version
+        # since and frame, or None when that is not known
+        if since is None:
+            return None
+        found = set()
+        with self.lock:
+            for version in range(since + 1, frame.version + 1):
+                cells = self.history.get(version)
+                if cells is None:
+                    return None
+                found |= cells
+        return found
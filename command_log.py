@@ -0,0 +1,64 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+# One JSON object per line. The first line is the session header (seed and
+# settings), then entries in the order they were applied:
+#   {"tick": 120, "client": "('127.0.0.1', 5123)", "role": "rtp", "cmd": {...}}
+#   {"tick": 131, "client": "...", "leave": true}
+#   {"tick": 180, "digest": 2893412211}
+# Commands are logged with the tick they were applied before; digests are
+# taken right after the fire step of their tick.
+
+
+def grid_digest(grid):
+    crc = 0
+    for column in (grid.fuel, grid.intensity, grid.heat, grid.moisture,
+                   grid.state, grid.type):
+        crc = zlib.crc32(memoryview(column).cast("B"), crc)
+    return crc
+
+
+class CommandLog:
+    def __init__(self, path, header):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+        self.write(dict(header, type="SESSION", started=time.time()))
+
+    @classmethod
+    def in_dir(cls, directory, header):
+        os.makedirs(directory, exist_ok=True)
+        name = "session-{}.jsonl".format(time.strftime("%Y%m%d-%H%M%S"))
+        return cls(os.path.join(directory, name), header)
+
+    def write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def command(self, tick, client, cmd):
+        self.write({"tick": tick, "client": str(client.addr),
+                    "role": client.role, "cmd": cmd})
+
+    def leave(self, tick, addr):
+        self.write({"tick": tick, "client": str(addr), "leave": True})
+
+    def digest(self, tick, grid):
+        self.write({"tick": tick, "digest": grid_digest(grid)})
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_log(path):
+    # Returns (header, entries)
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("type") != "SESSION":
+        raise ValueError("{} is not a session log".format(path))
+    return lines[0], lines[1:]
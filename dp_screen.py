@@ -7,6 +7,13 @@ import threading
 import random
 import pygame
 
+import client_state
+import interp
+import textures
+import wire_format
+from client_state import PART_TYPES, ROOT_TYPES
+from grid_renderer import EXPOSE_EVENTS, GridRenderer
+
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -63,8 +70,6 @@ small_font = get_ui_font(16)
 tiny_font = get_ui_font(14)
 
 # ================= ТЕКСТУРЫ И КАРТА (без изменений) =================
-TEXTURES = {}
-fire_texture = None
 server_grid = [[[0, 0, "empty"] for _ in range(COLS)] for _ in range(ROWS)]
 running_sim = False
 # ================= PYGAME INIT =================
@@ -78,38 +83,17 @@ font_bold = get_ui_font(20, True)
 font_huge = get_ui_font(36, True)
 small_font = get_ui_font(14)
 
-# ================= ТЕКСТУРЫ =================
-TEXTURES = {}
-fire_texture = None
-
-def load_textures():
-    global TEXTURES, fire_texture
-    try:
-        fire_texture = pygame.image.load(os.path.join(BASE_DIR, "fire.png")).convert_alpha()
-    except:
-        fire_texture = pygame.Surface((CELL, CELL), pygame.SRCALPHA)
-        fire_texture.fill((255, 100, 0, 180))
-    
-    tex_dir = os.path.join(BASE_DIR, "textures")
-    if os.path.exists(tex_dir):
-        for f in os.listdir(tex_dir):
-            if f.lower().endswith((".png", ".jpg", ".jpeg")):
-                key = os.path.splitext(f)[0].lower()
-                try:
-                    img = pygame.image.load(os.path.join(tex_dir, f)).convert_alpha()
-                    if key == "firecar":
-                        TEXTURES[key] = pygame.transform.scale(img, (64, 128))
-                    elif "road" in key:
-                        TEXTURES[key] = pygame.transform.scale(img, (CELL*4, CELL*4))
-                    else:
-                        TEXTURES[key] = pygame.transform.scale(img, (CELL, CELL))
-                except:
-                    pass
-
 # ================= СЕТЬ И КАРТА =================
 # Создаём сетку ПЕРЕД загрузкой карты
-server_grid = [[[0, 0, "empty"] for _ in range(COLS)] for _ in range(ROWS)]
+# Поток сети публикует готовые кадры, цикл забирает последний в take_state
+net_state = client_state.ClientState(COLS, ROWS)
+state_version = None
+server_grid = net_state.current().grid
+grid_cells = None   # изменившиеся с прошлого кадра клетки; None — неизвестно
 running_sim = False
+# Рисуем пожарных и огонь между двумя последними снимками сервера
+view = interp.Interpolator()
+firefighters = []
 
 # Загружаем карту, которую передал waiting_screen.py
 grid_file = os.getenv("GRID_FILE")
@@ -117,16 +101,19 @@ if grid_file and os.path.exists(grid_file):
     try:
         with open(grid_file, "r", encoding="utf-8") as f:
             loaded = json.load(f)
+        grid = [row[:] for row in server_grid]
         for y in range(min(ROWS, len(loaded))):
             for x in range(min(COLS, len(loaded[y]))):
                 if len(loaded[y][x]) >= 3:
-                    server_grid[y][x] = loaded[y][x][:]   # копия списка
+                    grid[y][x] = loaded[y][x][:]   # копия списка
+        net_state.reset(grid)
         print(f"[DP] Карта успешно загружена из {grid_file} ({len(loaded)}x{len(loaded[0])})")
     except Exception as e:
         print(f"[DP] Ошибка загрузки карты: {e}")
 
-# Загружаем текстуры (теперь безопасно)
-load_textures()
+# Загружаем текстуры (теперь безопасно): все размеры готовятся один раз
+atlas = textures.load(CELL)
+TEXTURES = atlas.textures
 
 # ================= СЕТЬ =================
 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -134,7 +121,8 @@ connected = False
 
 try:
     sock.connect((SERVER_IP, SERVER_PORT))
-    auth = {"type": "AUTH", "password": SERVER_PASSWORD, "role": PLAYER_ROLE}
+    auth = {"type": "AUTH", "password": SERVER_PASSWORD, "role": PLAYER_ROLE,
+            "wire": [wire_format.WIRE_BIN]}
     msg = json.dumps(auth).encode("utf-8")
     sock.sendall(struct.pack(">I", len(msg)) + msg)
     connected = True
@@ -143,16 +131,22 @@ except Exception as e:
     print(f"[DP] Ошибка подключения: {e}")
 
 def receive_thread():
-    global server_grid, running_sim
     while True:
         try:
             raw = recv_exact(sock, 4)
             if not raw: break
             mlen = struct.unpack(">I", raw)[0]
-            data = json.loads(recv_exact(sock, mlen).decode("utf-8"))
-            if data.get("type") == "STATE_UPDATE":
-                server_grid = data["grid"]
-                running_sim = data.get("running_sim", False)
+            data = wire_format.decode(recv_exact(sock, mlen),
+                                      net_state.type_names)
+            if data.get("type") in ("STATE_UPDATE", "STATE_DELTA"):
+                if not net_state.apply(data):
+                    msg = json.dumps({"type": "RESYNC"}).encode("utf-8")
+                    sock.sendall(struct.pack(">I", len(msg)) + msg)
+                    continue
+                frame = net_state.current()
+                view.push({(f.get("owner"), f.get("id")): (f["x"], f["y"])
+                           for f in frame.fields.get("firefighters", [])},
+                          frame.fire_changes)
         except:
             break
 
@@ -160,26 +154,52 @@ if connected:
     threading.Thread(target=receive_thread, daemon=True).start()
 
 # ================= ОТРИСОВКА (без изменений) =================
+def cell_look(fuel, intensity, ctype):
+    # Поверхности клетки по порядку; None — горящая, её рисует fire_look
+    if intensity > 8:
+        return None
+
+    t_key = ROOT_TYPES.get(ctype) or PART_TYPES.get(ctype) or ctype
+    if t_key in TEXTURES:
+        if ctype in PART_TYPES:
+            return ()
+        return (TEXTURES[t_key],)
+    if ctype != "empty":
+        return (atlas.solid((40, 40, 45)),)
+    return ()
+
+def fire_look(intensity):
+    return atlas.fire_frame(), (random.randint(-2,2), -random.randint(2,5))
+
+# Кэш отрисованной карты: каждый кадр перерисовываются только изменившиеся
+# и горящие клетки, одним вызовом Surface.blits
+renderer = GridRenderer(screen, COLS, ROWS, CELL, (5, 10, 20), cell_look, fire_look)
+PANEL_RECT = pygame.Rect(GRID_WIDTH, 0, PANEL_WIDTH, HEIGHT)
+
+def take_state():
+    # Кадр рисуется по одному согласованному состоянию сервера
+    global state_version, server_grid, grid_cells, running_sim, firefighters
+    frame = net_state.current()
+    if frame.version == state_version:
+        grid_cells = ()
+        return
+    grid_cells = net_state.changes(state_version, frame)
+    state_version = frame.version
+    server_grid = frame.grid
+    running_sim = frame.fields.get("running_sim", False)
+    firefighters = frame.fields.get("firefighters", [])
+
 def draw_grid():
-    for y in range(ROWS):
-        for x in range(COLS):
-            fuel, intensity, ctype = server_grid[y][x]
-            rect = pygame.Rect(x * CELL, y * CELL, CELL, CELL)
-            
-            if intensity > 8:
-                scaled = pygame.transform.scale(fire_texture, (CELL, CELL))
-                screen.blit(scaled, (rect.x + random.randint(-2,2), rect.y - random.randint(2,5)))
-                continue
-
-            t_key = ctype.replace("_root", "").replace("_part", "")
-            if t_key in TEXTURES:
-                if ("road" in ctype or "firecar" in ctype) and "_root" in ctype:
-                    screen.blit(TEXTURES[t_key], rect)
-                else:
-                    screen.blit(TEXTURES[t_key], rect)
-            else:
-                if ctype != "empty":
-                    pygame.draw.rect(screen, (40, 40, 45), rect)
+    renderer.draw(server_grid, view.fire_intensity(), grid_cells)
+
+def draw_firefighters():
+    positions = view.unit_positions()
+    for f in firefighters:
+        fx, fy = positions.get((f.get("owner"), f.get("id")),
+                               (f.get("x", 0), f.get("y", 0)))
+        center = (int(fx * CELL + CELL / 2), int(fy * CELL + CELL / 2))
+        renderer.mark(pygame.draw.circle(screen, (255, 220, 0), center, 6))
+        renderer.mark(pygame.draw.circle(screen, (20, 20, 20), center, 6, 1))
 
 last_truck_buttons = []   # для кликов
 
@@ -224,10 +244,14 @@ def draw_dispatcher_panel():
 # ================= ЦИКЛ (добавляем обработку кнопок) =================
 running = True
 while running:
+    take_state()
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
 
+        if event.type in EXPOSE_EVENTS:
+            renderer.invalidate()
+
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             for btn in last_truck_buttons:
                 if btn["rect"].collidepoint(event.pos):
@@ -240,10 +264,10 @@ while running:
                     except:
                         pass
 
-    screen.fill((5, 10, 20))
     draw_grid()
+    draw_firefighters()
     draw_dispatcher_panel()
-    pygame.display.flip()
+    renderer.present([PANEL_RECT])
     clock.tick(FPS)
 
 pygame.quit()
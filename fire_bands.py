@@ -0,0 +1,295 @@
+import multiprocessing
+import os
+import random
+from multiprocessing import shared_memory
+
+from fire_engine import (SpreadKernel, RADIUS, EMIT_INTENSITY, DRY_MOISTURE,
+                         DRY_RATE, HOT_TRUNK, TRUNK_ROWS, TRUNK_HALF)
+from sim_grid import UNBURNED, BURNING, SMOLDERING, BURNED
+
+# Sources up to RADIUS rows below a band can heat it; the band re-reads
+# those rows instead of merging partial sums, so every cell receives its
+# contributions in the same order as the serial scan.
+HALO = RADIUS
+
+DOUBLE_COLUMNS = ("fuel", "intensity", "heat", "moisture", "heat_map")
+BYTE_COLUMNS = ("state", "type", "ignite")
+
+SPREAD, BURN, DECIDE, SETTLE, CONFIG, STOP = range(6)
+
+
+def column_views(buf, size):
+    # Typed views of every column in one shared block
+    views = {}
+    offset = 0
+    for name in DOUBLE_COLUMNS:
+        views[name] = buf[offset:offset + size * 8].cast("d")
+        offset += size * 8
+    for name in BYTE_COLUMNS:
+        views[name] = buf[offset:offset + size]
+        offset += size
+    return views
+
+
+def block_size(size):
+    return size * (8 * len(DOUBLE_COLUMNS) + len(BYTE_COLUMNS))
+
+
+class Band:
+    # Runs in a worker process and steps rows y0..y1-1 of the shared grid
+
+    def __init__(self, shm_name, cols, rows, y0, y1):
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.cols = cols
+        self.rows = rows
+        self.y0 = y0
+        self.y1 = y1
+        self.v = column_views(self.shm.buf, cols * rows)
+
+    def configure(self, tables):
+        (self.ign_temp, self.burn_rate, self.heat_gen, self.taps,
+         self.water_id, self.trunk_id, self.foliage_id) = tables
+
+    def spread(self):
+        cols = self.cols
+        v = self.v
+        heat = v["heat"]
+        heat_map = v["heat_map"]
+        intensity = v["intensity"]
+        ctype = v["type"]
+        heat_gen = self.heat_gen
+        own_start = self.y0 * cols
+        own_end = self.y1 * cols
+        for i in range(own_start, min(self.rows, self.y1 + HALO) * cols):
+            if i < own_end:
+                heat_map[i] = heat[i] * 0.67
+            c_int = intensity[i]
+            if c_int <= EMIT_INTENSITY:
+                continue
+            heat_out = heat_gen[ctype[i]] * (c_int / 55.0)
+            y, x = divmod(i, cols)
+            for dx, dy, off, weight, bias in self.taps:
+                j = i + off
+                if own_start <= j < own_end and 0 <= x + dx < cols and y + dy >= 0:
+                    heat_map[j] += heat_out * weight + bias
+
+    def burn(self):
+        v = self.v
+        fuel = v["fuel"]
+        intensity = v["intensity"]
+        ctype = v["type"]
+        burn_rate = self.burn_rate
+        for i in range(self.y0 * self.cols, self.y1 * self.cols):
+            c_int = intensity[i]
+            if c_int <= EMIT_INTENSITY:
+                continue
+            fuel[i] = max(0, fuel[i] - burn_rate[ctype[i]] * (c_int / 80.0))
+            intensity[i] = max(0, c_int - 0.4)
+
+    def near_hot_trunk(self, i):
+        cols = self.cols
+        v = self.v
+        ctype = v["type"]
+        intensity = v["intensity"]
+        y, x = divmod(i, cols)
+        for cy2 in range(y + 1, min(self.rows, y + TRUNK_ROWS + 1)):
+            for cx2 in range(max(0, x - TRUNK_HALF),
+                             min(cols, x + TRUNK_HALF + 1)):
+                j = cy2 * cols + cx2
+                if ctype[j] == self.trunk_id and intensity[j] > HOT_TRUNK:
+                    return True
+        return False
+
+    def decide(self):
+        # Pass two without the random draw: ignitions are flagged and the
+        # parent draws their intensities in row-major order
+        v = self.v
+        fuel = v["fuel"]
+        heat = v["heat"]
+        heat_map = v["heat_map"]
+        moisture = v["moisture"]
+        state = v["state"]
+        ctype = v["type"]
+        ignite = v["ignite"]
+        for i in range(self.y0 * self.cols, self.y1 * self.cols):
+            ignite[i] = 0
+            t = ctype[i]
+            if t == self.water_id:
+                heat[i] = 0
+                continue
+            heat[i] = heat_map[i]
+            if moisture[i] > 50:
+                heat[i] *= 0.85
+            if state[i] in (UNBURNED, SMOLDERING) and fuel[i] > 16:
+                ign_temp = self.ign_temp[t]
+                if t == self.foliage_id and not self.near_hot_trunk(i):
+                    ign_temp *= 2.85
+                final_ign = ign_temp * (1.0 + moisture[i] / 80.0)
+                if heat[i] > final_ign:
+                    ignite[i] = 1
+
+    def settle(self):
+        v = self.v
+        fuel = v["fuel"]
+        intensity = v["intensity"]
+        heat = v["heat"]
+        moisture = v["moisture"]
+        state = v["state"]
+        for i in range(self.y0 * self.cols, self.y1 * self.cols):
+            if fuel[i] <= 8:
+                intensity[i] = 0
+                if state[i] != BURNED:
+                    state[i] = SMOLDERING if fuel[i] > 3 else BURNED
+                heat[i] *= 0.52
+            if moisture[i] > DRY_MOISTURE:
+                moisture[i] -= DRY_RATE
+
+    def close(self):
+        self.v = None
+        self.shm.close()
+
+
+def band_worker(conn, shm_name, cols, rows, y0, y1):
+    band = Band(shm_name, cols, rows, y0, y1)
+    phases = {SPREAD: band.spread, BURN: band.burn, DECIDE: band.decide,
+              SETTLE: band.settle}
+    try:
+        while True:
+            msg = conn.recv()
+            if msg[0] == STOP:
+                break
+            if msg[0] == CONFIG:
+                band.configure(msg[1])
+            else:
+                phases[msg[0]]()
+            conn.send(msg[0])
+    finally:
+        band.close()
+
+
+class BandFireEngine:
+    # Same rules as FireEngine over the whole grid, split into horizontal
+    # bands stepped by worker processes over shared memory
+
+    def __init__(self, fuel_properties, wind, wind_strength, workers=None,
+                 rng=None, default_type="grass"):
+        self.fuel_properties = fuel_properties
+        self.default_type = default_type
+        self.rng = rng if rng is not None else random
+        self.workers = workers or os.cpu_count() or 1
+        self.kernel = SpreadKernel(wind, wind_strength)
+        self.grid = None
+        self.procs = []
+        self.conns = []
+        self.shm = None
+        self.tables = None
+
+    def set_wind(self, wind, wind_strength):
+        self.kernel = SpreadKernel(wind, wind_strength)
+        self.tables = None
+
+    def start(self, grid):
+        self.close()
+        self.grid = grid
+        # The bands write whole columns without notifying an observer, so
+        # the grid runs without one: bring the cells a lazily-drying engine
+        # skipped up to date and detach it. FireEngine.step re-attaches
+        # itself if it is used again.
+        if grid.observer is not None:
+            grid.touch_all()
+            grid.observer = None
+        size = grid.size
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=block_size(size))
+        self.views = column_views(self.shm.buf, size)
+        ctx = multiprocessing.get_context("spawn")
+        bands = min(self.workers, grid.rows)
+        for b in range(bands):
+            y0 = grid.rows * b // bands
+            y1 = grid.rows * (b + 1) // bands
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=band_worker, daemon=True,
+                               args=(child, self.shm.name, grid.cols,
+                                     grid.rows, y0, y1))
+            proc.start()
+            self.procs.append(proc)
+            self.conns.append(parent)
+        self.tables = None
+
+    def run(self, msg):
+        # Every band finishes a phase before any band starts the next
+        for conn in self.conns:
+            conn.send(msg)
+        for conn in self.conns:
+            conn.recv()
+
+    def configure(self, grid):
+        props = self.fuel_properties
+        fallback = props[self.default_type]
+        by_type = [props.get(name, fallback) for name in grid.type_names]
+        tables = (
+            [p["ign_temp"] for p in by_type],
+            [p["burn_rate"] for p in by_type],
+            [p["heat_gen"] for p in by_type],
+            self.kernel.for_cols(grid.cols),
+            grid.type_ids.get("water", -1),
+            grid.type_ids.get("trunk", -1),
+            grid.type_ids.get("foliage", -1),
+        )
+        if tables != self.tables:
+            self.run((CONFIG, tables))
+            self.tables = tables
+
+    def step(self, grid):
+        if grid is not self.grid:
+            self.start(grid)
+        if grid.observer is not None:
+            # Attached after start(): it stays attached and is told every
+            # cell is about to be rewritten
+            grid.touch_all()
+        self.configure(grid)
+        v = self.views
+        for name in ("fuel", "intensity", "heat", "moisture"):
+            v[name][:] = memoryview(getattr(grid, name))
+        v["state"][:] = grid.state
+        v["type"][:] = grid.type
+
+        self.run((SPREAD,))
+        self.run((BURN,))
+        self.run((DECIDE,))
+        # Draw ignition intensities here, in row-major order, so the random
+        # stream matches the serial engine
+        flags = bytes(v["ignite"])
+        intensity = v["intensity"]
+        state = v["state"]
+        moisture = v["moisture"]
+        randint = self.rng.randint
+        i = flags.find(1)
+        while i != -1:
+            intensity[i] = randint(33, 59)
+            state[i] = BURNING
+            moisture[i] = max(0, moisture[i] - 24)
+            i = flags.find(1, i + 1)
+        self.run((SETTLE,))
+
+        for name in ("fuel", "intensity", "heat", "moisture"):
+            memoryview(getattr(grid, name))[:] = v[name]
+        memoryview(grid.state)[:] = v["state"]
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send((STOP,))
+            except OSError:
+                pass
+        for proc in self.procs:
+            proc.join(timeout=2)
+        self.procs = []
+        self.conns = []
+        if self.shm is not None:
+            self.views = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+        self.grid = None
+
@@ -0,0 +1,282 @@
+import random
+from array import array
+
+from sim_grid import UNBURNED, BURNING, SMOLDERING, BURNED
+
+RADIUS = 4
+EMIT_INTENSITY = 8
+DRY_MOISTURE = 22
+DRY_RATE = 0.3
+# Foliage ignites normally only above a trunk hotter than HOT_TRUNK in the
+# TRUNK_ROWS rows below it, within TRUNK_HALF columns either side
+HOT_TRUNK = 15
+TRUNK_ROWS = 6
+TRUNK_HALF = 2
+
+
+class SpreadKernel:
+    # Radiation taps for one wind setting, built once per wind change.
+    # A source adds heat_out * weight + bias to the cell at (dx, dy).
+    # The step resets heat_map[i] when its row-major scan reaches i, which
+    # discards heat sent to cells later in scan order, so only taps
+    # pointing up (or left on the same row) are kept.
+
+    def __init__(self, wind, wind_strength, radius=RADIUS):
+        self.wind = tuple(wind)
+        self.wind_strength = wind_strength
+        self.radius = radius
+        self.taps = []
+        for dy in range(-radius, 1):
+            for dx in range(-radius, radius + 1):
+                if dy == 0 and dx >= 0:
+                    continue
+                dist = max(1.0, (abs(dx) + abs(dy)) ** 0.72)
+                vb = 1.5 if dy < 0 else 1.2
+                wind_bias = (dx * wind[0] + dy * wind[1]) * wind_strength * 0.65
+                self.taps.append((dx, dy, vb / dist, wind_bias * vb))
+        self.offsets = {}
+
+    def for_cols(self, cols):
+        # (dx, dy, flat offset, weight, bias) for a grid of this width
+        taps = self.offsets.get(cols)
+        if taps is None:
+            taps = self.offsets[cols] = [(dx, dy, dy * cols + dx, w, b)
+                                         for dx, dy, w, b in self.taps]
+        return taps
+
+
+class FireEngine:
+    # Serial fire step limited to the active region: cells that are burning,
+    # hold heat or have not settled yet, plus every cell the spread kernel
+    # of an emitting cell reaches. Every other cell would only lose moisture, which is
+    # applied lazily once it becomes active again or is about to be written.
+    # Cells are visited in row-major order, so results and random draws
+    # match a full-grid pass exactly.
+
+    def __init__(self, fuel_properties, wind, wind_strength, rng=None,
+                 default_type="grass"):
+        self.fuel_properties = fuel_properties
+        self.default_type = default_type
+        # Any object with randint(); the module-level generator by default
+        self.rng = rng if rng is not None else random
+        self.grid = None
+        # Fuel properties indexed by grid type id
+        self.ign_temp = []
+        self.burn_rate = []
+        self.heat_gen = []
+        self.set_wind(wind, wind_strength)
+
+    def set_wind(self, wind, wind_strength):
+        self.kernel = SpreadKernel(wind, wind_strength)
+
+    def attach(self, grid):
+        self.grid = grid
+        grid.observer = self
+        self.steps = 0
+        self.dried = array("I", [0]) * grid.size
+        self.heat_map = array("d", [0.0]) * grid.size
+        self.live = set()
+        self.dirty = set()
+        self.rescan = True
+        # hot[i]: cell i is a trunk hotter than HOT_TRUNK
+        # hot_near[i]: number of such trunks in cell i's foliage window
+        self.hot = bytearray(grid.size)
+        self.hot_near = array("H", [0]) * grid.size
+
+    def cell_changing(self, i):
+        self.catch_up(i)
+        self.dirty.add(i)
+
+    def grid_changing(self):
+        steps = self.steps
+        dried = self.dried
+        for i in range(self.grid.size):
+            if dried[i] != steps:
+                self.catch_up(i)
+        self.rescan = True
+        self.dirty.clear()
+
+    def catch_up(self, i):
+        missed = self.steps - self.dried[i]
+        if not missed:
+            return
+        moisture = self.grid.moisture
+        m = moisture[i]
+        while missed and m > DRY_MOISTURE:
+            m -= DRY_RATE
+            missed -= 1
+        moisture[i] = m
+        self.dried[i] = self.steps
+
+    def quiet(self, i):
+        # True when a step would leave the cell unchanged apart from drying
+        grid = self.grid
+        c_int = grid.intensity[i]
+        if c_int > EMIT_INTENSITY or grid.heat[i] != 0:
+            return False
+        f = grid.fuel[i]
+        if f > 8:
+            return True
+        st = grid.state[i]
+        return c_int == 0 and (st == BURNED or (st == SMOLDERING and f > 3))
+
+    def refresh_hot(self, i):
+        grid = self.grid
+        hot = (grid.type[i] == self.trunk_id
+               and grid.intensity[i] > HOT_TRUNK)
+        if hot == self.hot[i]:
+            return
+        self.hot[i] = hot
+        delta = 1 if hot else -1
+        cols = grid.cols
+        y, x = divmod(i, cols)
+        x0 = max(0, x - TRUNK_HALF)
+        x1 = min(cols, x + TRUNK_HALF + 1)
+        near = self.hot_near
+        for ny in range(max(0, y - TRUNK_ROWS), y):
+            row = ny * cols
+            for j in range(row + x0, row + x1):
+                near[j] += delta
+
+    def sync_types(self, type_names):
+        props = self.fuel_properties
+        fallback = props[self.default_type]
+        for name in type_names[len(self.ign_temp):]:
+            p = props.get(name, fallback)
+            self.ign_temp.append(p["ign_temp"])
+            self.burn_rate.append(p["burn_rate"])
+            self.heat_gen.append(p["heat_gen"])
+
+    def active_cells(self):
+        grid = self.grid
+        quiet = self.quiet
+        live = self.live
+        refresh_hot = self.refresh_hot
+        if self.rescan:
+            live.clear()
+            live.update(i for i in range(grid.size) if not quiet(i))
+            self.hot[:] = bytes(grid.size)
+            self.hot_near[:] = array("H", [0]) * grid.size
+            for i in range(grid.size):
+                refresh_hot(i)
+            self.rescan = False
+        else:
+            for i in self.dirty:
+                if quiet(i):
+                    live.discard(i)
+                else:
+                    live.add(i)
+                refresh_hot(i)
+        self.dirty.clear()
+
+        # The kernel only reaches rows above and cells to the left
+        cols = grid.cols
+        radius = self.kernel.radius
+        intensity = grid.intensity
+        active = set(live)
+        for i in live:
+            if intensity[i] <= EMIT_INTENSITY:
+                continue
+            y, x = divmod(i, cols)
+            x0 = max(0, x - radius)
+            x1 = min(cols, x + radius + 1)
+            for ny in range(max(0, y - radius), y):
+                row = ny * cols
+                active.update(range(row + x0, row + x1))
+            active.update(range(y * cols + x0, i))
+        return sorted(active)
+
+    def step(self, grid):
+        if grid is not self.grid or grid.observer is not self:
+            self.attach(grid)
+        self.sync_types(grid.type_names)
+        self.trunk_id = grid.type_ids.get("trunk", -1)
+        order = self.active_cells()
+        for i in order:
+            self.catch_up(i)
+
+        cols = grid.cols
+        fuel = grid.fuel
+        intensity = grid.intensity
+        heat = grid.heat
+        moisture = grid.moisture
+        state = grid.state
+        ctype = grid.type
+        ign_by_type = self.ign_temp
+        burn_by_type = self.burn_rate
+        heat_gen_by_type = self.heat_gen
+        water_id = grid.type_ids.get("water", -1)
+        trunk_id = self.trunk_id
+        refresh_hot = self.refresh_hot
+        randint = self.rng.randint
+        hot = self.hot
+        hot_near = self.hot_near
+        foliage_id = grid.type_ids.get("foliage", -1)
+        heat_map = self.heat_map
+        taps = self.kernel.for_cols(cols)
+        radius = self.kernel.radius
+
+        for i in order:
+            heat_map[i] = heat[i] * 0.67
+            c_int = intensity[i]
+            if c_int <= 8:
+                continue
+            t = ctype[i]
+            heat_out = heat_gen_by_type[t] * (c_int / 55.0)
+            y, x = divmod(i, cols)
+            if y >= radius and radius <= x < cols - radius:
+                for dx, dy, off, weight, bias in taps:
+                    heat_map[i + off] += heat_out * weight + bias
+            else:
+                for dx, dy, off, weight, bias in taps:
+                    if 0 <= x + dx < cols and y + dy >= 0:
+                        heat_map[i + off] += heat_out * weight + bias
+
+            fuel[i] = max(0, fuel[i] - burn_by_type[t] * (c_int / 80.0))
+            intensity[i] = max(0, c_int - 0.4)
+            if t == trunk_id and intensity[i] <= HOT_TRUNK < c_int:
+                refresh_hot(i)
+
+        for i in order:
+            t = ctype[i]
+            if t == water_id:
+                heat[i] = 0
+                continue
+            heat[i] = heat_map[i]
+            if moisture[i] > 50:
+                heat[i] *= 0.85
+            if state[i] in (UNBURNED, SMOLDERING) and fuel[i] > 16:
+                ign_temp = ign_by_type[t]
+                # Rows below have not been visited by this pass yet, so
+                # the index still reflects their post-pass-1 intensities
+                if t == foliage_id and not hot_near[i]:
+                    ign_temp *= 2.85
+                final_ign = ign_temp * (1.0 + moisture[i] / 80.0)
+                if heat[i] > final_ign:
+                    intensity[i] = randint(33, 59)
+                    state[i] = BURNING
+                    moisture[i] = max(0, moisture[i] - 24)
+                    if t == trunk_id:
+                        refresh_hot(i)
+
+        for i in order:
+            if fuel[i] <= 8:
+                intensity[i] = 0
+                if hot[i]:
+                    refresh_hot(i)
+                if state[i] != BURNED:
+                    state[i] = SMOLDERING if fuel[i] > 3 else BURNED
+                heat[i] *= 0.52
+            if moisture[i] > DRY_MOISTURE:
+                moisture[i] -= DRY_RATE
+
+        self.steps += 1
+        steps = self.steps
+        dried = self.dried
+        quiet = self.quiet
+        live = self.live
+        live.clear()
+        for i in order:
+            dried[i] = steps
+            if not quiet(i):
+                live.add(i)
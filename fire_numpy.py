@@ -0,0 +1,158 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from fire_engine import SpreadKernel
+from sim_grid import UNBURNED, BURNING, SMOLDERING, BURNED
+
+RADIUS = 4
+TRUNK_WINDOW_ROWS = 6
+TRUNK_WINDOW_HALF = 2
+
+
+def available():
+    return np is not None
+
+
+def build_kernels(wind, wind_strength):
+    # falloff: heat_out multiplier, bias: additive wind term per burning source
+    size = RADIUS * 2 + 1
+    falloff = np.zeros((size, size))
+    bias = np.zeros((size, size))
+    for dx, dy, weight, wind_bias in SpreadKernel(wind, wind_strength,
+                                                  RADIUS).taps:
+        falloff[dy + RADIUS, dx + RADIUS] = weight
+        bias[dy + RADIUS, dx + RADIUS] = wind_bias
+    return falloff, bias
+
+
+class NumpyFireEngine:
+    def __init__(self, fuel_properties, wind, wind_strength, seed=None,
+                 default_type="grass"):
+        self.fuel_properties = fuel_properties
+        self.default_type = default_type
+        self.rng = np.random.default_rng(seed)
+        self.ign_temp = np.zeros(0)
+        self.burn_rate = np.zeros(0)
+        self.heat_gen = np.zeros(0)
+        self.grid = None
+        self.set_wind(wind, wind_strength)
+
+    def set_wind(self, wind, wind_strength):
+        falloff, bias = build_kernels(wind, wind_strength)
+        self.taps = []
+        for ky in range(RADIUS * 2 + 1):
+            for kx in range(RADIUS * 2 + 1):
+                if falloff[ky, kx] == 0 and bias[ky, kx] == 0:
+                    continue
+                self.taps.append((ky, kx, falloff[ky, kx], bias[ky, kx]))
+
+    def sync_types(self, type_names):
+        known = len(self.ign_temp)
+        if known == len(type_names):
+            return
+        props = [self.fuel_properties.get(
+            name, self.fuel_properties[self.default_type])
+            for name in type_names[known:]]
+        self.ign_temp = np.append(self.ign_temp,
+                                  [p["ign_temp"] for p in props])
+        self.burn_rate = np.append(self.burn_rate,
+                                   [p["burn_rate"] for p in props])
+        self.heat_gen = np.append(self.heat_gen,
+                                  [p["heat_gen"] for p in props])
+
+    def attach(self, grid):
+        # Zero-copy views over the grid's typed arrays.
+        shape = (grid.rows, grid.cols)
+        self.grid = grid
+        self.rows = grid.rows
+        self.cols = grid.cols
+        self.fuel = np.frombuffer(grid.fuel, dtype=np.float64).reshape(shape)
+        self.intensity = np.frombuffer(
+            grid.intensity, dtype=np.float64).reshape(shape)
+        self.heat = np.frombuffer(grid.heat, dtype=np.float64).reshape(shape)
+        self.moisture = np.frombuffer(
+            grid.moisture, dtype=np.float64).reshape(shape)
+        self.state = np.frombuffer(grid.state, dtype=np.uint8).reshape(shape)
+        self.type = np.frombuffer(grid.type, dtype=np.uint8).reshape(shape)
+        self.pad = np.zeros((self.rows + RADIUS * 2, self.cols + RADIUS * 2))
+        self.pad_mask = np.zeros_like(self.pad)
+
+    def spread(self, heat_out, emitting):
+        rows, cols = self.rows, self.cols
+        pad = self.pad
+        pad_mask = self.pad_mask
+        pad[RADIUS:RADIUS + rows, RADIUS:RADIUS + cols] = heat_out
+        pad_mask[RADIUS:RADIUS + rows, RADIUS:RADIUS + cols] = emitting
+        out = np.zeros((rows, cols))
+        for ky, kx, falloff, bias in self.taps:
+            # target = source + (ky - R, kx - R)
+            sy = RADIUS * 2 - ky
+            sx = RADIUS * 2 - kx
+            out += pad[sy:sy + rows, sx:sx + cols] * falloff
+            out += pad_mask[sy:sy + rows, sx:sx + cols] * bias
+        return out
+
+    def near_hot_trunk(self, hot):
+        rows, cols = self.rows, self.cols
+        padded = np.zeros((rows + TRUNK_WINDOW_ROWS,
+                           cols + TRUNK_WINDOW_HALF * 2), dtype=bool)
+        padded[:rows, TRUNK_WINDOW_HALF:TRUNK_WINDOW_HALF + cols] = hot
+        near = np.zeros((rows, cols), dtype=bool)
+        for dy in range(1, TRUNK_WINDOW_ROWS + 1):
+            for dx in range(TRUNK_WINDOW_HALF * 2 + 1):
+                near |= padded[dy:dy + rows, dx:dx + cols]
+        return near
+
+    def step(self, grid):
+        if grid is not self.grid:
+            self.attach(grid)
+        self.sync_types(grid.type_names)
+        type_ids = grid.type_ids
+
+        fuel = self.fuel
+        intensity = self.intensity
+        moisture = self.moisture
+        state = self.state
+        ctype = self.type
+
+        emitting = intensity > 8
+        heat_out = np.where(emitting,
+                            self.heat_gen[ctype] * (intensity / 55.0), 0.0)
+        heat_map = self.heat * 0.67 + self.spread(heat_out, emitting)
+
+        burn = self.burn_rate[ctype] * (intensity / 80.0)
+        np.maximum(fuel - burn, 0, out=fuel, where=emitting)
+        np.maximum(intensity - 0.4, 0, out=intensity, where=emitting)
+
+        water = ctype == type_ids.get("water", -1)
+        heat_map[water] = 0.0
+        heat_map[~water & (moisture > 50)] *= 0.85
+
+        ign_temp = self.ign_temp[ctype]
+        foliage_id = type_ids.get("foliage")
+        trunk_id = type_ids.get("trunk", -1)
+        if foliage_id is not None:
+            foliage = ctype == foliage_id
+            if foliage.any():
+                hot = (ctype == trunk_id) & (intensity > 15)
+                cold = foliage & ~self.near_hot_trunk(hot)
+                ign_temp = np.where(cold, ign_temp * 2.85, ign_temp)
+        final_ign = ign_temp * (1.0 + moisture / 80.0)
+        ignite = (~water & (fuel > 16)
+                  & ((state == UNBURNED) | (state == SMOLDERING))
+                  & (heat_map > final_ign))
+        count = int(ignite.sum())
+        if count:
+            intensity[ignite] = self.rng.integers(33, 60, count)
+            state[ignite] = BURNING
+            moisture[ignite] = np.maximum(moisture[ignite] - 24, 0)
+
+        spent = fuel <= 8
+        intensity[spent] = 0
+        cooling = spent & (state != BURNED)
+        state[cooling] = np.where(fuel[cooling] > 3, SMOLDERING, BURNED)
+        heat_map[spent] *= 0.52
+        moisture[moisture > 22] -= 0.3
+        self.heat[:] = heat_map
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+
+import fire_numpy
+import server
+from sim_grid import UNBURNED
+
+MAPS = [
+    os.path.join(server.BASE_DIR, "maps", "l7.json"),
+    os.path.join(server.BASE_DIR, "maps", "д12.json"),
+]
+IGNITION_POINTS = 6
+
+
+def load_map(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["grid"] if isinstance(data, dict) else data
+
+
+def ignition_cells(map_grid):
+    burnable = [(x, y) for y, row in enumerate(map_grid)
+                for x, cell in enumerate(row)
+                if cell[0] > 16 and server.get_props(cell[2])["heat_gen"] > 0]
+    if not burnable:
+        return []
+    stride = max(1, len(burnable) // IGNITION_POINTS)
+    return burnable[stride // 2::stride][:IGNITION_POINTS]
+
+
+def measure(engine, map_grid, seed, steps):
+    server.rng.seed(seed)
+    server.grid.reset()
+    server.load_map_grid(map_grid)
+    for x, y in ignition_cells(map_grid):
+        server.place_stamp(x, y, "ignite")
+
+    if engine == "numpy":
+        server.numpy_engine = fire_numpy.NumpyFireEngine(
+            server.FUEL_PROPERTIES, server.WIND, server.WIND_STRENGTH,
+            seed=seed)
+    else:
+        server.numpy_engine = None
+    server.running_sim = True
+
+    grid = server.grid
+    burning_peak = 0
+    for _ in range(steps):
+        server.update_fire()
+        burning = sum(1 for v in grid.intensity if v > 8)
+        burning_peak = max(burning_peak, burning)
+
+    return {
+        "burning_peak": burning_peak,
+        "burning_end": sum(1 for v in grid.intensity if v > 8),
+        "affected": sum(1 for s in grid.state if s != UNBURNED),
+        "fuel_left": sum(grid.fuel),
+    }
+
+
+def compare(py_runs, np_runs, tolerance):
+    rows = []
+    ok = True
+    for key in py_runs[0]:
+        py_vals = [r[key] for r in py_runs]
+        np_vals = [r[key] for r in np_runs]
+        py_mean = statistics.mean(py_vals)
+        np_mean = statistics.mean(np_vals)
+        spread = max(statistics.pstdev(py_vals), statistics.pstdev(np_vals))
+        diff = abs(py_mean - np_mean)
+        allowed = max(tolerance * max(abs(py_mean), 1.0), 2 * spread)
+        passed = diff <= allowed
+        ok = ok and passed
+        rows.append((key, py_mean, np_mean, diff, allowed, passed))
+    return ok, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare python and numpy fire engines on bundled maps")
+    parser.add_argument("--steps", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("maps", nargs="*", default=MAPS)
+    args = parser.parse_args()
+
+    if not fire_numpy.available():
+        print("numpy is not installed")
+        return 2
+
+    all_ok = True
+    for path in args.maps:
+        map_grid = load_map(path)
+        py_runs = [measure("python", map_grid, seed, args.steps)
+                   for seed in range(args.runs)]
+        np_runs = [measure("numpy", map_grid, seed, args.steps)
+                   for seed in range(args.runs)]
+        ok, rows = compare(py_runs, np_runs, args.tolerance)
+        all_ok = all_ok and ok
+        print("== {} ({} steps x {} runs)".format(
+            os.path.basename(path), args.steps, args.runs))
+        for key, py_mean, np_mean, diff, allowed, passed in rows:
+            print("  {:<13} python={:>10.1f} numpy={:>10.1f} "
+                  "diff={:>8.1f} allowed={:>8.1f} {}".format(
+                      key, py_mean, np_mean, diff, allowed,
+                      "OK" if passed else "MISMATCH"))
+
+    print("PARITY OK" if all_ok else "PARITY FAILED")
+    return 0 if all_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import math
+
+# Firefighter movement rules shared by the server, which moves firefighters
+# from their input, and the clients.
+
+SPEED = 4.5            # cells per second
+HOSE_MAX_LEN = 25      # cells from the truck
+WALK_MAX_INTENSITY = 6
+DIAGONAL = 0.707
+
+# Input keys in the order the sandbox reads them; the last held one sets the
+# facing
+KEYS = ("left", "right", "up", "down")
+KEY_VEC = {
+    "left": (-1, 0),
+    "right": (1, 0),
+    "up": (0, -1),
+    "down": (0, 1),
+}
+
+
+def input_keys(keys):
+    # Valid held keys in KEYS order, as sent in FF_INPUT
+    if not isinstance(keys, (list, tuple)):
+        return ()
+    return tuple(k for k in KEYS if k in keys)
+
+
+def check_hose(ff, nx, ny):
+    dx = nx - ff["tx"]
+    dy = ny - ff["ty"]
+    return math.sqrt(dx * dx + dy * dy) <= HOSE_MAX_LEN
+
+
+def step(ff, keys, speed, can_walk, cols, rows):
+    # Move ff one step for the held keys; can_walk(gx, gy) tells whether a
+    # cell can be entered. Returns False when no key is held.
+    dx = 0.0
+    dy = 0.0
+    for k in keys:
+        vx, vy = KEY_VEC[k]
+        dx += vx * speed
+        dy += vy * speed
+        ff["dir"] = k
+    if not keys:
+        return False
+
+    if dx != 0 and dy != 0:
+        dx *= DIAGONAL
+        dy *= DIAGONAL
+
+    nx = ff["x"] + dx
+    ny = ff["y"] + dy
+
+    if can_walk(int(nx), int(ff["y"])) and check_hose(ff, nx, ff["y"]):
+        ff["x"] = max(0.0, min(float(cols - 1), nx))
+    if can_walk(int(ff["x"]), int(ny)) and check_hose(ff, ff["x"], ny):
+        ff["y"] = max(0.0, min(float(rows - 1), ny))
+    return True
@@ -7,6 +7,17 @@ import random
 import math
 import pygame
 
+import firefighter
+import client_state
+import interp
+import particles
+from grid_renderer import EXPOSE_EVENTS, GridRenderer
+import textures
+import wire_format
+from client_state import PART_TYPES, ROOT_TYPES
+from firefighter import HOSE_MAX_LEN
+from water import STREAM_LEN, SPRAY_LEN, DIR_VEC
+
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -29,37 +40,41 @@ HEIGHT = 704
 COLS = GRID_WIDTH // CELL
 ROWS = HEIGHT // CELL
 FPS = 30
-TEXTURE_DIR = os.path.join(BASE_DIR, "textures")
 
 available_trucks = []
 firefighters_from_server = []
+client_id = None
 selected_truck_on_map = None
 local_firefighters = []
 active_ff_idx = -1
 next_ff_id = 1
 
-FF_SPEED = 0.15
-STREAM_LEN = 6
-SPRAY_LEN = 3
 STREAM_CD = 3
 SPRAY_CD = 2
 WATER_PER_STREAM = 2
 WATER_PER_SPRAY = 3
 TRUCK_MAX_WATER = 2000
-HOSE_MAX_LEN = 25
 SUPPLY_HOSE_MAX = 15
 
+# Keys steering the active firefighter; the server moves it from FF_INPUT
+MOVE_KEYS = {
+    "left": (pygame.K_LEFT, pygame.K_a),
+    "right": (pygame.K_RIGHT, pygame.K_d),
+    "up": (pygame.K_UP, pygame.K_w),
+    "down": (pygame.K_DOWN, pygame.K_s),
+}
+sent_keys = {}  # firefighter id -> (keys, seq) last sent in FF_INPUT
+input_seq = 0
+# Our firefighters move locally at once; an error above SNAP_DIST cells is
+# fixed at once, a smaller one eased out by CORRECT per frame once the
+# server has our last input
+SNAP_DIST = 2.0
+CORRECT = 0.25
+
 truck_water_map = {}
 supply_hoses = {}
 supply_hose_mode = False
-water_particles = []
-
-DIR_VEC = {
-    "up": (0, -1),
-    "down": (0, 1),
-    "left": (-1, 0),
-    "right": (1, 0),
-}
+water_particles = particles.ParticlePool()
 
 
 def make_font(size, bold=False):
@@ -101,85 +116,54 @@ font_bold = make_font(20, True)
 font_small = make_font(14)
 font_tiny = make_font(12)
 
-TEXTURES = {}
-fire_texture = None
-ff_base_texture = None
-ff_dir_textures = {}
-
-
-def load_all_textures():
-    global TEXTURES, fire_texture, ff_base_texture, ff_dir_textures
-    os.makedirs(TEXTURE_DIR, exist_ok=True)
-    TEXTURES = {}
-
-    try:
-        fire_texture = pygame.image.load(
-            os.path.join(BASE_DIR, "fire.png")).convert_alpha()
-    except Exception:
-        fire_texture = pygame.Surface((CELL, CELL), pygame.SRCALPHA)
-        fire_texture.fill((255, 100, 0, 180))
-
-    ff_base_texture = None
-    for name in ("fire_fighter.png", "firefighter.png"):
-        fp = os.path.join(TEXTURE_DIR, name)
-        if os.path.exists(fp):
-            try:
-                img = pygame.image.load(fp).convert_alpha()
-                ff_base_texture = pygame.transform.scale(img, (CELL + 8, CELL + 8))
-                break
-            except Exception:
-                pass
-    if ff_base_texture is None:
-        ff_base_texture = pygame.Surface((CELL + 8, CELL + 8), pygame.SRCALPHA)
-        pygame.draw.circle(ff_base_texture, (0, 180, 255),
-                           (CELL // 2 + 4, CELL // 2 + 4), 10)
-        pygame.draw.rect(ff_base_texture, (200, 50, 50),
-                         (CELL // 2 - 2, 0, 12, 6))
-
-    ff_dir_textures["up"] = ff_base_texture
-    ff_dir_textures["right"] = pygame.transform.rotate(ff_base_texture, -90)
-    ff_dir_textures["down"] = pygame.transform.rotate(ff_base_texture, 180)
-    ff_dir_textures["left"] = pygame.transform.rotate(ff_base_texture, 90)
-
-    for d in ["up", "down", "left", "right"]:
-        cp = ff_dir_textures[d].copy()
-        ov = pygame.Surface(cp.get_size(), pygame.SRCALPHA)
-        ov.fill((255, 255, 100, 60))
-        cp.blit(ov, (0, 0))
-        ff_dir_textures[d + "_act"] = cp
-
-    for fn in os.listdir(TEXTURE_DIR):
-        if not fn.lower().endswith((".png", ".jpg", ".jpeg")):
-            continue
-        key = os.path.splitext(fn)[0].lower()
-        if key in ("fire_fighter", "firefighter"):
-            continue
-        path = os.path.join(TEXTURE_DIR, fn)
-        try:
-            img = pygame.image.load(path).convert_alpha()
-            if key == "firecar":
-                TEXTURES["firecar"] = pygame.transform.scale(img, (64, 128))
-            elif key in ("road", "road_straight"):
-                TEXTURES["road"] = pygame.transform.scale(img, (CELL * 4, CELL * 4))
-            elif key in ("road_right", "road_turn"):
-                TEXTURES["road_right"] = pygame.transform.scale(
-                    img, (CELL * 5, CELL * 5))
-            else:
-                TEXTURES[key] = pygame.transform.scale(img, (CELL, CELL))
-        except Exception:
-            pass
-
-
-load_all_textures()
-
-server_grid = [[[0, 0, "empty"] for _ in range(COLS)] for _ in range(ROWS)]
+# Every texture size is prepared once; draw code only blits
+atlas = textures.load(CELL)
+TEXTURES = atlas.textures
+
+
+def cell_look(fuel, intensity, ctype):
+    if intensity > 8:
+        return None
+    if intensity > 0:
+        return (atlas.smoulder_tint(intensity),)
+
+    tk = ROOT_TYPES.get(ctype) or PART_TYPES.get(ctype) or ctype
+    if tk in TEXTURES:
+        if ctype in PART_TYPES:
+            return ()
+        return (TEXTURES[tk],)
+    if ctype != "empty":
+        return (atlas.solid((40, 40, 45)),)
+    return ()
+
+
+def fire_look(intensity):
+    return (atlas.fire_frame(),
+            (random.randint(-2, 2), -random.randint(2, 5)))
+
+
+renderer = GridRenderer(screen, COLS, ROWS, CELL, (5, 10, 20),
+                        cell_look, fire_look)
+mark = renderer.mark
+PANEL_RECT = pygame.Rect(GRID_WIDTH, 0, PANEL_WIDTH, HEIGHT)
+
+# The network thread publishes finished frames; the main loop picks the
+# latest one up in take_state
+net_state = client_state.ClientState(COLS, ROWS)
+state_version = None
+hoses_version = 0
+server_grid = net_state.current().grid
+grid_cells = None  # cells changed since the last frame, None: unknown
+objects_on_map = client_state.ObjectIndex()
+view = interp.Interpolator()
 running_sim = False
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 connected = False
 try:
     sock.connect((SERVER_IP, SERVER_PORT))
-    auth = {"type": "AUTH", "password": SERVER_PASSWORD, "role": PLAYER_ROLE}
+    auth = {"type": "AUTH", "password": SERVER_PASSWORD, "role": PLAYER_ROLE,
+            "wire": [wire_format.WIRE_BIN]}
     raw = json.dumps(auth).encode("utf-8")
     sock.sendall(struct.pack(">I", len(raw)) + raw)
     connected = True
@@ -188,8 +172,7 @@ except Exception:
 
 
 def recv_thread():
-    global server_grid, running_sim, available_trucks
-    global firefighters_from_server, supply_hoses
+    global available_trucks, client_id
     while True:
         try:
             hdr = recv_exact(sock, 4)
@@ -199,17 +182,18 @@ def recv_thread():
             body = recv_exact(sock, mlen)
             if not body:
                 break
-            data = json.loads(body.decode("utf-8"))
+            data = wire_format.decode(body, net_state.type_names)
             mt = data.get("type", "")
-            if mt == "STATE_UPDATE":
-                server_grid = data.get("grid", server_grid)
-                running_sim = data.get("running_sim", False)
-                available_trucks = data.get("available_trucks", [])
-                firefighters_from_server = data.get("firefighters", [])
-                sh_list = data.get("supply_hoses", [])
-                supply_hoses.clear()
-                for item in sh_list:
-                    supply_hoses[(item[0], item[1])] = (item[2], item[3])
+            if mt in ("STATE_UPDATE", "STATE_DELTA"):
+                if not net_state.apply(data):
+                    send_to_server({"type": "RESYNC"})
+                    continue
+                frame = net_state.current()
+                view.push({(f.get("owner"), f.get("id")): (f["x"], f["y"])
+                           for f in frame.fields.get("firefighters", [])},
+                          frame.fire_changes)
+            elif mt == "AUTH_OK":
+                client_id = data.get("client_id")
             elif mt == "TRUCK_AVAILABLE":
                 available_trucks = data.get("available", [])
             elif mt == "SUPPLY_OK":
@@ -226,21 +210,34 @@ if connected:
     threading.Thread(target=recv_thread, daemon=True).start()
 
 
-def find_trucks_on_map():
-    result = []
-    for y in range(ROWS):
-        for x in range(COLS):
-            c = server_grid[y][x]
-            ct = c[2] if len(c) > 2 else ""
-            if "firecar" in ct and "_root" in ct:
-                result.append((x, y))
-    return result
-
-
-def can_walk(gx, gy):
-    if gx < 0 or gy < 0 or gx >= COLS or gy >= ROWS:
-        return False
-    return server_grid[int(gy)][int(gx)][1] <= 6
+def take_state():
+    # Switches this frame over to the latest published server state
+    global state_version, hoses_version, server_grid, grid_cells
+    global running_sim, available_trucks, firefighters_from_server
+    global objects_on_map
+    frame = net_state.current()
+    if frame.version == state_version:
+        grid_cells = ()
+        return
+    grid_cells = net_state.changes(state_version, frame)
+    state_version = frame.version
+    server_grid = frame.grid
+    running_sim = frame.fields.get("running_sim", False)
+    available_trucks = frame.fields.get("available_trucks", [])
+    firefighters_from_server = frame.fields.get("firefighters", [])
+    objects_on_map = frame.objects
+    if frame.hoses_version != hoses_version:
+        hoses_version = frame.hoses_version
+        supply_hoses.clear()
+        supply_hoses.update(frame.hoses)
+
+
+def truck_at(gx, gy):
+    # Root of the truck covering cell gx, gy, or None
+    hit = objects_on_map.object_at(gx, gy)
+    if hit is not None and hit[1] == "firecar":
+        return hit[0]
+    return None
 
 
 def is_truck_supplied(tx, ty):
@@ -272,10 +269,29 @@ def hose_dist(ff):
     return math.sqrt(dx * dx + dy * dy)
 
 
-def check_hose(ff, nx, ny):
-    dx = nx - ff["tx"]
-    dy = ny - ff["ty"]
-    return math.sqrt(dx * dx + dy * dy) <= HOSE_MAX_LEN
+def can_walk(gx, gy):
+    if gx < 0 or gy < 0 or gx >= COLS or gy >= ROWS:
+        return False
+    return server_grid[int(gy)][int(gx)][1] <= firefighter.WALK_MAX_INTENSITY
+
+
+def reconcile_firefighters():
+    # Pull the predicted positions of our firefighters toward the server's
+    own = {f.get("id"): f for f in firefighters_from_server
+           if f.get("owner") == client_id}
+    for ff in local_firefighters:
+        f = own.get(ff["id"])
+        if f is None:
+            continue
+        ex = f["x"] - ff["x"]
+        ey = f["y"] - ff["y"]
+        keys, seq = sent_keys.get(ff["id"], ((), 0))
+        if ex * ex + ey * ey > SNAP_DIST * SNAP_DIST:
+            ff["x"] = f["x"]
+            ff["y"] = f["y"]
+        elif not keys and f.get("seq", 0) == seq:
+            ff["x"] += ex * CORRECT
+            ff["y"] += ey * CORRECT
 
 
 def spawn_ff(tx, ty):
@@ -286,8 +302,7 @@ def spawn_ff(tx, ty):
             ny2 = ty + dy
             if 0 <= nx2 < COLS and 0 <= ny2 < ROWS:
                 c = server_grid[ny2][nx2]
-                ct = c[2] if len(c) > 2 else ""
-                if c[1] < 3 and "firecar" not in ct:
+                if c[1] < 3 and truck_at(nx2, ny2) is None:
                     ff = {
                         "id": next_ff_id,
                         "x": float(nx2),
@@ -319,28 +334,8 @@ def do_shoot_stream(ff):
     use_tw(ff["tx"], ff["ty"], WATER_PER_STREAM)
 
     ddx, ddy = DIR_VEC[ff["dir"]]
-    cx = int(ff["x"])
-    cy = int(ff["y"])
-    cells = []
-    for i in range(1, STREAM_LEN + 1):
-        sx = cx + ddx * i
-        sy = cy + ddy * i
-        if sx < 0 or sx >= COLS or sy < 0 or sy >= ROWS:
-            break
-        cells.append({"x": sx, "y": sy})
-        if ddx == 0:
-            if sx - 1 >= 0:
-                cells.append({"x": sx - 1, "y": sy})
-            if sx + 1 < COLS:
-                cells.append({"x": sx + 1, "y": sy})
-        else:
-            if sy - 1 >= 0:
-                cells.append({"x": sx, "y": sy - 1})
-            if sy + 1 < ROWS:
-                cells.append({"x": sx, "y": sy + 1})
-
-    if cells:
-        send_to_server({"type": "EXTINGUISH", "cells": cells, "power": 5})
+    send_to_server({"type": "EXTINGUISH_SHAPE", "x": int(ff["x"]),
+                    "y": int(ff["y"]), "dir": ff["dir"], "mode": "stream"})
 
     px = ff["x"] * CELL + CELL // 2
     py = ff["y"] * CELL + CELL // 2
@@ -348,17 +343,13 @@ def do_shoot_stream(ff):
         tgx = px + ddx * i * CELL
         tgy = py + ddy * i * CELL
         for _ in range(3):
-            water_particles.append({
-                "x": px + ddx * CELL * 0.5,
-                "y": py + ddy * CELL * 0.5,
-                "vx": ddx * i * 2.5 + random.uniform(-0.8, 0.8),
-                "vy": ddy * i * 2.5 + random.uniform(-0.8, 0.8),
-                "tgt_x": tgx + random.uniform(-4, 4),
-                "tgt_y": tgy + random.uniform(-4, 4),
-                "life": 6 + i * 2,
-                "max_life": 6 + i * 2,
-                "sz": random.randint(2, 4),
-            })
+            water_particles.emit(px + ddx * CELL * 0.5,
+                                 py + ddy * CELL * 0.5,
+                                 ddx * i * 2.5 + random.uniform(-0.8, 0.8),
+                                 ddy * i * 2.5 + random.uniform(-0.8, 0.8),
+                                 tgx + random.uniform(-4, 4),
+                                 tgy + random.uniform(-4, 4),
+                                 6 + i * 2, random.randint(2, 4))
 
 
 def do_shoot_spray(ff):
@@ -374,23 +365,8 @@ def do_shoot_spray(ff):
     use_tw(ff["tx"], ff["ty"], WATER_PER_SPRAY)
 
     ddx, ddy = DIR_VEC[ff["dir"]]
-    cx = int(ff["x"])
-    cy = int(ff["y"])
-    cells = []
-    for i in range(1, SPRAY_LEN + 1):
-        spread = i + 1
-        for s in range(-spread, spread + 1):
-            if ddx == 0:
-                sx = cx + s
-                sy = cy + ddy * i
-            else:
-                sx = cx + ddx * i
-                sy = cy + s
-            if 0 <= sx < COLS and 0 <= sy < ROWS:
-                cells.append({"x": sx, "y": sy})
-
-    if cells:
-        send_to_server({"type": "EXTINGUISH", "cells": cells, "power": 3})
+    send_to_server({"type": "EXTINGUISH_SHAPE", "x": int(ff["x"]),
+                    "y": int(ff["y"]), "dir": ff["dir"], "mode": "spray"})
 
     px = ff["x"] * CELL + CELL // 2
     py = ff["y"] * CELL + CELL // 2
@@ -402,16 +378,12 @@ def do_shoot_spray(ff):
             else:
                 tgx = px + ddx * i * CELL
                 tgy = py + s * CELL
-            water_particles.append({
-                "x": px, "y": py,
-                "vx": (tgx - px) * 0.12 + random.uniform(-1, 1),
-                "vy": (tgy - py) * 0.12 + random.uniform(-1, 1),
-                "tgt_x": tgx + random.uniform(-6, 6),
-                "tgt_y": tgy + random.uniform(-6, 6),
-                "life": 5 + i * 2,
-                "max_life": 5 + i * 2,
-                "sz": random.randint(1, 3),
-            })
+            water_particles.emit(px, py,
+                                 (tgx - px) * 0.12 + random.uniform(-1, 1),
+                                 (tgy - py) * 0.12 + random.uniform(-1, 1),
+                                 tgx + random.uniform(-6, 6),
+                                 tgy + random.uniform(-6, 6),
+                                 5 + i * 2, random.randint(1, 3))
 
 
 def do_shoot(ff):
@@ -421,33 +393,9 @@ def do_shoot(ff):
         do_shoot_stream(ff)
 
 
-def tick_particles():
-    dead = []
-    for p in water_particles:
-        if "tgt_x" in p:
-            p["x"] += p["vx"] + (p["tgt_x"] - p["x"]) * 0.08
-            p["y"] += p["vy"] + (p["tgt_y"] - p["y"]) * 0.08
-            p["vx"] *= 0.92
-            p["vy"] *= 0.92
-        else:
-            p["x"] += p["vx"]
-            p["y"] += p["vy"]
-            p["vy"] += 0.15
-        p["life"] -= 1
-        if p["life"] <= 0:
-            dead.append(p)
-    for p in dead:
-        if p in water_particles:
-            water_particles.remove(p)
-
-
 def draw_particles():
-    for p in water_particles:
-        ratio = max(0.1, p["life"] / max(1, p["max_life"]))
-        r = max(30, int(50 * ratio))
-        g = max(80, int(180 * ratio))
-        pygame.draw.circle(screen, (r, g, 255),
-                           (int(p["x"]), int(p["y"])), p["sz"])
+    for rect in water_particles.draw(screen):
+        mark(rect)
 
 
 def draw_stream_vis(ff):
@@ -461,15 +409,15 @@ def draw_stream_vis(ff):
         ex = sx + ddx * STREAM_LEN * CELL
         ey = sy + ddy * STREAM_LEN * CELL
         for w in range(4, 0, -1):
-            pygame.draw.line(screen, (50, 100 + w * 30, 255),
-                             (int(sx), int(sy)),
-                             (int(ex + random.randint(-3, 3)),
-                              int(ey + random.randint(-3, 3))), w)
+            mark(pygame.draw.line(screen, (50, 100 + w * 30, 255),
+                                  (int(sx), int(sy)),
+                                  (int(ex + random.randint(-3, 3)),
+                                   int(ey + random.randint(-3, 3))), w))
         for _ in range(2):
-            pygame.draw.circle(screen, (100, 200, 255),
-                               (int(ex + random.randint(-8, 8)),
-                                int(ey + random.randint(-8, 8))),
-                               random.randint(2, 5))
+            mark(pygame.draw.circle(screen, (100, 200, 255),
+                                    (int(ex + random.randint(-8, 8)),
+                                     int(ey + random.randint(-8, 8))),
+                                    random.randint(2, 5)))
     else:
         for i in range(1, SPRAY_LEN + 1):
             spread = (i + 1) * CELL
@@ -486,7 +434,7 @@ def draw_stream_vis(ff):
             ss = pygame.Surface((r1.width, r1.height), pygame.SRCALPHA)
             alpha = max(30, 120 - i * 30)
             ss.fill((80, 160, 255, alpha))
-            screen.blit(ss, r1)
+            mark(screen.blit(ss, r1))
 
 
 def draw_combat_hose(ff):
@@ -523,8 +471,8 @@ def draw_combat_hose(ff):
         hc = (200, 170, 60)
 
     if len(points) > 1:
-        pygame.draw.lines(screen, hc, False, points, 3)
-        pygame.draw.lines(screen, (100, 80, 30), False, points, 1)
+        mark(pygame.draw.lines(screen, hc, False, points, 3))
+        mark(pygame.draw.lines(screen, (100, 80, 30), False, points, 1))
 
 
 def draw_supply_hose(tx, ty, sx, sy):
@@ -552,11 +500,11 @@ def draw_supply_hose(tx, ty, sx, sy):
         points.append((int(bx), int(by)))
 
     if len(points) > 1:
-        pygame.draw.lines(screen, (0, 150, 255), False, points, 4)
-        pygame.draw.lines(screen, (0, 80, 180), False, points, 2)
+        mark(pygame.draw.lines(screen, (0, 150, 255), False, points, 4))
+        mark(pygame.draw.lines(screen, (0, 80, 180), False, points, 2))
 
-    pygame.draw.circle(screen, (0, 200, 255), (sx_px, sy_px), 5)
-    pygame.draw.circle(screen, (255, 255, 255), (sx_px, sy_px), 5, 2)
+    mark(pygame.draw.circle(screen, (0, 200, 255), (sx_px, sy_px), 5))
+    mark(pygame.draw.circle(screen, (255, 255, 255), (sx_px, sy_px), 5, 2))
 
 
 def draw_ff_unit(ff, idx):
@@ -565,8 +513,8 @@ def draw_ff_unit(ff, idx):
     is_act = (idx == active_ff_idx)
     d = ff["dir"]
     tkey = d + "_act" if is_act else d
-    tex = ff_dir_textures.get(tkey, ff_dir_textures.get(d, ff_base_texture))
-    screen.blit(tex, (px, py))
+    tex = atlas.ff.get(tkey, atlas.ff["up"])
+    mark(screen.blit(tex, (px, py)))
 
     tw = get_tw(ff["tx"], ff["ty"])
     wr = tw / TRUCK_MAX_WATER
@@ -574,10 +522,10 @@ def draw_ff_unit(ff, idx):
     bh = 3
     bx = px + 4
     by = py - 5
-    pygame.draw.rect(screen, (50, 50, 50), (bx, by, bw, bh))
+    mark(pygame.draw.rect(screen, (50, 50, 50), (bx, by, bw, bh)))
     wc = (0, 200, 255) if is_truck_supplied(ff["tx"], ff["ty"]) else (
         (0, 100, 255) if wr > 0.3 else (255, 50, 50))
-    pygame.draw.rect(screen, wc, (bx, by, int(bw * wr), bh))
+    mark(pygame.draw.rect(screen, wc, (bx, by, int(bw * wr), bh)))
 
     ccx = int(ff["x"] * CELL) + CELL // 2
     ccy = int(ff["y"] * CELL) + CELL // 2
@@ -585,46 +533,23 @@ def draw_ff_unit(ff, idx):
     arx = ccx + adx * 12
     ary = ccy + ady * 12
     ac = (255, 255, 0) if is_act else (150, 150, 150)
-    pygame.draw.line(screen, ac, (ccx, ccy), (arx, ary), 2)
-    pygame.draw.circle(screen, ac, (arx, ary), 3)
+    mark(pygame.draw.line(screen, ac, (ccx, ccy), (arx, ary), 2))
+    mark(pygame.draw.circle(screen, ac, (arx, ary), 3))
 
     mode_label = "S" if ff["mode"] == "stream" else "W"
     mode_col = (100, 200, 255) if ff["mode"] == "stream" else (200, 255, 100)
-    screen.blit(font_tiny.render(mode_label, True, mode_col),
-                (px + CELL + 4, py - 2))
+    mark(screen.blit(font_tiny.render(mode_label, True, mode_col),
+                     (px + CELL + 4, py - 2)))
 
-    screen.blit(font_tiny.render(str(ff["id"]), True, (255, 255, 255)),
-                (px + 6, py + CELL + 6))
+    mark(screen.blit(font_tiny.render(str(ff["id"]), True,
+                                      (255, 255, 255)),
+                     (px + 6, py + CELL + 6)))
 
 
 def draw_grid():
-    for y in range(ROWS):
-        for x in range(COLS):
-            fuel, intensity, ctype = server_grid[y][x]
-            rect = pygame.Rect(x * CELL, y * CELL, CELL, CELL)
-
-            if intensity > 8:
-                sc = pygame.transform.scale(fire_texture, (CELL, CELL))
-                screen.blit(sc, (rect.x + random.randint(-2, 2),
-                                 rect.y - random.randint(2, 5)))
-                continue
-            if intensity > 0:
-                fa = min(255, int(intensity * 28))
-                fs = pygame.Surface((CELL, CELL), pygame.SRCALPHA)
-                fs.fill((255, 80, 0, fa))
-                screen.blit(fs, rect)
-                continue
-
-            tk = ctype.replace("_root", "").replace("_part", "")
-            if tk in TEXTURES:
-                if "road" in ctype or "firecar" in ctype:
-                    if "_root" in ctype:
-                        screen.blit(TEXTURES[tk], rect)
-                else:
-                    screen.blit(TEXTURES[tk], rect)
-            else:
-                if ctype != "empty":
-                    pygame.draw.rect(screen, (40, 40, 45), rect)
+    # Only changed and burning cells are repainted; everything drawn over
+    # the grid goes through mark() so it is cleared next frame
+    renderer.draw(server_grid, view.fire_intensity(), grid_cells)
 
     # Supply hoses
     for (tx, ty), (sx, sy) in supply_hoses.items():
@@ -635,24 +560,24 @@ def draw_grid():
         stx, sty = selected_truck_on_map
         sup = is_truck_supplied(stx, sty)
         bc = (0, 255, 255) if sup else (0, 255, 0)
-        pygame.draw.rect(screen, bc,
-                         pygame.Rect(stx * CELL - 2, sty * CELL - 2,
-                                     CELL + 4, CELL + 4), 2)
+        mark(pygame.draw.rect(screen, bc,
+                              pygame.Rect(stx * CELL - 2, sty * CELL - 2,
+                                          CELL + 4, CELL + 4), 2))
         tw = get_tw(stx, sty)
         ratio = tw / TRUCK_MAX_WATER
         bx = stx * CELL - 10
         by = sty * CELL - 14
-        pygame.draw.rect(screen, (50, 50, 50), (bx, by, 60, 6))
+        mark(pygame.draw.rect(screen, (50, 50, 50), (bx, by, 60, 6)))
         wbc = (0, 200, 255) if sup else (
             (0, 120, 255) if ratio > 0.2 else (255, 50, 50))
-        pygame.draw.rect(screen, wbc, (bx, by, int(60 * ratio), 6))
+        mark(pygame.draw.rect(screen, wbc, (bx, by, int(60 * ratio), 6)))
         if sup:
-            screen.blit(font_tiny.render("INF", True, (0, 255, 255)),
-                        (bx + 20, by - 14))
+            mark(screen.blit(font_tiny.render("INF", True, (0, 255, 255)),
+                             (bx + 20, by - 14)))
         else:
-            screen.blit(font_tiny.render(
+            mark(screen.blit(font_tiny.render(
                 str(int(tw)) + "/" + str(TRUCK_MAX_WATER),
-                True, (200, 200, 200)), (bx, by - 14))
+                True, (200, 200, 200)), (bx, by - 14)))
 
     # Supply hose placement mode cursor
     if supply_hose_mode and selected_truck_on_map is not None:
@@ -668,18 +593,19 @@ def draw_grid():
                 col = (0, 255, 100, 100) if valid else (255, 50, 50, 100)
                 cs = pygame.Surface((CELL, CELL), pygame.SRCALPHA)
                 cs.fill(col)
-                screen.blit(cs, (gx * CELL, gy * CELL))
-                pygame.draw.rect(screen, col[:3],
-                                 (gx * CELL, gy * CELL, CELL, CELL), 2)
+                mark(screen.blit(cs, (gx * CELL, gy * CELL)))
+                mark(pygame.draw.rect(screen, col[:3],
+                                      (gx * CELL, gy * CELL, CELL, CELL), 2))
                 label = "OK" if valid else "X"
-                screen.blit(font_tiny.render(label, True, col[:3]),
-                            (gx * CELL + 2, gy * CELL - 12))
+                mark(screen.blit(font_tiny.render(label, True, col[:3]),
+                                 (gx * CELL + 2, gy * CELL - 12)))
 
             # Show supply hose range circle
             cx = stx * CELL + CELL * 2
             cy = sty * CELL + CELL * 4
             radius = SUPPLY_HOSE_MAX * CELL
-            pygame.draw.circle(screen, (0, 150, 255), (cx, cy), radius, 1)
+            mark(pygame.draw.circle(screen, (0, 150, 255), (cx, cy),
+                                    radius, 1))
 
     # Combat hoses
     for ff in local_firefighters:
@@ -695,12 +621,17 @@ def draw_grid():
     for i, ff in enumerate(local_firefighters):
         draw_ff_unit(ff, i)
 
-    # Server firefighters
+    # Other players' firefighters
+    positions = view.unit_positions()
     for f in firefighters_from_server:
-        fpx = int(f.get("x", 0) * CELL) - 4
-        fpy = int(f.get("y", 0) * CELL) - 4
-        tex = ff_dir_textures.get("up", ff_base_texture)
-        screen.blit(tex, (fpx, fpy))
+        if f.get("owner") == client_id:
+            continue
+        fx, fy = positions.get((f.get("owner"), f.get("id")),
+                               (f.get("x", 0), f.get("y", 0)))
+        fpx = int(fx * CELL) - 4
+        fpy = int(fy * CELL) - 4
+        tex = atlas.ff.get(f.get("dir", "up"), atlas.ff["up"])
+        mark(screen.blit(tex, (fpx, fpy)))
 
 
 truck_btn_rects = []
@@ -852,8 +783,7 @@ def draw_panel():
                 pygame.draw.rect(screen, (0, 255, 100), r, 2,
                                  border_radius=6)
 
-            mt = pygame.transform.scale(
-                ff_dir_textures.get(ff["dir"], ff_base_texture), (18, 18))
+            mt = atlas.ff_thumbs.get(ff["dir"], atlas.ff_thumbs["up"])
             screen.blit(mt, (r.x + 5, r.y + 4))
 
             screen.blit(font_small.render(ff["name"], True, (255, 255, 255)),
@@ -922,12 +852,17 @@ def draw_panel():
 game_running = True
 current_tool = None
 keys_held = set()
+frame_dt = 1.0 / FPS
 
 while game_running:
+    take_state()
     for ev in pygame.event.get():
         if ev.type == pygame.QUIT:
             game_running = False
 
+        elif ev.type in EXPOSE_EVENTS:
+            renderer.invalidate()
+
         elif ev.type == pygame.KEYDOWN:
             keys_held.add(ev.key)
             if ev.key == pygame.K_SPACE:
@@ -973,12 +908,7 @@ while game_running:
                                     "truck": current_tool})
                     current_tool = None
                 else:
-                    placed = find_trucks_on_map()
-                    clicked_tr = None
-                    for t in placed:
-                        if abs(t[0] - gx) <= 2 and abs(t[1] - gy) <= 4:
-                            clicked_tr = t
-                            break
+                    clicked_tr = truck_at(gx, gy)
                     if clicked_tr:
                         selected_truck_on_map = clicked_tr
                     else:
@@ -1011,6 +941,9 @@ while game_running:
                                     "id": nf["id"],
                                     "x": nf["x"],
                                     "y": nf["y"],
+                                    "tx": nf["tx"],
+                                    "ty": nf["ty"],
+                                    "dir": nf["dir"],
                                 })
 
                 if "lay_supply" in button_rects:
@@ -1039,50 +972,28 @@ while game_running:
                             active_ff_idx = i
                             break
 
-    # Movement
-    if 0 <= active_ff_idx < len(local_firefighters):
-        ff = local_firefighters[active_ff_idx]
-        dx = 0.0
-        dy = 0.0
-        moved = False
-
-        if pygame.K_LEFT in keys_held or pygame.K_a in keys_held:
-            dx -= FF_SPEED
-            ff["dir"] = "left"
-            moved = True
-        if pygame.K_RIGHT in keys_held or pygame.K_d in keys_held:
-            dx += FF_SPEED
-            ff["dir"] = "right"
-            moved = True
-        if pygame.K_UP in keys_held or pygame.K_w in keys_held:
-            dy -= FF_SPEED
-            ff["dir"] = "up"
-            moved = True
-        if pygame.K_DOWN in keys_held or pygame.K_s in keys_held:
-            dy += FF_SPEED
-            ff["dir"] = "down"
-            moved = True
-
-        if dx != 0 and dy != 0:
-            dx *= 0.707
-            dy *= 0.707
-
-        nx = ff["x"] + dx
-        ny = ff["y"] + dy
-
-        if can_walk(int(nx), int(ff["y"])) and check_hose(ff, nx, ff["y"]):
-            ff["x"] = max(0.0, min(float(COLS - 1), nx))
-        if can_walk(int(ff["x"]), int(ny)) and check_hose(ff, ff["x"], ny):
-            ff["y"] = max(0.0, min(float(ROWS - 1), ny))
-
-        if moved:
+    # Movement: only changes of the held keys go to the server, which
+    # moves the firefighters itself; ours are predicted meanwhile
+    reconcile_firefighters()
+    held = tuple(k for k in firefighter.KEYS
+                 if any(key in keys_held for key in MOVE_KEYS[k]))
+    for i, ff in enumerate(local_firefighters):
+        ff_keys = held if i == active_ff_idx else ()
+        if sent_keys.get(ff["id"], ((), 0))[0] != ff_keys:
+            input_seq += 1
+            sent_keys[ff["id"]] = (ff_keys, input_seq)
             send_to_server({
-                "type": "MOVE_FIREFIGHTER",
+                "type": "FF_INPUT",
                 "id": ff["id"],
-                "x": ff["x"],
-                "y": ff["y"],
+                "keys": list(ff_keys),
+                "seq": input_seq,
             })
+        if ff_keys:
+            firefighter.step(ff, ff_keys, firefighter.SPEED * frame_dt,
+                             can_walk, COLS, ROWS)
 
+    if 0 <= active_ff_idx < len(local_firefighters):
+        ff = local_firefighters[active_ff_idx]
         if pygame.K_e in keys_held or pygame.K_f in keys_held:
             if ff["cd"] <= 0:
                 do_shoot(ff)
@@ -1095,13 +1006,12 @@ while game_running:
         if ff["shoot_t"] <= 0:
             ff["shooting"] = False
 
-    tick_particles()
+    water_particles.tick()
 
-    screen.fill((5, 10, 20))
     draw_grid()
     draw_panel()
-    pygame.display.flip()
-    clock.tick(FPS)
+    renderer.present([PANEL_RECT])
+    frame_dt = min(0.1, clock.tick(FPS) / 1000.0)
 
 pygame.quit()
 try:
@@ -0,0 +1,150 @@
+import pygame
+
+# Keeps the drawn grid on a cached surface and repaints only what changed.
+# All cell drawing is collected into (surface, dest) sequences and handed
+# to Surface.blits in one call. Each frame:
+#   renderer.draw(grid)       redraws the cells whose (fuel, intensity, type)
+#                             changed and the burning cells, and restores
+#                             what was drawn over the grid last frame
+#   renderer.mark(rect)       for everything drawn over the grid afterwards
+#   renderer.present(rects)   pygame.display.update of the dirty areas plus
+#                             rects, e.g. a panel redrawn every frame
+
+# Window events after which the screen has to be repainted in full
+EXPOSE_EVENTS = tuple(getattr(pygame, name)
+                      for name in ("VIDEOEXPOSE", "WINDOWEXPOSED")
+                      if hasattr(pygame, name))
+
+
+class GridRenderer:
+    def __init__(self, screen, cols, rows, cell, background, cell_look,
+                 fire_look=None):
+        # cell_look(fuel, intensity, ctype) returns the surfaces making up
+        # the still look of a cell, blitted in order at its top left corner
+        # over the background, or None for an animated cell.
+        # fire_look(intensity) returns (surface, (dx, dy)) for an animated
+        # cell, blitted on the screen every frame at its corner plus dx, dy.
+        self.screen = screen
+        self.cols = cols
+        self.rows = rows
+        self.cell = cell
+        self.background = background
+        self.cell_look = cell_look
+        self.fire_look = fire_look
+        self.area = pygame.Rect(0, 0, cols * cell, rows * cell)
+        self.layer = pygame.Surface(self.area.size).convert()
+        self.blank = pygame.Surface((cell, cell)).convert()
+        self.blank.fill(background)
+        self.cells = [[None] * cols for _ in range(rows)]
+        self.animated = {}   # (x, y) -> intensity
+        self.dirty = []
+        self.overlays = []
+        self.restore = []    # drawn over the layer last frame
+        self.overridden = ()  # cells fire_now covered last frame
+        self.full = True
+
+    def invalidate(self):
+        # Repaint everything next frame, e.g. after the window was exposed
+        self.full = True
+
+    def draw(self, grid, fire_now=None, cells=None):
+        # fire_now: {(x, y): intensity} overriding the grid, as drawn by
+        # an interp.Interpolator. cells: the (x, y) of grid that may have
+        # changed since the last draw, when the caller knows them, e.g.
+        # from client_state.ClientState.changes; None checks every cell.
+        fire_now = fire_now or {}
+        if cells is None or self.full:
+            cells = ((x, y) for y in range(self.rows)
+                     for x in range(self.cols))
+        else:
+            cells = set(cells)
+            cells.update(fire_now)
+            cells.update(self.overridden)
+        self.overridden = tuple(fire_now)
+
+        changed = []
+        rebuild = self.full
+        for x, y in cells:
+            c = grid[y][x]
+            if (x, y) in fire_now:
+                key = (c[0], fire_now[(x, y)], c[2])
+            else:
+                key = tuple(c)
+            cached = self.cells[y]
+            old = cached[x]
+            if key == old:
+                continue
+            cached[x] = key
+            changed.append((x, y, key))
+            # Stamps span several cells; redraw them all in grid order
+            if "_root" in key[2] or "_part" in key[2]:
+                rebuild = True
+            elif old is not None and ("_root" in old[2]
+                                      or "_part" in old[2]):
+                rebuild = True
+
+        if rebuild:
+            self.rebuild()
+            self.screen.blit(self.layer, self.area)
+            dirty = [self.area]
+        else:
+            seq = []
+            dirty = self.restore
+            dirty.extend(self.redraw(seq, x, y, key) for x, y, key in changed)
+            self.layer.blits(seq, doreturn=False)
+            layer = self.layer
+            self.screen.blits([(layer, rect, rect) for rect in dirty],
+                              doreturn=False)
+
+        restore = []
+        if self.fire_look is not None and self.animated:
+            cell = self.cell
+            fire_look = self.fire_look
+            seq = []
+            for (x, y), intensity in self.animated.items():
+                surface, (dx, dy) = fire_look(intensity)
+                seq.append((surface, (x * cell + dx, y * cell + dy)))
+            area = self.area
+            restore = [r.clip(area) for r in self.screen.blits(seq)]
+        self.dirty = dirty + restore
+        self.restore = restore
+        self.full = False
+
+    def rebuild(self):
+        self.layer.fill(self.background)
+        self.animated = {}
+        seq = []
+        for y in range(self.rows):
+            for x in range(self.cols):
+                key = self.cells[y][x]
+                if key is not None:
+                    self.redraw(seq, x, y, key, fill=False)
+        self.layer.blits(seq, doreturn=False)
+
+    def redraw(self, seq, x, y, key, fill=True):
+        # Adds the blits for one cell to seq and returns its rect
+        cell = self.cell
+        pos = (x * cell, y * cell)
+        if fill:
+            seq.append((self.blank, pos))
+        fuel, intensity, ctype = key
+        look = self.cell_look(fuel, intensity, ctype)
+        if look is None:
+            self.animated[(x, y)] = intensity
+        else:
+            self.animated.pop((x, y), None)
+            seq.extend((surface, pos) for surface in look)
+        return pygame.Rect(pos, (cell, cell))
+
+    def mark(self, rect):
+        # rect: the area something was drawn over the grid this frame;
+        # pygame.draw functions and Surface.blit return it
+        if rect is not None:
+            self.overlays.append(rect)
+        return rect
+
+    def present(self, rects=()):
+        overlays = [r.clip(self.area) for r in self.overlays]
+        pygame.display.update(self.dirty + self.overlays + list(rects))
+        self.restore.extend(r for r in overlays if r.width and r.height)
+        self.overlays = []
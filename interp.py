@@ -0,0 +1,80 @@
+import time
+
+# Longest gap between snapshots that is still smoothed over; after a longer
+# stall the next snapshot is shown as it arrives
+MAX_INTERVAL = 0.5
+
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+
+class Interpolator:
+    # Draws remote units and fire intensity between the two most recent
+    # snapshots: after a snapshot arrives, values move from where they were
+    # drawn to the new ones over the time the last two snapshots were
+    # apart. Fed from the network thread, read by the render loop.
+
+    def __init__(self):
+        self.time = None
+        self.interval = 0.0
+        self.units = {}   # key -> ((x, y) drawn before, (x, y) in snapshot)
+        self.fire = {}    # (x, y) -> (intensity drawn before, in snapshot)
+
+    def alpha(self, now):
+        if self.time is None or self.interval <= 0:
+            return 1.0
+        return min(1.0, (now - self.time) / self.interval)
+
+    def push(self, units, changed, now=None):
+        # units: {key: (x, y)} from the snapshot; changed: (x, y, old, new)
+        # intensity changes it made to the grid, None for a keyframe
+        if now is None:
+            now = time.monotonic()
+        t = self.alpha(now)
+        old_units = self.units
+        old_fire = self.fire
+
+        units_ = {}
+        for key, pos in units.items():
+            was = old_units.get(key)
+            if was is not None:
+                start, end = was
+                units_[key] = ((lerp(start[0], end[0], t),
+                                lerp(start[1], end[1], t)), pos)
+            else:
+                units_[key] = (pos, pos)
+
+        fire = {}
+        if changed is None:
+            changed = ()
+        elif t < 1.0:
+            # Cells this snapshot left alone finish their own move
+            for cell, (start, end) in old_fire.items():
+                fire[cell] = (lerp(start, end, t), end)
+        for x, y, old, new in changed:
+            was = old_fire.get((x, y))
+            if was is not None:
+                old = lerp(was[0], was[1], t)
+            if old != new:
+                fire[(x, y)] = (old, new)
+            else:
+                fire.pop((x, y), None)
+
+        if self.time is not None:
+            self.interval = min(MAX_INTERVAL, now - self.time)
+        self.time = now
+        self.units = units_
+        self.fire = fire
+
+    def unit_positions(self, now=None):
+        t = self.alpha(time.monotonic() if now is None else now)
+        return {key: (lerp(start[0], end[0], t), lerp(start[1], end[1], t))
+                for key, (start, end) in self.units.items()}
+
+    def fire_intensity(self, now=None):
+        # {(x, y): intensity to draw} for the cells still changing
+        t = self.alpha(time.monotonic() if now is None else now)
+        if t >= 1.0:
+            return {}
+        return {cell: lerp(a, b, t) for cell, (a, b) in self.fire.items()}
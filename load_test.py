@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+import metrics
+import wire_format
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if load_dotenv is not None:
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("SERVER_PORT", "5555"))
+SERVER_PASSWORD = os.getenv("SERVER_PASSWORD", "my_super_password")
+PLAYER_ROLES = ("rtp", "nsh", "br", "dispatcher")
+COLS = 60
+ROWS = 44
+MAP = os.path.join(BASE_DIR, "maps", "l7.json")
+DEFAULT_MIX = "click=2,extinguish=2,shape=2,move=10"
+BRUSH_TOOLS = ("grass", "grass", "tree", "ignite")
+
+
+def frame(data):
+    raw = json.dumps(data).encode("utf-8")
+    return struct.pack(">I", len(raw)) + raw
+
+
+def is_state(body):
+    if body[0] == wire_format.MAGIC:
+        return True
+    return body.startswith(b'{"type": "STATE_')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Stage:
+    # Everything measured while one set of clients was connected
+
+    def __init__(self, players, spectators):
+        self.players = players
+        self.spectators = spectators
+        self.started = time.monotonic()
+        self.ended = None
+        self.gap = metrics.Stat(window=100000)
+        self.lag = metrics.Stat(window=100000)
+        self.received = {}     # client index -> [messages, states, bytes]
+        self.sent = 0
+        self.disconnects = 0
+        self.refused = 0
+
+    def seconds(self):
+        return (self.ended or time.monotonic()) - self.started
+
+    def report(self):
+        secs = self.seconds()
+        counts = list(self.received.values()) or [[0, 0, 0]]
+        state_rates = sorted(c[1] / secs for c in counts)
+        byte_rates = sorted(c[2] / secs for c in counts)
+        return {
+            "players": self.players,
+            "spectators": self.spectators,
+            "seconds": secs,
+            "commands_per_sec": self.sent / secs,
+            "states_per_client_sec": {
+                "min": state_rates[0],
+                "p50": state_rates[len(state_rates) // 2],
+                "max": state_rates[-1],
+            },
+            "recv_kb_per_client_sec": {
+                "min": byte_rates[0] / 1024.0,
+                "p50": byte_rates[len(byte_rates) // 2] / 1024.0,
+                "total": sum(byte_rates) / 1024.0,
+            },
+            "state_gap_ms": self.gap.summary(1000.0),
+            "move_lag_ms": self.lag.summary(1000.0),
+            "disconnects": self.disconnects,
+            "refused": self.refused,
+        }
+
+
+class LoadClient:
+    def __init__(self, tool, index, role):
+        self.tool = tool
+        self.index = index
+        self.role = role
+        self.player = role in PLAYER_ROLES
+        self.rng = random.Random(index)
+        self.last_state = None
+        self.ff = [self.rng.randrange(COLS), self.rng.randrange(ROWS)]
+        self.pending = {}      # (x, y) -> time the move was sent
+        self.closed = False
+
+    async def connect(self):
+        args = self.tool.args
+        self.reader, self.writer = await asyncio.open_connection(
+            args.host, args.port)
+        self.writer.write(frame({
+            "type": "AUTH", "password": args.password, "role": self.role,
+            "wire": [args.wire],
+        }))
+        try:
+            reply = json.loads((await self.read()).decode("utf-8"))
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("closed by server")
+        if reply.get("type") != "AUTH_OK":
+            raise ConnectionError(reply.get("reason", "auth failed"))
+        self.owner = reply.get("client_id")
+
+    async def read(self):
+        head = await self.reader.readexactly(4)
+        return await self.reader.readexactly(struct.unpack(">I", head)[0])
+
+    async def receive(self):
+        try:
+            while True:
+                body = await self.read()
+                now = time.monotonic()
+                stage = self.tool.stage
+                counts = stage.received.setdefault(self.index, [0, 0, 0])
+                counts[0] += 1
+                counts[2] += len(body) + 4
+                if not is_state(body):
+                    continue
+                counts[1] += 1
+                if self.last_state is not None:
+                    stage.gap.add(now - self.last_state)
+                self.last_state = now
+                if self.pending:
+                    self.check_moves(body, now, stage)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            if not self.tool.stopping:
+                self.tool.stage.disconnects += 1
+        finally:
+            self.closed = True
+
+    def check_moves(self, body, now, stage):
+        fields = wire_format.decode_header(body)
+        for ff in fields.get("firefighters", ()):
+            if ff.get("owner") == self.owner and ff.get("id") == self.index:
+                sent = self.pending.get((ff["x"], ff["y"]))
+                if sent is not None:
+                    stage.lag.add(now - sent)
+                    # Older moves were overtaken by this one
+                    self.pending = {k: t for k, t in self.pending.items()
+                                    if t > sent}
+
+    def command(self):
+        kind = self.rng.choices(self.tool.kinds, self.tool.weights)[0]
+        x, y = self.rng.randrange(COLS), self.rng.randrange(ROWS)
+        if kind == "click":
+            return {"type": "CLICK", "x": x, "y": y,
+                    "tool": self.rng.choice(BRUSH_TOOLS)}
+        if kind == "extinguish":
+            return {"type": "EXTINGUISH", "power": 3,
+                    "cells": [{"x": x + dx, "y": y + dy}
+                              for dx in range(-1, 2) for dy in range(-1, 2)]}
+        if kind == "shape":
+            return {"type": "EXTINGUISH_SHAPE", "x": x, "y": y,
+                    "dir": self.rng.choice(("up", "down", "left", "right")),
+                    "mode": self.rng.choice(("stream", "spray"))}
+        ff = self.ff
+        ff[0] = min(COLS - 1, max(0, ff[0] + self.rng.choice((-1, 1))))
+        ff[1] = min(ROWS - 1, max(0, ff[1] + self.rng.choice((-1, 1))))
+        self.pending[tuple(ff)] = time.monotonic()
+        return {"type": "MOVE_FIREFIGHTER", "id": self.index,
+                "x": ff[0], "y": ff[1]}
+
+    async def send_commands(self):
+        rate = self.tool.args.rate
+        if rate <= 0:
+            return
+        self.writer.write(frame({"type": "SPAWN_FIREFIGHTER", "id": self.index,
+                                 "x": self.ff[0], "y": self.ff[1]}))
+        interval = 1.0 / rate
+        next_send = time.monotonic() + self.rng.random() * interval
+        while not self.closed and not self.tool.stopping:
+            await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+            next_send += interval
+            self.writer.write(frame(self.command()))
+            self.tool.stage.sent += 1
+            try:
+                await self.writer.drain()
+            except (ConnectionError, OSError):
+                return
+
+    def close(self):
+        self.writer.close()
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        mix = parse_mix(args.mix)
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.clients = []
+        self.tasks = []
+        self.stopping = False
+        self.stage = Stage(0, 0)
+
+    async def add_client(self, role):
+        client = LoadClient(self, len(self.clients), role)
+        await client.connect()
+        self.clients.append(client)
+        self.tasks.append(asyncio.ensure_future(client.receive()))
+        if client.player:
+            self.tasks.append(asyncio.ensure_future(client.send_commands()))
+        return client
+
+    def count(self, player):
+        return sum(1 for c in self.clients
+                   if c.player == player and not c.closed)
+
+    async def prepare(self):
+        # The first player loads a map and starts the simulation
+        host = self.clients[0]
+        with open(MAP, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        host.writer.write(frame({"type": "LOAD_MAP",
+                                 "grid": data.get("grid", data)}))
+        host.writer.write(frame({"type": "SPACE"}))
+        await host.writer.drain()
+
+    async def run(self):
+        args = self.args
+        for n in range(args.players):
+            await self.add_client(PLAYER_ROLES[n % len(PLAYER_ROLES)])
+        if args.start and self.clients:
+            await self.prepare()
+
+        stages = []
+        for spectators in args.ramp:
+            refused = 0
+            while len(self.clients) - args.players < spectators:
+                try:
+                    await self.add_client("spectator")
+                except (ConnectionError, OSError) as e:
+                    refused = spectators - len(self.clients) + args.players
+                    print("[!] {} spectators refused: {}".format(refused, e))
+                    break
+            # Let the new connections settle before measuring
+            await asyncio.sleep(args.warmup)
+            self.stage = Stage(self.count(True), self.count(False))
+            self.stage.refused = refused
+            await asyncio.sleep(args.duration)
+            self.stage.ended = time.monotonic()
+            stages.append(self.stage.report())
+            print_stage(stages[-1])
+
+        self.stopping = True
+        for client in self.clients:
+            client.close()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        return stages
+
+
+def print_stage(s):
+    gap = s["state_gap_ms"]
+    lag = s["move_lag_ms"]
+    print("{:>3} players {:>4} spectators | states/s per client p50={:.1f} "
+          "min={:.1f} | gap p95={:.1f} max={:.1f} ms | move lag p50={:.1f} "
+          "p95={:.1f} ms | {:.0f} KB/s total | drops {} refused {}".format(
+              s["players"], s["spectators"],
+              s["states_per_client_sec"]["p50"],
+              s["states_per_client_sec"]["min"],
+              gap.get("p95", 0), gap.get("max", 0),
+              lag.get("p50", 0), lag.get("p95", 0),
+              s["recv_kb_per_client_sec"]["total"], s["disconnects"],
+              s["refused"]))
+
+
+def saturation(stages, lag_limit):
+    # First stage where the server turned clients away or dropped them,
+    # clients fell behind the rate of the lightest stage, or moves took too
+    # long to show up
+    if not stages:
+        return None, ""
+    base = stages[0]["states_per_client_sec"]["p50"]
+    for s in stages:
+        if s["refused"]:
+            return s, "{} connections refused".format(s["refused"])
+        if s["disconnects"]:
+            return s, "{} clients dropped".format(s["disconnects"])
+        if s["states_per_client_sec"]["min"] < base * 0.9:
+            return s, "slowest client got {:.1f} states/s of {:.1f}".format(
+                s["states_per_client_sec"]["min"], base)
+        if s["move_lag_ms"].get("p95", 0) > lag_limit:
+            return s, "move lag p95 {:.0f} ms".format(
+                s["move_lag_ms"]["p95"])
+    return None, ""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive a running server with many scripted clients")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--password", default=SERVER_PASSWORD)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--ramp", default="0,25,50,100",
+                        help="spectator counts, one measuring stage each")
+    parser.add_argument("--rate", type=float, default=30.0,
+                        help="commands per second per player")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="command weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--wire", default=wire_format.WIRE_BIN,
+                        choices=(wire_format.WIRE_BIN, wire_format.WIRE_JSON))
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--lag-limit", type=float, default=250.0,
+                        help="move lag p95 in ms counted as saturated")
+    parser.add_argument("--no-start", dest="start", action="store_false",
+                        help="do not load a map and start the simulation")
+    parser.add_argument("--out", default=None, help="write stages as JSON")
+    args = parser.parse_args()
+    args.ramp = [int(v) for v in args.ramp.split(",") if v.strip()]
+
+    try:
+        stages = asyncio.run(LoadTest(args).run())
+    except (ConnectionError, OSError) as e:
+        print("Cannot connect to {}:{}: {}".format(args.host, args.port, e))
+        return 2
+
+    stage, reason = saturation(stages, args.lag_limit)
+    if stage is None:
+        print("No saturation up to {} players and {} spectators".format(
+            stages[-1]["players"], stages[-1]["spectators"]))
+    else:
+        print("Saturates at {} players and {} spectators: {}".format(
+            stage["players"], stage["spectators"], reason))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "stages": stages}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import bisect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+WINDOW = 512
+# Histogram bucket upper bounds in seconds (0.05 ms .. 1 s, then overflow)
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 1.0)
+
+_stats = {}
+_counters = {}
+_stats_lock = threading.Lock()
+
+
+class Stat:
+    # Running totals, a histogram over BUCKETS and a window of recent
+    # samples for percentiles. Readers may run on another thread (the stats
+    # endpoint), so updates and copies take the stat's own lock.
+
+    def __init__(self, window=WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+            self.recent.append(value)
+            self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+
+    def summary(self, scale=1.0):
+        with self.lock:
+            recent = sorted(self.recent)
+            count, total, top = self.count, self.total, self.max
+        if not recent:
+            return {"count": count}
+        return {
+            "count": count,
+            "avg": total / count * scale,
+            "max": top * scale,
+            "p50": recent[len(recent) // 2] * scale,
+            "p95": recent[min(len(recent) - 1, int(len(recent) * 0.95))] * scale,
+        }
+
+    def histogram(self, scale=1.0):
+        # [[upper bound, count], ...]; the last bound is None (overflow)
+        with self.lock:
+            buckets = list(self.buckets)
+        bounds = [b * scale for b in BUCKETS] + [None]
+        return [[b, n] for b, n in zip(bounds, buckets)]
+
+
+def stat(name):
+    s = _stats.get(name)
+    if s is None:
+        with _stats_lock:
+            s = _stats.setdefault(name, Stat())
+    return s
+
+
+def record(name, value):
+    stat(name).add(value)
+
+
+def incr(name, n=1):
+    with _stats_lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def counters():
+    with _stats_lock:
+        return dict(_counters)
+
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stat(name).add(time.perf_counter() - start)
+
+
+def stats():
+    with _stats_lock:
+        return sorted(_stats.items())
+
+
+def report(histograms=False):
+    # Timings are stored in seconds and reported in milliseconds
+    out = {}
+    for name, s in stats():
+        out[name] = s.summary(1000.0)
+        if histograms:
+            out[name]["hist_ms"] = s.histogram(1000.0)
+    return out
+
+
+def format_report():
+    lines = []
+    for name, s in report().items():
+        if "avg" not in s:
+            continue
+        lines.append("  {:<18} n={:<7} avg={:.3f} p95={:.3f} max={:.3f} ms"
+                     .format(name, s["count"], s["avg"], s["p95"], s["max"]))
+    for name, value in sorted(counters().items()):
+        lines.append("  {:<18} {}".format(name, value))
+    return "\n".join(lines)
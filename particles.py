@@ -0,0 +1,157 @@
+from array import array
+
+import pygame
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Water droplets for the sandbox, kept in a fixed-capacity pool of parallel
+# arrays. The live droplets are always the first count entries: a dead one
+# is replaced by the last live one. With numpy the arrays are stepped as
+# whole vectors, otherwise one droplet at a time.
+
+CAPACITY = 4096
+SEEK = 0.08     # share of the way to its target a droplet covers per tick
+DRAG = 0.92
+MAX_SIZE = 4    # droplet radius in pixels
+SHADES = 8      # colours from a fading droplet to a fresh one
+FIELDS = ("x", "y", "vx", "vy", "tx", "ty", "life", "max_life", "size")
+
+
+def droplet_color(ratio):
+    ratio = max(0.1, ratio)
+    return (max(30, int(50 * ratio)), max(80, int(180 * ratio)), 255)
+
+
+def droplet_sprites():
+    # sprites[size][shade]; call after pygame.display.set_mode
+    sprites = [[]]
+    for size in range(1, MAX_SIZE + 1):
+        shades = []
+        for shade in range(SHADES):
+            sprite = pygame.Surface((size * 2 + 1, size * 2 + 1),
+                                    pygame.SRCALPHA)
+            pygame.draw.circle(sprite, droplet_color(shade / (SHADES - 1)),
+                               (size, size), size)
+            shades.append(sprite.convert_alpha())
+        sprites.append(shades)
+    return sprites
+
+
+class ParticlePool:
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        for name in FIELDS:
+            setattr(self, name, array("d", bytes(8 * capacity)))
+        # numpy views of the same memory; the arrays never resize
+        self.views = None
+        if np is not None:
+            self.views = [np.frombuffer(getattr(self, name))
+                          for name in FIELDS]
+        self.sprites = None
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def emit(self, x, y, vx, vy, tx, ty, life, size):
+        # Returns False when the pool is full and the droplet was dropped
+        n = self.count
+        if n >= self.capacity:
+            return False
+        self.x[n] = x
+        self.y[n] = y
+        self.vx[n] = vx
+        self.vy[n] = vy
+        self.tx[n] = tx
+        self.ty[n] = ty
+        self.life[n] = life
+        self.max_life[n] = life
+        self.size[n] = max(1, min(MAX_SIZE, size))
+        self.count = n + 1
+        return True
+
+    def tick(self):
+        # Moves every droplet toward its target and drops the dead ones
+        if self.views is not None:
+            self.tick_numpy()
+        else:
+            self.tick_python()
+
+    def tick_numpy(self):
+        n = self.count
+        if not n:
+            return
+        x, y, vx, vy, tx, ty, life = (v[:n] for v in self.views[:7])
+        x += vx + (tx - x) * SEEK
+        y += vy + (ty - y) * SEEK
+        vx *= DRAG
+        vy *= DRAG
+        life -= 1
+        dead = np.flatnonzero(life <= 0)
+        if not len(dead):
+            return
+        # Live droplets from the tail fill the holes the dead left below
+        # the new count
+        k = n - len(dead)
+        holes = dead[dead < k]
+        tail = np.arange(k, n)
+        movers = tail[life[k:] > 0]
+        for v in self.views:
+            v[holes] = v[movers]
+        self.count = k
+
+    def tick_python(self):
+        x, y, vx, vy, tx, ty, life = (getattr(self, name)
+                                      for name in FIELDS[:7])
+        fields = [getattr(self, name) for name in FIELDS]
+        n = self.count
+        i = 0
+        while i < n:
+            life[i] -= 1
+            if life[i] <= 0:
+                # Take the last droplet; it is stepped on the next pass
+                n -= 1
+                for field in fields:
+                    field[i] = field[n]
+                continue
+            x[i] += vx[i] + (tx[i] - x[i]) * SEEK
+            y[i] += vy[i] + (ty[i] - y[i]) * SEEK
+            vx[i] *= DRAG
+            vy[i] *= DRAG
+            i += 1
+        self.count = n
+
+    def draw(self, surface):
+        # Blits every droplet in one Surface.blits call; returns the rects
+        # drawn
+        if self.sprites is None:
+            self.sprites = droplet_sprites()
+        sprites = self.sprites
+        n = self.count
+        top = SHADES - 1
+        if self.views is not None:
+            x, y, _, _, _, _, life, max_life, size = (v[:n]
+                                                      for v in self.views)
+            size = size.astype(int)
+            ratio = np.maximum(0.1, life / np.maximum(1, max_life))
+            shade = (ratio * top + 0.5).astype(int)
+            seq = [(sprites[s][h], (px, py)) for s, h, px, py in zip(
+                size.tolist(), shade.tolist(),
+                (x.astype(int) - size).tolist(),
+                (y.astype(int) - size).tolist())]
+        else:
+            seq = []
+            for x, y, life, max_life, size in zip(
+                    self.x[:n], self.y[:n], self.life[:n],
+                    self.max_life[:n], self.size[:n]):
+                size = int(size)
+                shade = int(max(0.1, life / max(1, max_life)) * top + 0.5)
+                seq.append((sprites[size][shade],
+                            (int(x) - size, int(y) - size)))
+        return surface.blits(seq)
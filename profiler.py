@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+
+# Innermost frames of threads parked on a socket, lock or queue; such
+# samples are only counted as idle
+IDLE = frozenset(("wait", "select", "recv_exact", "accept", "_worker",
+                  "serve_forever", "write_loop", "_wait_for_tstate_lock"))
+
+
+class SamplingProfiler:
+    # Samples the stack of every other thread hz times a second. "self"
+    # counts the line each thread was on, so time spent in C calls such as
+    # time.sleep shows up as the line making the call; "total" counts every
+    # function on the stack. Cheap enough to leave on for a whole exercise.
+
+    def __init__(self, hz=100):
+        self.hz = hz
+        self.samples = 0
+        self.idle = 0
+        self.self_counts = {}
+        self.total_counts = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, hz=None):
+        if hz:
+            self.hz = hz
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        thread = self.thread
+        if thread is None:
+            return
+        self.stop_event.set()
+        thread.join()
+        self.thread = None
+
+    def reset(self):
+        with self.lock:
+            self.samples = 0
+            self.idle = 0
+            self.self_counts = {}
+            self.total_counts = {}
+
+    def run(self):
+        own = threading.get_ident()
+        interval = 1.0 / self.hz
+        while not self.stop_event.wait(interval):
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, f in frames.items():
+                    if ident == own:
+                        continue
+                    self.sample(f)
+
+    def sample(self, f):
+        if f.f_code.co_name in IDLE:
+            self.idle += 1
+            return
+        self.samples += 1
+        leaf = "{}:{}".format(label(f.f_code), f.f_lineno)
+        self.self_counts[leaf] = self.self_counts.get(leaf, 0) + 1
+        seen = set()
+        while f is not None:
+            name = label(f.f_code)
+            if name not in seen:
+                seen.add(name)
+                self.total_counts[name] = self.total_counts.get(name, 0) + 1
+            f = f.f_back
+
+    def top(self, n=20):
+        # Lines with the most self samples and the functions with the most
+        # total samples, as shares of busy samples
+        with self.lock:
+            samples = self.samples or 1
+            lines = sorted(self.self_counts.items(), key=lambda kv: -kv[1])
+            funcs = sorted(self.total_counts.items(), key=lambda kv: -kv[1])
+            return {
+                "lines": [[name, count / samples] for name, count in lines[:n]],
+                "funcs": [[name, count / samples] for name, count in funcs[:n]],
+            }
+
+
+def label(code):
+    return "{} {}".format(os.path.basename(code.co_filename), code.co_name)
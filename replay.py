@@ -0,0 +1,118 @@
+import argparse
+import os
+import sys
+import time
+
+import metrics
+from command_log import grid_digest, read_log
+
+
+class LoggedClient:
+    # Stands in for the ClientConn a command came from; replies are dropped
+
+    def __init__(self, addr, role):
+        self.addr = addr
+        self.role = role
+        self.closed = False
+
+    def send_msg(self, data):
+        pass
+
+
+def load_server(header, engine):
+    # server reads its seed and engine from the environment at import time
+    os.environ["SIM_SEED"] = str(header["seed"])
+    os.environ["FIRE_ENGINE"] = engine
+    os.environ["COMMAND_LOG_DIR"] = ""
+    import server
+    if (server.COLS, server.ROWS) != (header["cols"], header["rows"]):
+        raise ValueError("log is for a {}x{} grid, server uses {}x{}".format(
+            header["cols"], header["rows"], server.COLS, server.ROWS))
+    server.UPDATE_EVERY = header["update_every"]
+    # Firefighters move SPEED / TICK_HZ cells a tick; older logs lack it
+    server.TICK_HZ = header.get("tick_hz", server.TICK_HZ)
+    if (list(server.WIND) != header["wind"]
+            or server.WIND_STRENGTH != header["wind_strength"]):
+        server.set_wind(header["wind"], header["wind_strength"])
+    return server
+
+
+def replay(server, entries, check):
+    expected = {e["tick"]: e["digest"] for e in entries if "digest" in e}
+    clients = {}
+    result = {"ticks": 0, "steps": 0, "checked": 0, "mismatches": []}
+
+    def run_tick():
+        server.apply_water()
+        server.move_firefighters()
+        if server.fire_due():
+            with metrics.timer("fire_step"):
+                server.update_fire()
+            result["steps"] += 1
+            digest = expected.get(server.frame)
+            if check and digest is not None:
+                result["checked"] += 1
+                if grid_digest(server.grid) != digest:
+                    result["mismatches"].append(server.frame)
+        server.frame += 1
+        result["ticks"] += 1
+
+    last_tick = 0
+    for entry in entries:
+        tick = entry["tick"]
+        last_tick = max(last_tick, tick)
+        while server.frame < tick:
+            run_tick()
+        if "cmd" in entry:
+            key = (entry["client"], entry["role"])
+            client = clients.get(key)
+            if client is None:
+                client = clients[key] = LoggedClient(*key)
+            server.handle_command(client, entry["cmd"])
+        elif entry.get("leave"):
+            server.drop_firefighters(entry["client"])
+    while server.frame <= last_tick:
+        run_tick()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-run a recorded session headless and check it "
+                    "against the digests in its log")
+    parser.add_argument("log")
+    parser.add_argument("--engine", default=None,
+                        help="fire engine to use (default: the logged one; "
+                             "digests are only checked with the logged one)")
+    args = parser.parse_args()
+
+    header, entries = read_log(args.log)
+    engine = args.engine or header["engine"]
+    server = load_server(header, engine)
+    check = engine == header["engine"]
+
+    started = time.perf_counter()
+    result = replay(server, entries, check)
+    elapsed = time.perf_counter() - started
+
+    print("Replayed {} ticks, {} fire steps in {:.3f}s (seed {}, engine {})"
+          .format(result["ticks"], result["steps"], elapsed,
+                  header["seed"], server.engine_name()))
+    print(metrics.format_report())
+    if server.band_engine is not None:
+        server.band_engine.close()
+    if not check:
+        print("Digests not checked: log was recorded with engine {}".format(
+            header["engine"]))
+        return 0
+    mismatches = result["mismatches"]
+    if mismatches:
+        print("MISMATCH at {} of {} checked steps, first at tick {}".format(
+            len(mismatches), result["checked"], mismatches[0]))
+        return 1
+    print("REPLAY OK: {} steps match".format(result["checked"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
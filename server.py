@@ -6,6 +6,24 @@ import time
 import random
 import math
 import os
+import sys
+import atexit
+from array import array
+
+import fire_numpy
+from command_log import CommandLog
+from fire_bands import BandFireEngine
+from fire_engine import FireEngine
+from client_conn import ClientConn, encode_msg
+import metrics
+import state_sync
+import stats_http
+import water
+import firefighter
+import wire_format
+from profiler import SamplingProfiler
+from tick_scheduler import TickScheduler
+from sim_grid import Grid, UNBURNED, BURNING, SMOLDERING, BURNED
 
 try:
     from dotenv import load_dotenv
@@ -20,11 +38,35 @@ HOST = os.getenv("SERVER_HOST", "127.0.0.1")
 PORT = int(os.getenv("SERVER_PORT", "5555"))
 MAX_PLAYERS = int(os.getenv("MAX_PLAYERS", "6"))
 SERVER_PASSWORD = os.getenv("SERVER_PASSWORD", "my_super_password")
+METRICS_LOG_SEC = float(os.getenv("METRICS_LOG_SEC", "0"))
+OUTBOX_LIMIT = int(os.getenv("OUTBOX_LIMIT", "256"))
+# Disconnect clients whose outbox has not drained since their state was
+# first coalesced this long ago; 0 = never
+SLOW_CLIENT_SEC = float(os.getenv("SLOW_CLIENT_SEC", "10"))
+# Local HTTP stats endpoint, off when STATS_PORT is 0
+STATS_HOST = os.getenv("STATS_HOST", "127.0.0.1")
+STATS_PORT = int(os.getenv("STATS_PORT", "0"))
+# Period of STATS messages to subscribed clients
+STATS_SEC = float(os.getenv("STATS_SEC", "1"))
+# Start the sampling profiler at launch at this rate; 0 = off
+PROFILE_HZ = int(os.getenv("PROFILE_HZ", "0"))
 
 COLS = 60
 ROWS = 44
-UPDATE_EVERY = 60
+UPDATE_EVERY = 60  # simulation ticks per fire step
+TICK_HZ = float(os.getenv("TICK_HZ", "33"))
+SEND_HZ = float(os.getenv("SEND_HZ", str(TICK_HZ)))
+MAX_CATCH_UP = int(os.getenv("MAX_CATCH_UP", "5"))
 SUPPLY_HOSE_MAX = 15
+FIRE_ENGINE = os.getenv("FIRE_ENGINE", "python").lower()
+# Worker processes for FIRE_ENGINE=bands; 0 = one per CPU
+FIRE_WORKERS = int(os.getenv("FIRE_WORKERS", "0"))
+SERVER_MODE = os.getenv("SERVER_MODE", "threads").lower()
+# Every random draw in a session comes from one generator seeded here, so a
+# session replays exactly from its seed and command log
+SIM_SEED = int(os.getenv("SIM_SEED") or random.randrange(2 ** 32))
+# Directory for session command logs; empty disables logging
+COMMAND_LOG_DIR = os.getenv("COMMAND_LOG_DIR", os.path.join(BASE_DIR, "logs"))
 
 TRUCKS = [
     "АЦ-40", "АЦ-3,2-40/4", "АЦ-6,0-40", "ПНС-110",
@@ -32,32 +74,31 @@ TRUCKS = [
 ]
 
 
-class Cell:
-    def __init__(self):
-        self.fuel = 0
-        self.intensity = 0
-        self.type = "empty"
-        self.heat = 0.0
-        self.moisture = 22.0
-        self.state = "unburned"
-
-
-grid = [[Cell() for _ in range(COLS)] for _ in range(ROWS)]
 edit_mode = True
 running_sim = False
 frame = 0
 available_trucks = []
-server_firefighters = []
+# (owner, id) -> {"id", "x", "y", "owner", "dir", "tx", "ty", "keys", "seq"};
+# the server moves them each tick from the keys held by their owner
+server_firefighters = {}
+FF_FIELDS = ("id", "x", "y", "owner", "dir", "seq")
 supply_connections = []  # [[tx, ty, sx, sy], ...]
 
-clients = []
-client_roles = {}
+clients = []  # ClientConn
 grid_lock = threading.Lock()
+# Guards the publisher and the order of state packets; never taken while
+# grid_lock is held
+publish_lock = threading.Lock()
 
-ALLOWED_ROLES = {"rtp", "nsh", "br", "dispatcher"}
+SPECTATOR_ROLES = {"spectator"}
+ALLOWED_ROLES = {"rtp", "nsh", "br", "dispatcher"} | SPECTATOR_ROLES
 
 WIND = (1, -3)
 WIND_STRENGTH = 2.15
+# SET_WIND is clamped to the range the fuel table was tuned for: the spread
+# bias grows with wind component x strength
+WIND_MAX = 3.0
+WIND_STRENGTH_MAX = 5.0
 
 FUEL_PROPERTIES = {
     "grass":          {"ign_temp": 42,   "burn_rate": 3.8,  "heat_gen": 58,   "spread_mult": 1.85},
@@ -75,49 +116,91 @@ FUEL_PROPERTIES = {
     "road_turn_root": {"ign_temp": 9999, "burn_rate": 0,    "heat_gen": 0,    "spread_mult": 0},
     "road_turn_part": {"ign_temp": 9999, "burn_rate": 0,    "heat_gen": 0,    "spread_mult": 0},
 }
+STAMP_TYPES = ("road_straight_root", "road_straight_part")
+
+grid = Grid(COLS, ROWS, list(FUEL_PROPERTIES) + list(STAMP_TYPES))
+publisher = state_sync.StatePublisher()
+rng = random.Random(SIM_SEED)
+command_log = None
+
+# Extinguish power per cell waiting for the next tick; water_touched lists
+# the cells with water in arrival order, water_tick is the tick it lands on
+WATER_COMMANDS = ("EXTINGUISH", "EXTINGUISH_SHAPE")
+# Command types handle_command knows; others are counted as cmd_unknown
+COMMAND_TYPES = WATER_COMMANDS + (
+    "CLICK", "FILL_BASE", "SPACE", "R", "LOAD_MAP", "HOST_READY",
+    "DEPLOY_TRUCK", "PLACE_TRUCK", "SPAWN_FIREFIGHTER", "FF_INPUT",
+    "MOVE_FIREFIGHTER", "MOVE_UNIT", "SET_WIND", "LAY_SUPPLY_HOSE",
+    "DISCONNECT_SUPPLY")
+water_lock = threading.Lock()
+water_map = array("d", [0.0]) * grid.size
+water_touched = []
+water_tick = 0
+profiler = SamplingProfiler()
+started_at = time.time()
+
+python_engine = FireEngine(FUEL_PROPERTIES, WIND, WIND_STRENGTH, rng)
+numpy_engine = None
+if FIRE_ENGINE == "numpy":
+    if fire_numpy.available():
+        numpy_engine = fire_numpy.NumpyFireEngine(
+            FUEL_PROPERTIES, WIND, WIND_STRENGTH, seed=SIM_SEED)
+    else:
+        print("[!] FIRE_ENGINE=numpy but numpy is not installed, "
+              "using the python engine")
+band_engine = None
+if FIRE_ENGINE == "bands":
+    band_engine = BandFireEngine(FUEL_PROPERTIES, WIND, WIND_STRENGTH,
+                                 FIRE_WORKERS, rng)
+    # Stop the workers and free the shared memory however the server exits
+    atexit.register(band_engine.close)
 
 
 def get_props(cell_type):
     return FUEL_PROPERTIES.get(cell_type, FUEL_PROPERTIES["grass"])
 
 
+def load_map_grid(received):
+    if not received or not grid.load_rows(received):
+        return False
+    grid.fill("moisture", 15.0)
+    return True
+
+
 def place_stamp(x, y, tool):
     if not (0 <= x < COLS and 0 <= y < ROWS):
         return
 
+    put = grid.put
     if tool == "tree":
         trunk_height = 12
         for dy in range(trunk_height):
             ny = y + dy
             if ny >= ROWS:
                 break
-            c = grid[ny][x]
-            c.type = "trunk"
-            c.fuel = random.randint(175, 235)
-            c.moisture = random.uniform(9, 19)
-            c.heat = 0.0
-            c.state = "unburned"
-            c.intensity = 0
+            put(grid.index(x, ny), "trunk",
+                fuel=rng.randint(175, 235),
+                moisture=rng.uniform(9, 19),
+                heat=0.0, state=UNBURNED, intensity=0)
+        trunk_id = grid.type_id("trunk")
         crown_base = y + trunk_height - 6
         for layer in range(8):
             radius = 7 - layer // 2
             for dy in range(-radius - 1, radius + 2):
                 for dx in range(-radius - 1, radius + 2):
-                    if abs(dx) + abs(dy) > radius + random.random() * 1.8:
+                    if abs(dx) + abs(dy) > radius + rng.random() * 1.8:
                         continue
                     nx2 = x + dx
                     ny2 = crown_base - layer + dy
                     if not (0 <= nx2 < COLS and 0 <= ny2 < ROWS):
                         continue
-                    c = grid[ny2][nx2]
-                    if c.type == "trunk":
+                    i = grid.index(nx2, ny2)
+                    if grid.type[i] == trunk_id:
                         continue
-                    c.type = "foliage"
-                    c.fuel = random.randint(68, 118)
-                    c.moisture = random.uniform(28, 48)
-                    c.heat = 0.0
-                    c.state = "unburned"
-                    c.intensity = 0
+                    put(i, "foliage",
+                        fuel=rng.randint(68, 118),
+                        moisture=rng.uniform(28, 48),
+                        heat=0.0, state=UNBURNED, intensity=0)
 
     elif tool == "grass":
         for dx in range(-1, 2):
@@ -125,27 +208,21 @@ def place_stamp(x, y, tool):
                 nx2 = x + dx
                 ny2 = y + dy
                 if 0 <= nx2 < COLS and 0 <= ny2 < ROWS:
-                    c = grid[ny2][nx2]
-                    c.type = "grass"
-                    c.fuel = random.randint(28, 55)
-                    c.moisture = random.uniform(18, 35)
-                    c.heat = 0
-                    c.state = "unburned"
+                    put(grid.index(nx2, ny2), "grass",
+                        fuel=rng.randint(28, 55),
+                        moisture=rng.uniform(18, 35),
+                        heat=0, state=UNBURNED)
 
     elif tool == "lake":
         size = 9
         for dy in range(-size, size + 1):
             for dx in range(-size, size + 1):
-                if dx * dx + dy * dy <= size * size + random.randint(-5, 5):
+                if dx * dx + dy * dy <= size * size + rng.randint(-5, 5):
                     nx2 = x + dx
                     ny2 = y + dy
                     if 0 <= nx2 < COLS and 0 <= ny2 < ROWS:
-                        c = grid[ny2][nx2]
-                        c.type = "water"
-                        c.fuel = 0
-                        c.intensity = 0
-                        c.moisture = 100
-                        c.state = "burned"
+                        put(grid.index(nx2, ny2), "water", fuel=0,
+                            intensity=0, moisture=100, state=BURNED)
 
     elif tool == "house":
         for dy in range(-6, 7):
@@ -153,211 +230,239 @@ def place_stamp(x, y, tool):
                 nx2 = x + dx
                 ny2 = y + dy
                 if 0 <= nx2 < COLS and 0 <= ny2 < ROWS:
-                    c = grid[ny2][nx2]
+                    i = grid.index(nx2, ny2)
                     if abs(dy) == 6 or abs(dx) == 9:
-                        c.type = "wall"
-                        c.fuel = random.randint(200, 255)
+                        put(i, "wall", fuel=rng.randint(200, 255))
                     else:
-                        c.type = "floor"
-                        c.fuel = random.randint(100, 155)
-                    c.moisture = 12
-                    c.heat = 0
-                    c.state = "unburned"
+                        put(i, "floor", fuel=rng.randint(100, 155))
+                    put(i, moisture=12, heat=0, state=UNBURNED)
 
     elif tool == "wall":
-        c = grid[y][x]
-        c.type = "wall"
-        c.fuel = 230
-        c.moisture = 10
-        c.state = "unburned"
+        put(grid.index(x, y), "wall", fuel=230, moisture=10, state=UNBURNED)
 
     elif tool == "floor":
-        c = grid[y][x]
-        c.type = "floor"
-        c.fuel = 130
-        c.moisture = 15
-        c.state = "unburned"
+        put(grid.index(x, y), "floor", fuel=130, moisture=15, state=UNBURNED)
 
     elif tool == "stone":
-        c = grid[y][x]
-        c.type = "stone"
-        c.fuel = 0
-        c.moisture = 0
-        c.state = "burned"
+        put(grid.index(x, y), "stone", fuel=0, moisture=0, state=BURNED)
 
     elif tool == "ignite":
-        c = grid[y][x]
-        if c.fuel <= 10:
-            c.fuel = 60
-        c.intensity = random.randint(45, 72)
-        c.heat = 92.0
-        c.state = "burning"
-        c.moisture = 4.0
+        i = grid.index(x, y)
+        if grid.fuel[i] <= 10:
+            put(i, fuel=60)
+        put(i, intensity=rng.randint(45, 72), heat=92.0,
+            state=BURNING, moisture=4.0)
 
     elif tool == "concrete":
-        c = grid[y][x]
-        c.type = "concrete"
-        c.fuel = 0
-        c.moisture = 0
-        c.state = "burned"
+        put(grid.index(x, y), "concrete", fuel=0, moisture=0, state=BURNED)
 
     elif tool == "hydrant":
-        c = grid[y][x]
-        c.type = "hydrant"
-        c.fuel = random.randint(8, 25)
-        c.moisture = 5
-        c.state = "unburned"
+        put(grid.index(x, y), "hydrant", fuel=rng.randint(8, 25),
+            moisture=5, state=UNBURNED)
 
     elif tool == "wood_floor":
-        c = grid[y][x]
-        c.type = "floor"
-        c.fuel = random.randint(140, 190)
-        c.moisture = 12
-        c.state = "unburned"
+        put(grid.index(x, y), "floor", fuel=rng.randint(140, 190),
+            moisture=12, state=UNBURNED)
 
     elif tool == "road_straight":
         w, h = 4, 4
         if x + w <= COLS and y + h <= ROWS:
             for dy in range(h):
                 for dx in range(w):
-                    c = grid[y + dy][x + dx]
                     if dx == 0 and dy == 0:
-                        c.type = "road_straight_root"
+                        ctype = "road_straight_root"
                     else:
-                        c.type = "road_straight_part"
-                    c.fuel = 0
-                    c.moisture = 0
-                    c.intensity = 0
-                    c.state = "burned"
+                        ctype = "road_straight_part"
+                    put(grid.index(x + dx, y + dy), ctype, fuel=0,
+                        moisture=0, intensity=0, state=BURNED)
 
     elif tool == "road_turn":
         w, h = 5, 5
         if x + w <= COLS and y + h <= ROWS:
             for dy in range(h):
                 for dx in range(w):
-                    c = grid[y + dy][x + dx]
                     if dx == 0 and dy == 0:
-                        c.type = "road_turn_root"
+                        ctype = "road_turn_root"
                     else:
-                        c.type = "road_turn_part"
-                    c.fuel = 0
-                    c.moisture = 0
-                    c.intensity = 0
-                    c.state = "burned"
+                        ctype = "road_turn_part"
+                    put(grid.index(x + dx, y + dy), ctype, fuel=0,
+                        moisture=0, intensity=0, state=BURNED)
 
     elif tool in TRUCKS or tool == "firecar":
         w, h = 4, 8
         if x + w <= COLS and y + h <= ROWS:
             for dy in range(h):
                 for dx in range(w):
-                    c = grid[y + dy][x + dx]
                     if dx == 0 and dy == 0:
-                        c.type = "firecar_root"
+                        ctype = "firecar_root"
                     else:
-                        c.type = "firecar_part"
-                    c.fuel = 0
-                    c.moisture = 0
-                    c.intensity = 0
-                    c.state = "burned"
+                        ctype = "firecar_part"
+                    put(grid.index(x + dx, y + dy), ctype, fuel=0,
+                        moisture=0, intensity=0, state=BURNED)
             if tool in available_trucks:
                 available_trucks.remove(tool)
                 broadcast({"type": "TRUCK_AVAILABLE",
                            "available": available_trucks[:]})
 
 
-def extinguish_cells(cells, power):
-    for ci in cells:
-        cx = ci.get("x", -1)
-        cy = ci.get("y", -1)
+def water_cells(cmd):
+    # (cell indices, power) hit by an EXTINGUISH or EXTINGUISH_SHAPE command
+    if cmd.get("type") == "EXTINGUISH_SHAPE":
+        try:
+            x, y = int(cmd.get("x", -1)), int(cmd.get("y", -1))
+        except (TypeError, ValueError):
+            return [], 0
+        cells, power = water.shape_cells(x, y, cmd.get("dir"),
+                                         cmd.get("mode"), COLS, ROWS)
+        return [cy * COLS + cx for cx, cy in cells], power
+    cells = []
+    targets = cmd.get("cells", [])
+    if not isinstance(targets, list):
+        return [], 0
+    for ci in targets:
+        # Malformed entries are skipped before anything is logged
+        if not isinstance(ci, dict):
+            continue
+        try:
+            cx, cy = int(ci.get("x", -1)), int(ci.get("y", -1))
+        except (TypeError, ValueError, OverflowError):
+            continue
         if 0 <= cx < COLS and 0 <= cy < ROWS:
-            c = grid[cy][cx]
-            c.intensity = max(0, c.intensity - power * 12)
-            c.heat = max(0, c.heat - power * 40)
-            c.moisture = min(100, c.moisture + power * 20)
-            c.fuel = max(0, c.fuel - power * 3)
-            if c.intensity <= 0:
-                c.intensity = 0
-                c.heat = 0
-                c.state = "smoldering"
+            cells.append(cy * COLS + cx)
+    # A bad power drops the command; a negative one would add fuel back
+    try:
+        power = float(cmd.get("power", 3))
+    except (TypeError, ValueError):
+        return [], 0
+    if not math.isfinite(power):
+        return [], 0
+    return cells, max(0.0, power)
+
+
+def queue_water(client, cmd):
+    # Water is summed per cell and applied at the start of the next tick,
+    # so this only needs water_lock, not grid_lock. Applying the sum once
+    # gives the same cell values as applying each command in turn.
+    if client.role in SPECTATOR_ROLES:
+        return
+    count_command(cmd["type"])
+    cells, power = water_cells(cmd)
+    if not cells or not power:
+        return
+    global water_map
+    with water_lock:
+        if command_log is not None:
+            command_log.command(water_tick, client, cmd)
+        if len(water_map) != grid.size:
+            water_map = array("d", [0.0]) * grid.size
+        amount = water_map
+        touched = water_touched
+        for i in cells:
+            if not amount[i]:
+                touched.append(i)
+            amount[i] += power
+
+
+def apply_water():
+    # Call at the start of every tick with grid_lock held (threaded mode)
+    global water_touched, water_tick
+    with water_lock:
+        touched, water_touched = water_touched, []
+        water_tick = frame + 1
+        hits = [(i, water_map[i]) for i in touched]
+        for i in touched:
+            water_map[i] = 0.0
+    if not hits:
+        return
+    fuel = grid.fuel
+    intensity = grid.intensity
+    heat = grid.heat
+    moisture = grid.moisture
+    for i, power in hits:
+        grid.touch(i)
+        intensity[i] = max(0, intensity[i] - power * 12)
+        heat[i] = max(0, heat[i] - power * 40)
+        moisture[i] = min(100, moisture[i] + power * 20)
+        fuel[i] = max(0, fuel[i] - power * 3)
+        if intensity[i] <= 0:
+            intensity[i] = 0
+            heat[i] = 0
+            grid.state[i] = SMOLDERING
+
+
+def set_wind(wind, strength):
+    # Rebuilds the spread kernels; returns False for malformed input
+    global WIND, WIND_STRENGTH
+    try:
+        wind = (float(wind[0]), float(wind[1]))
+        strength = float(strength)
+    except (TypeError, ValueError, IndexError, KeyError):
+        return False
+    if not all(math.isfinite(v) for v in wind + (strength,)):
+        return False
+    WIND = tuple(max(-WIND_MAX, min(WIND_MAX, v)) for v in wind)
+    WIND_STRENGTH = max(0.0, min(WIND_STRENGTH_MAX, strength))
+    python_engine.set_wind(WIND, WIND_STRENGTH)
+    if numpy_engine is not None:
+        numpy_engine.set_wind(WIND, WIND_STRENGTH)
+    if band_engine is not None:
+        band_engine.set_wind(WIND, WIND_STRENGTH)
+    print("[~] Wind set to {} x {}".format(WIND, WIND_STRENGTH))
+    return True
 
 
 def update_fire():
     if not running_sim:
         return
+    fire_engine().step(grid)
+    if command_log is not None:
+        command_log.digest(frame, grid)
 
-    heat_map = [[0.0] * COLS for _ in range(ROWS)]
 
-    for y in range(ROWS):
-        for x in range(COLS):
-            c = grid[y][x]
-            heat_map[y][x] = c.heat * 0.67
-            if c.intensity <= 8:
-                continue
-            props = get_props(c.type)
-            heat_out = props["heat_gen"] * (c.intensity / 55.0)
+def fire_engine():
+    if band_engine is not None:
+        return band_engine
+    if numpy_engine is not None:
+        return numpy_engine
+    return python_engine
 
-            for dy in range(-4, 5):
-                for dx in range(-4, 5):
-                    if dx == 0 and dy == 0:
-                        continue
-                    nx2 = x + dx
-                    ny2 = y + dy
-                    if nx2 < 0 or nx2 >= COLS or ny2 < 0 or ny2 >= ROWS:
-                        continue
-                    dist = max(1.0, (abs(dx) + abs(dy)) ** 0.72)
-                    heat = heat_out / dist
-                    wind_bias = (dx * WIND[0] + dy * WIND[1]) * WIND_STRENGTH * 0.65
-                    if dy < 0:
-                        vb = 1.5
-                    elif dy > 0:
-                        vb = 1.0
-                    else:
-                        vb = 1.2
-                    heat_map[ny2][nx2] += (heat + wind_bias) * vb
 
-            c.fuel = max(0, c.fuel - props["burn_rate"] * (c.intensity / 80.0))
-            c.intensity = max(0, c.intensity - 0.4)
+def engine_name():
+    if band_engine is not None:
+        return "bands x{}".format(band_engine.workers)
+    return "numpy" if numpy_engine is not None else "python"
 
-    for y in range(ROWS):
-        for x in range(COLS):
-            c = grid[y][x]
-            if c.type == "water":
-                c.heat = 0
-                continue
-            c.heat = heat_map[y][x]
-            if c.moisture > 50:
-                c.heat *= 0.85
-            if c.state in ("unburned", "smoldering") and c.fuel > 16:
-                props = get_props(c.type)
-                ign_temp = props["ign_temp"]
-                if c.type == "foliage":
-                    bt = False
-                    for cy2 in range(y + 1, min(ROWS, y + 7)):
-                        for cx2 in range(max(0, x - 2), min(COLS, x + 3)):
-                            tc = grid[cy2][cx2]
-                            if tc.type == "trunk" and tc.intensity > 15:
-                                bt = True
-                                break
-                        if bt:
-                            break
-                    if not bt:
-                        ign_temp *= 2.85
-                final_ign = ign_temp * (1.0 + c.moisture / 80.0)
-                if c.heat > final_ign:
-                    c.intensity = random.randint(33, 59)
-                    c.state = "burning"
-                    c.moisture = max(0, c.moisture - 24)
-
-    for y in range(ROWS):
-        for x in range(COLS):
-            c = grid[y][x]
-            if c.fuel <= 8:
-                c.intensity = 0
-                if c.state != "burned":
-                    c.state = "smoldering" if c.fuel > 3 else "burned"
-                c.heat *= 0.52
-            if c.moisture > 22:
-                c.moisture -= 0.3
+
+def state_fields():
+    return {
+        "edit_mode": edit_mode,
+        "running_sim": running_sim,
+        "available_trucks": available_trucks[:],
+        "firefighters": [{k: ff[k] for k in FF_FIELDS}
+                         for ff in server_firefighters.values()],
+        "supply_hoses": [list(sc) for sc in supply_connections],
+    }
+
+
+def capture_state():
+    # Call with grid_lock held; only copies, no encoding
+    return state_sync.capture(grid, state_fields())
+
+
+def publish_state(frame):
+    # Call with publish_lock held. Encodes each wire format in use once.
+    with metrics.timer("diff"):
+        update = publisher.publish(frame, time.monotonic())
+    if update is not None:
+        encode_update(update)
+    return update
+
+
+def encode_update(update):
+    for wire in set(c.wire for c in clients):
+        if wire not in update.packets:
+            with metrics.timer("encode_" + wire):
+                update.packet(wire)
 
 
 def recv_exact(sock, size):
@@ -371,32 +476,312 @@ def recv_exact(sock, size):
 
 
 def send_msg(sock, data):
+    # Direct write, only used before the client's writer thread exists
     try:
-        msg = json.dumps(data).encode("utf-8")
-        sock.sendall(struct.pack(">I", len(msg)) + msg)
+        sock.sendall(encode_msg(data))
     except Exception:
         pass
 
 
+def send_state(client, update):
+    # Call with publish_lock held
+    client.send_state(update, publisher.keyframe)
+
+
 def broadcast(data):
-    payload = json.dumps(data).encode("utf-8")
-    packet = struct.pack(">I", len(payload)) + payload
-    dead = []
+    # Only queues packets, so it is safe to call with grid_lock held
+    packet = encode_msg(data)
     for c in clients[:]:
-        try:
-            c.sendall(packet)
-        except Exception:
-            dead.append(c)
-    for c in dead:
-        if c in clients:
-            clients.remove(c)
-        if c in client_roles:
-            del client_roles[c]
+        c.send(packet)
+
+
+def broadcast_state(update):
+    now = time.monotonic()
+    for c in clients[:]:
+        if SLOW_CLIENT_SEC > 0 and c.lagging(now, SLOW_CLIENT_SEC):
+            print("[!] {} is too slow, disconnecting".format(c.addr))
+            c.close("slow consumer")
+            continue
+        send_state(c, update)
+
+
+def stats_snapshot(histograms=True):
+    # Safe to call from the stats endpoint thread: only reads and copies
+    report = metrics.report(histograms)
+    counters = metrics.counters()
+    commands = {name[4:]: n for name, n in counters.items()
+                if name.startswith("cmd_")}
+    return {
+        "type": "STATS",
+        "uptime": time.time() - started_at,
+        "frame": frame,
+        "tick_hz": TICK_HZ,
+        "send_hz": SEND_HZ,
+        "engine": engine_name(),
+        "running_sim": running_sim,
+        "timings_ms": report,
+        "counters": {name: n for name, n in counters.items()
+                     if not name.startswith("cmd_")},
+        "commands": commands,
+        "clients": [{"addr": str(c.addr), "role": c.role, "wire": c.wire,
+                     "bytes_sent": c.bytes_sent, "queued": c.queued(),
+                     "coalesced": c.coalesced} for c in list(clients)],
+        "profile": profiler.top(10) if profiler.running else None,
+    }
+
+
+def send_stats():
+    subscribers = [c for c in clients if c.wants_stats]
+    if subscribers:
+        msg = stats_snapshot(histograms=False)
+        for c in subscribers:
+            c.send_msg(msg)
+
+
+def start_stats():
+    if STATS_PORT:
+        stats_http.serve(STATS_HOST, STATS_PORT, stats_snapshot, profiler)
+        print("Stats on http://{}:{}/stats".format(STATS_HOST, STATS_PORT))
+    if PROFILE_HZ > 0:
+        profiler.start(PROFILE_HZ)
+        print("Sampling profiler on at {} Hz".format(PROFILE_HZ))
+
+
+def check_auth(auth, addr):
+    # Returns (role, reply); role is None when the client is rejected
+    if auth.get("type") != "AUTH" or auth.get("password") != SERVER_PASSWORD:
+        return None, {"type": "AUTH_FAIL", "reason": "Bad password"}
+    role = auth.get("role", "").lower()
+    if role not in ALLOWED_ROLES:
+        return None, {"type": "AUTH_FAIL", "reason": "Bad role"}
+    return role, {"type": "AUTH_OK", "role": role, "client_id": str(addr),
+                  "wire": wire_format.choose_wire(auth.get("wire")),
+                  "cell_types": list(grid.type_names)}
+
+
+def drop_firefighters(owner):
+    to_rm = [key for key in server_firefighters if key[0] == owner]
+    for key in to_rm:
+        del server_firefighters[key]
+
+
+def can_walk(gx, gy):
+    if gx < 0 or gy < 0 or gx >= COLS or gy >= ROWS:
+        return False
+    return grid.intensity[gy * COLS + gx] <= firefighter.WALK_MAX_INTENSITY
+
+
+def move_firefighters():
+    # Call at every tick with grid_lock held (threaded mode)
+    speed = firefighter.SPEED / TICK_HZ
+    for ff in server_firefighters.values():
+        if ff["keys"]:
+            firefighter.step(ff, ff["keys"], speed, can_walk, COLS, ROWS)
+
+
+def client_left(client):
+    # Call with grid_lock held (threaded mode) or on the event loop
+    drop_firefighters(str(client.addr))
+    if command_log is not None:
+        command_log.leave(frame, client.addr)
+
+
+def open_command_log():
+    global command_log
+    if not COMMAND_LOG_DIR:
+        return
+    command_log = CommandLog.in_dir(COMMAND_LOG_DIR, {
+        "seed": SIM_SEED, "engine": FIRE_ENGINE,
+        "cols": COLS, "rows": ROWS, "update_every": UPDATE_EVERY,
+        "tick_hz": TICK_HZ,
+        "wind": list(WIND), "wind_strength": WIND_STRENGTH,
+    })
+    print("Session seed {}, logging to {}".format(SIM_SEED, command_log.path))
+
+
+def count_command(cmd_type):
+    if cmd_type not in COMMAND_TYPES:
+        cmd_type = "unknown"
+    metrics.incr("cmd_" + cmd_type)
+
+
+def handle_command(client, cmd):
+    # Call with grid_lock held (threaded mode) or on the event loop
+    global edit_mode, running_sim
+    if client.role in SPECTATOR_ROLES:
+        return
+    cmd_type = cmd.get("type", "")
+    if cmd_type in WATER_COMMANDS:
+        queue_water(client, cmd)
+        return
+    if command_log is not None:
+        command_log.command(frame, client, cmd)
+    count_command(cmd_type)
+
+    if cmd_type == "CLICK":
+        place_stamp(cmd.get("x", 0), cmd.get("y", 0),
+                    cmd.get("tool", ""))
+
+    elif cmd_type == "FILL_BASE":
+        tool = cmd.get("tool", "")
+        for i in grid.find_types(("empty", "grass", "floor", "stone")):
+            if tool == "empty":
+                grid.put(i, "empty", fuel=0)
+            elif tool == "grass":
+                grid.put(i, "grass", fuel=rng.randint(28, 55))
+            elif tool == "floor":
+                grid.put(i, "floor", fuel=130)
+            elif tool == "stone":
+                grid.put(i, "stone", fuel=0)
+            grid.put(i, intensity=0, heat=0,
+                     moisture=25 if tool == "grass" else 15,
+                     state=UNBURNED)
+
+    elif cmd_type == "SPACE":
+        if edit_mode:
+            edit_mode = False
+            running_sim = True
+        else:
+            running_sim = not running_sim
+
+    elif cmd_type == "R":
+        grid.reset()
+        edit_mode = True
+        running_sim = False
+        supply_connections.clear()
+        publisher.request_keyframe()
+
+    elif cmd_type == "LOAD_MAP":
+        if load_map_grid(cmd.get("grid")):
+            edit_mode = True
+            running_sim = False
+            supply_connections.clear()
+            publisher.request_keyframe()
+
+    elif cmd_type == "HOST_READY":
+        # Without final_grid the game starts from the server's own grid;
+        # a grid decoded from bin1 has its fuel rounded up
+        fg = cmd.get("final_grid")
+        if fg is None or grid.load_rows(fg):
+            wet = {grid.type_ids.get(n) for n in ("grass", "tree")}
+            grid.touch_all()
+            grid.moisture[:] = array("d", [
+                22.0 if t in wet else 0.0 for t in grid.type])
+            edit_mode = False
+            running_sim = False
+            supply_connections.clear()
+            publisher.request_keyframe()
+            broadcast({
+                "type": "START_GAME",
+                "grid": grid.snapshot(),
+                "message": "Game started!"
+            })
+
+    elif cmd_type == "DEPLOY_TRUCK":
+        truck = cmd.get("truck")
+        if truck and truck in TRUCKS:
+            available_trucks.append(truck)
+            broadcast({
+                "type": "TRUCK_AVAILABLE",
+                "truck": truck,
+                "available": available_trucks[:]
+            })
+
+    elif cmd_type == "PLACE_TRUCK":
+        place_stamp(cmd.get("x", 0), cmd.get("y", 0),
+                    cmd.get("truck", ""))
+
+    elif cmd_type == "SPAWN_FIREFIGHTER":
+        owner = str(client.addr)
+        x = cmd.get("x", 0)
+        y = cmd.get("y", 0)
+        server_firefighters[(owner, cmd.get("id", 0))] = {
+            "id": cmd.get("id", 0),
+            "x": x,
+            "y": y,
+            "owner": owner,
+            "dir": cmd.get("dir", "up"),
+            "tx": cmd.get("tx", x),
+            "ty": cmd.get("ty", y),
+            "keys": (),
+            "seq": 0,
+        }
+
+    elif cmd_type == "FF_INPUT":
+        ff = server_firefighters.get((str(client.addr), cmd.get("id")))
+        if ff is not None:
+            ff["keys"] = firefighter.input_keys(cmd.get("keys"))
+            # Echoed in state so the owner knows its input arrived
+            ff["seq"] = cmd.get("seq", 0)
+
+    elif cmd_type == "MOVE_FIREFIGHTER":
+        ff = server_firefighters.get((str(client.addr), cmd.get("id")))
+        if ff is not None:
+            ff["x"] = cmd.get("x", 0)
+            ff["y"] = cmd.get("y", 0)
+
+    elif cmd_type == "MOVE_UNIT":
+        uid = cmd.get("id")
+        for ff in server_firefighters.values():
+            if ff["id"] == uid:
+                ff["x"] = cmd.get("x", 0)
+                ff["y"] = cmd.get("y", 0)
+                break
+
+    elif cmd_type == "SET_WIND":
+        set_wind(cmd.get("wind", WIND), cmd.get("strength", WIND_STRENGTH))
+
+    elif cmd_type == "LAY_SUPPLY_HOSE":
+        tx = cmd.get("tx", 0)
+        ty = cmd.get("ty", 0)
+        sx = cmd.get("sx", 0)
+        sy = cmd.get("sy", 0)
+
+        already = False
+        for sc in supply_connections:
+            if sc[0] == tx and sc[1] == ty:
+                already = True
+                break
+
+        if not already:
+            dist = math.sqrt((sx - tx) ** 2 + (sy - ty) ** 2)
+            valid_source = False
+            if (0 <= sx < COLS and 0 <= sy < ROWS):
+                ct = grid.type_name(sx, sy)
+                if ct in ("water", "hydrant"):
+                    valid_source = True
+
+            if valid_source and dist <= SUPPLY_HOSE_MAX:
+                supply_connections.append([tx, ty, sx, sy])
+                client.send_msg({
+                    "type": "SUPPLY_OK",
+                    "tx": tx, "ty": ty,
+                    "sx": sx, "sy": sy
+                })
+                print("[+] Supply hose: truck({},{}) -> {}({},{})".format(
+                    tx, ty, grid.type_name(sx, sy), sx, sy))
+            else:
+                client.send_msg({
+                    "type": "SUPPLY_FAIL",
+                    "tx": tx, "ty": ty,
+                    "reason": "Too far or no water source"
+                })
+
+    elif cmd_type == "DISCONNECT_SUPPLY":
+        tx = cmd.get("tx", 0)
+        ty = cmd.get("ty", 0)
+        to_rm = []
+        for sc in supply_connections:
+            if sc[0] == tx and sc[1] == ty:
+                to_rm.append(sc)
+        for sc in to_rm:
+            supply_connections.remove(sc)
+        print("[-] Supply hose disconnected: ({},{})".format(
+            tx, ty))
 
 
 def client_thread(conn, addr):
-    global edit_mode, running_sim, grid
-    addr_str = str(addr)
+    client = None
 
     try:
         conn.settimeout(10.0)
@@ -410,41 +795,32 @@ def client_thread(conn, addr):
             conn.close()
             return
 
-        auth = json.loads(raw_data.decode("utf-8"))
-        if auth.get("type") != "AUTH" or auth.get("password") != SERVER_PASSWORD:
-            send_msg(conn, {"type": "AUTH_FAIL", "reason": "Bad password"})
+        role, reply = check_auth(json.loads(raw_data.decode("utf-8")), addr)
+        send_msg(conn, reply)
+        if role is None:
             conn.close()
             return
-
-        role = auth.get("role", "").lower()
-        if role not in ALLOWED_ROLES:
-            send_msg(conn, {"type": "AUTH_FAIL", "reason": "Bad role"})
-            conn.close()
-            return
-
-        send_msg(conn, {"type": "AUTH_OK", "role": role})
+        wire = reply["wire"]
         conn.settimeout(None)
 
-        with grid_lock:
-            clients.append(conn)
-            client_roles[conn] = role
+        client = ClientConn(conn, addr, role, wire, OUTBOX_LIMIT)
+        with publish_lock:
+            if publisher.frame is None:
+                # Nothing published yet. The game loop never takes
+                # publish_lock while holding grid_lock, so nesting is safe.
+                with grid_lock:
+                    captured = capture_state()
+                publish_state(captured)
+            keyframe = publisher.keyframe()
+            with metrics.timer("encode_" + wire):
+                keyframe.packet(wire)
+            send_state(client, keyframe)
+            clients.append(client)
+        client.start()
 
         print("[+] {} joined as {} | Players: {}".format(
             addr, role, len(clients)))
 
-        with grid_lock:
-            net_grid = [[[c.fuel, c.intensity, c.type] for c in row]
-                        for row in grid]
-            send_msg(conn, {
-                "type": "STATE_UPDATE",
-                "grid": net_grid,
-                "edit_mode": edit_mode,
-                "running_sim": running_sim,
-                "available_trucks": available_trucks[:],
-                "firefighters": server_firefighters[:],
-                "supply_hoses": supply_connections[:]
-            })
-
         while True:
             raw_len = recv_exact(conn, 4)
             if not raw_len:
@@ -459,196 +835,30 @@ def client_thread(conn, addr):
             except Exception:
                 continue
 
-            cmd_type = cmd.get("type", "")
+            if cmd.get("type") == "RESYNC":
+                with publish_lock:
+                    if publisher.frame is not None:
+                        send_state(client, publisher.keyframe())
+                continue
+            if cmd.get("type") == "STATS_SUBSCRIBE":
+                client.wants_stats = bool(cmd.get("on", True))
+                continue
+            if cmd.get("type") in WATER_COMMANDS:
+                queue_water(client, cmd)
+                continue
 
             with grid_lock:
-                if cmd_type == "CLICK":
-                    place_stamp(cmd.get("x", 0), cmd.get("y", 0),
-                                cmd.get("tool", ""))
-
-                elif cmd_type == "FILL_BASE":
-                    tool = cmd.get("tool", "")
-                    for yy in range(ROWS):
-                        for xx in range(COLS):
-                            c = grid[yy][xx]
-                            if c.type in ("empty", "grass", "floor", "stone"):
-                                if tool == "empty":
-                                    c.type = "empty"
-                                    c.fuel = 0
-                                elif tool == "grass":
-                                    c.type = "grass"
-                                    c.fuel = random.randint(28, 55)
-                                elif tool == "floor":
-                                    c.type = "floor"
-                                    c.fuel = 130
-                                elif tool == "stone":
-                                    c.type = "stone"
-                                    c.fuel = 0
-                                c.intensity = 0
-                                c.heat = 0
-                                c.moisture = 25 if tool == "grass" else 15
-                                c.state = "unburned"
-
-                elif cmd_type == "SPACE":
-                    if edit_mode:
-                        edit_mode = False
-                        running_sim = True
-                    else:
-                        running_sim = not running_sim
-
-                elif cmd_type == "R":
-                    grid = [[Cell() for _ in range(COLS)] for _ in range(ROWS)]
-                    edit_mode = True
-                    running_sim = False
-                    supply_connections.clear()
-
-                elif cmd_type == "LOAD_MAP":
-                    received = cmd.get("grid")
-                    if received and len(received) == ROWS:
-                        ok = all(len(row) == COLS for row in received)
-                        if ok:
-                            for yy in range(ROWS):
-                                for xx in range(COLS):
-                                    cd = received[yy][xx]
-                                    c = grid[yy][xx]
-                                    c.fuel = cd[0]
-                                    c.intensity = cd[1]
-                                    c.type = cd[2]
-                                    c.heat = 0.0
-                                    c.moisture = 15.0
-                                    c.state = ("burning" if cd[1] > 0
-                                               else "unburned")
-                            edit_mode = True
-                            running_sim = False
-                            supply_connections.clear()
-
-                elif cmd_type == "HOST_READY":
-                    fg = cmd.get("final_grid")
-                    if fg and len(fg) == ROWS:
-                        ok = all(len(row) == COLS for row in fg)
-                        if ok:
-                            for yy in range(ROWS):
-                                for xx in range(COLS):
-                                    fuel, intensity, ctype = fg[yy][xx]
-                                    c = grid[yy][xx]
-                                    c.fuel = fuel
-                                    c.intensity = intensity
-                                    c.type = ctype
-                                    c.heat = 0
-                                    c.moisture = (22 if ctype in
-                                                  ("grass", "tree") else 0)
-                                    c.state = ("unburned" if intensity == 0
-                                               else "burning")
-                            edit_mode = False
-                            running_sim = False
-                            supply_connections.clear()
-                            broadcast({
-                                "type": "START_GAME",
-                                "grid": fg,
-                                "message": "Game started!"
-                            })
-
-                elif cmd_type == "DEPLOY_TRUCK":
-                    truck = cmd.get("truck")
-                    if truck and truck in TRUCKS:
-                        available_trucks.append(truck)
-                        broadcast({
-                            "type": "TRUCK_AVAILABLE",
-                            "truck": truck,
-                            "available": available_trucks[:]
-                        })
-
-                elif cmd_type == "PLACE_TRUCK":
-                    place_stamp(cmd.get("x", 0), cmd.get("y", 0),
-                                cmd.get("truck", ""))
-
-                elif cmd_type == "SPAWN_FIREFIGHTER":
-                    server_firefighters.append({
-                        "id": cmd.get("id", 0),
-                        "x": cmd.get("x", 0),
-                        "y": cmd.get("y", 0),
-                        "owner": addr_str
-                    })
-
-                elif cmd_type == "MOVE_FIREFIGHTER":
-                    ff_id = cmd.get("id")
-                    for ff in server_firefighters:
-                        if ff["id"] == ff_id and ff["owner"] == addr_str:
-                            ff["x"] = cmd.get("x", 0)
-                            ff["y"] = cmd.get("y", 0)
-                            break
-
-                elif cmd_type == "MOVE_UNIT":
-                    uid = cmd.get("id")
-                    for ff in server_firefighters:
-                        if ff["id"] == uid:
-                            ff["x"] = cmd.get("x", 0)
-                            ff["y"] = cmd.get("y", 0)
-                            break
-
-                elif cmd_type == "EXTINGUISH":
-                    extinguish_cells(cmd.get("cells", []),
-                                     cmd.get("power", 3))
-
-                elif cmd_type == "LAY_SUPPLY_HOSE":
-                    tx = cmd.get("tx", 0)
-                    ty = cmd.get("ty", 0)
-                    sx = cmd.get("sx", 0)
-                    sy = cmd.get("sy", 0)
-
-                    already = False
-                    for sc in supply_connections:
-                        if sc[0] == tx and sc[1] == ty:
-                            already = True
-                            break
-
-                    if not already:
-                        dist = math.sqrt((sx - tx) ** 2 + (sy - ty) ** 2)
-                        valid_source = False
-                        if (0 <= sx < COLS and 0 <= sy < ROWS):
-                            ct = grid[sy][sx].type
-                            if ct in ("water", "hydrant"):
-                                valid_source = True
-
-                        if valid_source and dist <= SUPPLY_HOSE_MAX:
-                            supply_connections.append([tx, ty, sx, sy])
-                            send_msg(conn, {
-                                "type": "SUPPLY_OK",
-                                "tx": tx, "ty": ty,
-                                "sx": sx, "sy": sy
-                            })
-                            print("[+] Supply hose: truck({},{}) -> {}({},{})".format(
-                                tx, ty, grid[sy][sx].type, sx, sy))
-                        else:
-                            send_msg(conn, {
-                                "type": "SUPPLY_FAIL",
-                                "tx": tx, "ty": ty,
-                                "reason": "Too far or no water source"
-                            })
-
-                elif cmd_type == "DISCONNECT_SUPPLY":
-                    tx = cmd.get("tx", 0)
-                    ty = cmd.get("ty", 0)
-                    to_rm = []
-                    for sc in supply_connections:
-                        if sc[0] == tx and sc[1] == ty:
-                            to_rm.append(sc)
-                    for sc in to_rm:
-                        supply_connections.remove(sc)
-                    print("[-] Supply hose disconnected: ({},{})".format(
-                        tx, ty))
+                handle_command(client, cmd)
 
     except Exception as e:
         print("[!] Error {}: {}".format(addr, e))
     finally:
-        to_rm = [ff for ff in server_firefighters
-                 if ff.get("owner") == addr_str]
-        for ff in to_rm:
-            server_firefighters.remove(ff)
-        if conn in clients:
-            clients.remove(conn)
-        if conn in client_roles:
-            del client_roles[conn]
+        if client is not None:
+            with grid_lock:
+                client_left(client)
+            client.close()
+            if client in clients:
+                clients.remove(client)
         try:
             conn.close()
         except Exception:
@@ -656,44 +866,81 @@ def client_thread(conn, addr):
         print("[-] {} left | Players: {}".format(addr, len(clients)))
 
 
+def fire_due():
+    return running_sim and frame % UPDATE_EVERY == 0
+
+
 def game_loop():
     global frame
+    scheduler = TickScheduler(TICK_HZ, SEND_HZ, MAX_CATCH_UP)
+    next_report = time.monotonic() + METRICS_LOG_SEC
+    next_stats = time.monotonic() + STATS_SEC
     while True:
+        started = scheduler.clock()
         try:
-            with grid_lock:
-                if running_sim and frame % UPDATE_EVERY == 0:
-                    try:
-                        update_fire()
-                    except Exception as e:
-                        print("Fire error: {}".format(e))
-                frame += 1
-
-                net_grid = [[[c.fuel, c.intensity, c.type] for c in row]
-                            for row in grid]
-                state = {
-                    "type": "STATE_UPDATE",
-                    "grid": net_grid,
-                    "edit_mode": edit_mode,
-                    "running_sim": running_sim,
-                    "available_trucks": available_trucks[:],
-                    "firefighters": server_firefighters[:],
-                    "supply_hoses": supply_connections[:]
-                }
-            broadcast(state)
+            ticks = scheduler.due_ticks(started)
+            send = scheduler.send_due(started)
+            if ticks or send:
+                wait_start = time.perf_counter()
+                with grid_lock:
+                    held_from = time.perf_counter()
+                    metrics.record("lock_wait", held_from - wait_start)
+                    for _ in range(ticks):
+                        apply_water()
+                        move_firefighters()
+                        if fire_due():
+                            try:
+                                with metrics.timer("fire_step"):
+                                    update_fire()
+                            except Exception as e:
+                                print("Fire error: {}".format(e))
+                        frame += 1
+                    if send:
+                        with metrics.timer("capture"):
+                            captured = capture_state()
+                    metrics.record("lock_hold",
+                                   time.perf_counter() - held_from)
+            if send:
+                with publish_lock:
+                    state = publish_state(captured)
+                    if state is not None:
+                        with metrics.timer("broadcast"):
+                            broadcast_state(state)
         except Exception as e:
             print("Loop error: {}".format(e))
 
-        time.sleep(1.0 / 33.0)
+        if METRICS_LOG_SEC > 0 and time.monotonic() >= next_report:
+            next_report = time.monotonic() + METRICS_LOG_SEC
+            print("[metrics]\n" + metrics.format_report())
+        if time.monotonic() >= next_stats:
+            next_stats = time.monotonic() + STATS_SEC
+            send_stats()
+
+        time.sleep(scheduler.finish(started))
+
+
+def main_asyncio():
+    # server_async imports this module as "server"; make that name resolve
+    # to the running __main__ module instead of loading a second copy
+    sys.modules.setdefault("server", sys.modules[__name__])
+    import server_async
+    server_async.main()
 
 
-if __name__ == "__main__":
+if __name__ == "__main__" and SERVER_MODE == "asyncio":
+    main_asyncio()
+elif __name__ == "__main__":
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server.bind((HOST, PORT))
     server.listen(MAX_PLAYERS)
+    open_command_log()
+    start_stats()
 
     print("Server on {}:{}".format(HOST, PORT))
-    print("Fire: UPDATE_EVERY={}".format(UPDATE_EVERY))
+    print("Fire: UPDATE_EVERY={} engine={}".format(
+        UPDATE_EVERY, engine_name()))
+    print("Tick: {:g} Hz, send: {:g} Hz".format(TICK_HZ, SEND_HZ))
     print("Supply hose max: {} cells".format(SUPPLY_HOSE_MAX))
 
     threading.Thread(target=game_loop, daemon=True).start()
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import server
+from client_conn import ClientConn, encode_msg
+from tick_scheduler import TickScheduler
+
+MAX_SPECTATORS = int(os.getenv("MAX_SPECTATORS", "500"))
+AUTH_TIMEOUT = 10.0
+
+
+class LoopCondition:
+    # Stands in for ClientConn's threading.Condition when every caller runs
+    # on the event loop: no locking needed, notify just wakes the writer.
+
+    def __init__(self):
+        self.event = asyncio.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def notify(self):
+        self.event.set()
+
+    notify_all = notify
+
+
+class AsyncClientConn(ClientConn):
+    def __init__(self, stream, addr, role, wire, limit):
+        super().__init__(None, addr, role, wire, limit)
+        self.stream = stream
+        self.cond = LoopCondition()
+
+    def start(self):
+        self.writer = asyncio.ensure_future(self.write_loop())
+
+    async def write_loop(self):
+        event = self.cond.event
+        while True:
+            while not self.outbox and not self.closed:
+                self.behind_since = None
+                self.coalesce_run = 0
+                event.clear()
+                await event.wait()
+            if self.closed:
+                return
+            item = self.outbox.popleft()
+            self.taken(item)
+            try:
+                self.stream.write(item[1])
+                await self.stream.drain()
+            except (ConnectionError, OSError):
+                self.close("send failed")
+                return
+            self.bytes_sent += len(item[1])
+
+    def abort(self):
+        self.stream.transport.abort()
+
+
+class AsyncServer:
+    def __init__(self):
+        self.stepping = False
+        self.deferred = []   # commands received while the fire step runs
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def count(self, spectators):
+        return sum(1 for c in server.clients
+                   if (c.role in server.SPECTATOR_ROLES) == spectators)
+
+    def has_room(self, role):
+        if role in server.SPECTATOR_ROLES:
+            return self.count(True) < MAX_SPECTATORS
+        return self.count(False) < server.MAX_PLAYERS
+
+    async def read_msg(self, reader):
+        try:
+            head = await reader.readexactly(4)
+            return await reader.readexactly(struct.unpack(">I", head)[0])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info("peername")
+        client = None
+        try:
+            try:
+                raw = await asyncio.wait_for(self.read_msg(reader),
+                                             AUTH_TIMEOUT)
+            except asyncio.TimeoutError:
+                raw = None
+            if not raw:
+                return
+            role, reply = server.check_auth(json.loads(raw.decode("utf-8")),
+                                             addr)
+            if role is not None and not self.has_room(role):
+                role, reply = None, {"type": "AUTH_FAIL",
+                                     "reason": "Server full"}
+            writer.write(encode_msg(reply))
+            if role is None:
+                await writer.drain()
+                return
+
+            client = AsyncClientConn(writer, addr, role, reply["wire"],
+                                     server.OUTBOX_LIMIT)
+            server.send_state(client, server.publisher.keyframe())
+            server.clients.append(client)
+            client.start()
+            print("[+] {} joined as {} | Clients: {}".format(
+                addr, role, len(server.clients)))
+
+            while True:
+                raw = await self.read_msg(reader)
+                if raw is None:
+                    break
+                try:
+                    cmd = json.loads(raw.decode("utf-8"))
+                except Exception:
+                    continue
+                if cmd.get("type") == "RESYNC":
+                    server.send_state(client, server.publisher.keyframe())
+                elif cmd.get("type") == "STATS_SUBSCRIBE":
+                    client.wants_stats = bool(cmd.get("on", True))
+                elif cmd.get("type") in server.WATER_COMMANDS:
+                    # Only touches the water map, safe during a fire step
+                    server.queue_water(client, cmd)
+                elif self.stepping:
+                    self.deferred.append((client, cmd))
+                else:
+                    server.handle_command(client, cmd)
+
+        except Exception as e:
+            print("[!] Error {}: {}".format(addr, e))
+        finally:
+            if client is not None:
+                server.client_left(client)
+                client.close()
+                if client in server.clients:
+                    server.clients.remove(client)
+                print("[-] {} left | Clients: {}".format(
+                    addr, len(server.clients)))
+            writer.close()
+
+    async def fire_step(self):
+        # The grid belongs to the executor thread until the step finishes,
+        # so commands that arrive meanwhile are applied at the start of the
+        # next tick, in order.
+        loop = asyncio.get_running_loop()
+        self.stepping = True
+        try:
+            with metrics.timer("fire_step"):
+                await loop.run_in_executor(self.executor, server.update_fire)
+        except Exception as e:
+            print("Fire error: {}".format(e))
+        finally:
+            self.stepping = False
+
+    def apply_deferred(self):
+        deferred, self.deferred = self.deferred, []
+        for client, cmd in deferred:
+            if not client.closed:
+                server.handle_command(client, cmd)
+
+    def publish(self):
+        with metrics.timer("capture"):
+            captured = server.capture_state()
+        update = server.publish_state(captured)
+        if update is not None:
+            with metrics.timer("broadcast"):
+                server.broadcast_state(update)
+
+    async def tick_loop(self):
+        scheduler = TickScheduler(server.TICK_HZ, server.SEND_HZ,
+                                  server.MAX_CATCH_UP)
+        next_report = scheduler.clock() + server.METRICS_LOG_SEC
+        next_stats = scheduler.clock() + server.STATS_SEC
+        while True:
+            started = scheduler.clock()
+            try:
+                for _ in range(scheduler.due_ticks(started)):
+                    server.apply_water()
+                    server.move_firefighters()
+                    if server.fire_due():
+                        await self.fire_step()
+                    server.frame += 1
+                    self.apply_deferred()
+                if scheduler.send_due(started):
+                    self.publish()
+            except Exception as e:
+                print("Loop error: {}".format(e))
+
+            if server.METRICS_LOG_SEC > 0 and scheduler.clock() >= next_report:
+                next_report = scheduler.clock() + server.METRICS_LOG_SEC
+                print("[metrics]\n" + metrics.format_report())
+            if scheduler.clock() >= next_stats:
+                next_stats = scheduler.clock() + server.STATS_SEC
+                server.send_stats()
+            await asyncio.sleep(scheduler.finish(started))
+
+    async def run(self, host, port):
+        self.publish()
+        listener = await asyncio.start_server(self.handle_client, host, port)
+        print("Server (asyncio) on {}:{}".format(host, port))
+        print("Fire: UPDATE_EVERY={} engine={}".format(
+            server.UPDATE_EVERY, server.engine_name()))
+        print("Tick: {:g} Hz, send: {:g} Hz".format(server.TICK_HZ,
+                                                    server.SEND_HZ))
+        print("Players: {} max, spectators: {} max".format(
+            server.MAX_PLAYERS, MAX_SPECTATORS))
+        async with listener:
+            await asyncio.gather(listener.serve_forever(), self.tick_loop())
+
+
+def main():
+    # Entry point for both "python server_async.py" and SERVER_MODE=asyncio
+    server.open_command_log()
+    server.start_stats()
+    try:
+        asyncio.run(AsyncServer().run(server.HOST, server.PORT))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,9 @@ import time
 
 import pygame
 
+import client_state
+import wire_format
+
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -225,7 +228,8 @@ def observer_loop(config, state, stop_event, game_started_event):
             sock.settimeout(2.0)
             sock.connect((host, port))
 
-            auth_data = {"type": "AUTH", "password": password, "role": "dispatcher"}
+            auth_data = {"type": "AUTH", "password": password, "role": "dispatcher",
+                         "wire": [wire_format.WIRE_BIN]}
             payload = json.dumps(auth_data).encode("utf-8")
             sock.sendall(struct.pack(">I", len(payload)) + payload)
 
@@ -246,7 +250,11 @@ def observer_loop(config, state, stop_event, game_started_event):
                 state["observer_addr"] = str(sock.getsockname())
                 state["players"].pop(state["observer_addr"], None)
 
+            payload = json.dumps({"type": "STATS_SUBSCRIBE"}).encode("utf-8")
+            sock.sendall(struct.pack(">I", len(payload)) + payload)
+
             sock.settimeout(0.5)
+            net_state = client_state.ClientState(0, 0)
             while not stop_event.is_set():
                 if game_started_event.is_set() and not state.get("game_sent", False):
                     with state["lock"]:
@@ -268,10 +276,18 @@ def observer_loop(config, state, stop_event, game_started_event):
                 raw_state = recv_exact(sock, msg_len, stop_event=stop_event, max_wait_sec=3.0)
                 if not raw_state:
                     break
-                msg = json.loads(raw_state.decode("utf-8"))
-                if "grid" in msg:
+                msg = wire_format.decode(raw_state, net_state.type_names)
+                if msg.get("type") == "STATS":
+                    with state["lock"]:
+                        state["stats"] = msg
+                elif msg.get("type") in ("STATE_UPDATE", "STATE_DELTA"):
+                    if not net_state.apply(msg):
+                        payload = json.dumps({"type": "RESYNC"}).encode("utf-8")
+                        sock.sendall(struct.pack(">I", len(payload)) + payload)
+                        continue
+                    # Опубликованный кадр не меняется, его можно рисовать без блокировки
                     with state["lock"]:
-                        state["grid"] = msg["grid"]
+                        state["grid"] = net_state.current().grid
                         state["last_grid_update"] = time.time()
 
         except Exception as exc:
@@ -318,6 +334,35 @@ def draw_minimap(surface, grid):
             pygame.draw.rect(surface, cell_color(grid[y][x]), (x * cw, y * ch, cw, ch))
 
 
+def stats_lines(stats):
+    if not stats:
+        return ["Нет данных"]
+    timings = stats.get("timings_ms", {})
+    lines = ["Кадр {}  |  {:g} Гц  |  {}".format(
+        stats.get("frame", 0), stats.get("tick_hz", 0), stats.get("engine", ""))]
+    for name, label in (("fire_step", "Шаг огня"), ("capture", "Снимок"),
+                        ("encode_json", "JSON"), ("encode_bin1", "Бинарный"),
+                        ("broadcast", "Рассылка"), ("tick_work", "Тик"),
+                        ("lock_wait", "Ожид. блок."), ("lock_hold", "Удерж. блок.")):
+        t = timings.get(name)
+        if t and "avg" in t:
+            lines.append("{}: {:.2f} / p95 {:.2f} / max {:.1f} мс".format(
+                label, t["avg"], t["p95"], t["max"]))
+    counters = stats.get("counters", {})
+    if counters.get("ticks_dropped") or counters.get("tick_overruns"):
+        lines.append("Пропущено тиков: {}  перегрузок: {}".format(
+            counters.get("ticks_dropped", 0), counters.get("tick_overruns", 0)))
+    clients = stats.get("clients", [])
+    sent = sum(c.get("bytes_sent", 0) for c in clients)
+    lines.append("Клиентов: {}  отправлено {:.1f} МБ".format(len(clients), sent / 1048576.0))
+    top = sorted(stats.get("commands", {}).items(), key=lambda kv: -kv[1])[:4]
+    if top:
+        lines.append("Команды: " + ", ".join("{} {}".format(k, v) for k, v in top))
+    for name, share in (stats.get("profile") or {}).get("lines", [])[:3]:
+        lines.append("{:4.0%} {}".format(share, name[:34]))
+    return lines
+
+
 def role_counts(players):
     counts = {key: 0 for key in ROLE_KEYS}
     for role in players.values():
@@ -346,6 +391,7 @@ def dashboard_loop(config, process):
         "last_grid_update": 0.0,
         "game_started": False,
         "game_sent": False,
+        "stats": None,
     }
     stop_event = threading.Event()
     game_started_event = threading.Event()
@@ -416,6 +462,7 @@ def dashboard_loop(config, process):
             players = dict(state["players"])
             game_started = state["game_started"]
             players_count = len(players)
+            stats = state["stats"]
 
         draw_minimap(map_surface, grid)
         counts = role_counts(players)
@@ -458,6 +505,13 @@ def dashboard_loop(config, process):
         else:
             screen.blit(small_font.render("Нет подключений", True, (170, 182, 205)), (panel_x, y))
 
+        stats_x = 860
+        screen.blit(font.render("Сервер", True, (240, 245, 255)), (stats_x, 304))
+        y = 338
+        for line in stats_lines(stats):
+            screen.blit(small_font.render(line, True, (188, 206, 230)), (stats_x, y))
+            y += 22
+
         if game_started:
             screen.blit(small_font.render("ИГРА ЗАПУЩЕНА (хост тоже в игре)", True, (90, 220, 120)), (40, 210))
 
@@ -0,0 +1,138 @@
+import math
+from array import array
+
+STATES = ("unburned", "burning", "smoldering", "burned")
+UNBURNED, BURNING, SMOLDERING, BURNED = range(4)
+
+DEFAULT_MOISTURE = 22.0
+MAX_TYPES = 256
+
+
+class Grid:
+    # One typed array per cell attribute, indexed by y * cols + x.
+    # Cell types are stored as uint8 ids into type_names.
+
+    def __init__(self, cols, rows, type_names=()):
+        self.cols = cols
+        self.rows = rows
+        self.size = cols * rows
+        self.type_names = []
+        self.type_ids = {}
+        self.type_id("empty")
+        for name in type_names:
+            self.type_id(name)
+
+        self.fuel = array("d", [0.0]) * self.size
+        self.intensity = array("d", [0.0]) * self.size
+        self.heat = array("d", [0.0]) * self.size
+        self.moisture = array("d", [DEFAULT_MOISTURE]) * self.size
+        self.state = array("B", [UNBURNED]) * self.size
+        self.type = array("B", [0]) * self.size
+        # Notified before cells are written outside the fire engine
+        self.observer = None
+
+    def type_id(self, name):
+        tid = self.type_ids.get(name)
+        if tid is None:
+            tid = len(self.type_names)
+            if tid >= MAX_TYPES:
+                raise ValueError("Too many cell types: {}".format(name))
+            self.type_names.append(name)
+            self.type_ids[name] = tid
+        return tid
+
+    def index(self, x, y):
+        return y * self.cols + x
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.cols and 0 <= y < self.rows
+
+    def type_name(self, x, y):
+        return self.type_names[self.type[y * self.cols + x]]
+
+    def touch(self, i):
+        # Call before writing cell i directly through the column arrays
+        if self.observer is not None:
+            self.observer.cell_changing(i)
+
+    def touch_all(self):
+        if self.observer is not None:
+            self.observer.grid_changing()
+
+    def put(self, i, ctype=None, fuel=None, intensity=None, heat=None,
+            moisture=None, state=None):
+        self.touch(i)
+        if ctype is not None:
+            self.type[i] = self.type_id(ctype)
+        if fuel is not None:
+            self.fuel[i] = fuel
+        if intensity is not None:
+            self.intensity[i] = intensity
+        if heat is not None:
+            self.heat[i] = heat
+        if moisture is not None:
+            self.moisture[i] = moisture
+        if state is not None:
+            self.state[i] = state
+
+    def fill(self, column, value):
+        self.touch_all()
+        col = getattr(self, column)
+        col[:] = array(col.typecode, [value]) * self.size
+
+    def reset(self):
+        self.fill("fuel", 0.0)
+        self.fill("intensity", 0.0)
+        self.fill("heat", 0.0)
+        self.fill("moisture", DEFAULT_MOISTURE)
+        self.fill("state", UNBURNED)
+        self.fill("type", 0)
+
+    def find_types(self, names):
+        ids = {self.type_ids[n] for n in names if n in self.type_ids}
+        return [i for i, t in enumerate(self.type) if t in ids]
+
+    def load_rows(self, rows):
+        # rows: [[fuel, intensity, type_name], ...] as sent by clients.
+        # Only the types the grid was created with are accepted; unknown
+        # names load as "empty". Nothing is written unless every cell parses.
+        try:
+            if (len(rows) != self.rows
+                    or any(len(r) != self.cols for r in rows)):
+                return False
+            cells = [cell for row in rows for cell in row]
+            fuel = array("d", [float(c[0]) for c in cells])
+            intensity = array("d", [float(c[1]) for c in cells])
+            type_ids = self.type_ids
+            types = array("B", [type_ids.get(c[2], 0) for c in cells])
+        except (TypeError, ValueError, IndexError):
+            return False
+        if not all(map(math.isfinite, fuel)) or not all(
+                map(math.isfinite, intensity)):
+            return False
+        state = array("B", [BURNING if v > 0 else UNBURNED
+                            for v in intensity])
+
+        self.touch_all()
+        self.fuel[:] = fuel
+        self.intensity[:] = intensity
+        self.type[:] = types
+        self.state[:] = state
+        self.fill("heat", 0.0)
+        return True
+
+    def snapshot(self):
+        return grid_rows(self.cols, self.fuel, self.intensity, self.type,
+                         self.type_names)
+
+
+def grid_rows(cols, fuel, intensity, ctype, type_names):
+    # Nested [[fuel, intensity, type_name], ...] rows used by the JSON protocol
+    names = type_names.__getitem__
+    rows = []
+    for start in range(0, len(fuel), cols):
+        end = start + cols
+        rows.append(list(map(list, zip(fuel[start:end],
+                                       intensity[start:end],
+                                       map(names, ctype[start:end])))))
+    return rows
@@ -0,0 +1,237 @@
+import json
+import struct
+
+import wire_format
+from sim_grid import grid_rows
+
+STATE_FIELDS = ("edit_mode", "running_sim", "available_trucks",
+                "firefighters", "supply_hoses")
+# A delta touching more than this share of the grid is sent as a keyframe
+KEYFRAME_RATIO = 0.5
+HEARTBEAT_SEC = 1.0
+
+
+class StateFrame:
+    __slots__ = ("cols", "rows", "fuel", "intensity", "type", "type_names",
+                 "fields")
+
+
+def capture(grid, fields):
+    # Array slices are plain memory copies, cheap enough to take under lock
+    frame = StateFrame()
+    frame.cols = grid.cols
+    frame.rows = grid.rows
+    frame.fuel = grid.fuel[:]
+    frame.intensity = grid.intensity[:]
+    frame.type = grid.type[:]
+    frame.type_names = list(grid.type_names)
+    frame.fields = fields
+    return frame
+
+
+def changed_cells(prev, cur):
+    changed = set()
+    for name in ("fuel", "intensity", "type"):
+        a = getattr(prev, name)
+        b = getattr(cur, name)
+        if a != b:
+            changed.update(i for i, (u, v) in enumerate(zip(a, b)) if u != v)
+    return sorted(changed)
+
+
+class StateUpdate:
+    # One published state change; encoded lazily, at most once per wire format
+
+    def __init__(self, seq, base, frame, cells, fields, base_type_count=0):
+        self.seq = seq
+        self.base = base
+        self.frame = frame
+        self.cells = cells      # None for a keyframe
+        self.fields = fields
+        self.base_type_count = base_type_count
+        self.encoded = {}
+        self.packets = {}
+
+    @property
+    def is_keyframe(self):
+        return self.cells is None
+
+    def merge(self, later):
+        # One update taking a client that has not received self yet to
+        # later's state: a delta from self's base with both cell sets.
+        # None when that cannot be a delta (self is a keyframe, later does
+        # not follow self, or the union is too big); send a keyframe then.
+        if later.is_keyframe:
+            return later
+        if self.is_keyframe or later.base != self.seq:
+            return None
+        cells = sorted(set(self.cells).union(later.cells))
+        if len(cells) > len(later.frame.fuel) * KEYFRAME_RATIO:
+            return None
+        fields = dict(self.fields)
+        fields.update(later.fields)
+        return StateUpdate(later.seq, self.base, later.frame, cells, fields,
+                           self.base_type_count)
+
+    def to_json(self):
+        frame = self.frame
+        if self.cells is None:
+            msg = {
+                "type": "STATE_UPDATE",
+                "seq": self.seq,
+                "grid": grid_rows(frame.cols, frame.fuel, frame.intensity,
+                                  frame.type, frame.type_names),
+            }
+        else:
+            names = frame.type_names
+            cols = frame.cols
+            msg = {
+                "type": "STATE_DELTA",
+                "seq": self.seq,
+                "base": self.base,
+                "cells": [[i % cols, i // cols, frame.fuel[i],
+                           frame.intensity[i], names[frame.type[i]]]
+                          for i in self.cells],
+            }
+        msg.update(self.fields)
+        return msg
+
+    def to_binary(self):
+        frame = self.frame
+        header = {"seq": self.seq, "cols": frame.cols, "rows": frame.rows}
+        if self.cells is None:
+            header["type"] = "STATE_UPDATE"
+            header["cell_types"] = frame.type_names
+            body = wire_format.pack_cells(frame.fuel, frame.type,
+                                          frame.intensity)
+            kind = wire_format.KIND_KEYFRAME
+        else:
+            header["type"] = "STATE_DELTA"
+            header["base"] = self.base
+            if len(frame.type_names) != self.base_type_count:
+                header["cell_types"] = frame.type_names
+            body = wire_format.pack_delta_cells(self.cells, frame.fuel,
+                                                frame.type, frame.intensity)
+            kind = wire_format.KIND_DELTA
+        header.update(self.fields)
+        return wire_format.pack_message(kind, header, body)
+
+    def payload(self, wire):
+        data = self.encoded.get(wire)
+        if data is None:
+            if wire == wire_format.WIRE_BIN:
+                data = self.to_binary()
+            else:
+                data = json.dumps(self.to_json()).encode("utf-8")
+            self.encoded[wire] = data
+        return data
+
+    def packet(self, wire):
+        # Length-prefixed payload, shared by every client using this format
+        data = self.packets.get(wire)
+        if data is None:
+            payload = self.payload(wire)
+            data = self.packets[wire] = struct.pack(">I", len(payload)) + payload
+        return data
+
+
+class StatePublisher:
+    def __init__(self):
+        self.seq = 0
+        self.frame = None
+        self.force_keyframe = True
+        self.last_sent = 0.0
+        self.last_keyframe = None
+
+    def request_keyframe(self):
+        self.force_keyframe = True
+
+    def keyframe(self):
+        # Reused until the next publish, so joiners share one encoding
+        update = self.last_keyframe
+        if update is None or update.seq != self.seq:
+            frame = self.frame
+            update = StateUpdate(self.seq, None, frame, None, frame.fields)
+            self.last_keyframe = update
+        return update
+
+    def publish(self, frame, now):
+        # Returns the StateUpdate to broadcast for this frame, or None when
+        # nothing changed and the heartbeat is not due yet.
+        prev = self.frame
+        if prev is None or self.force_keyframe:
+            return self.commit(frame, now, None)
+
+        cells = changed_cells(prev, frame)
+        if len(cells) > len(frame.fuel) * KEYFRAME_RATIO:
+            return self.commit(frame, now, None)
+
+        fields = {k: v for k, v in frame.fields.items()
+                  if prev.fields.get(k) != v}
+        if not cells and not fields and now - self.last_sent < HEARTBEAT_SEC:
+            return None
+
+        delta = StateUpdate(self.seq + 1, self.seq, frame, cells, fields,
+                            len(prev.type_names))
+        return self.commit(frame, now, delta)
+
+    def commit(self, frame, now, delta):
+        self.seq += 1
+        self.frame = frame
+        self.force_keyframe = False
+        self.last_sent = now
+        return delta if delta is not None else self.keyframe()
+
+
+class StateMirror:
+    # Client-side copy of the server state rebuilt from keyframes and deltas
+
+    def __init__(self, cols, rows):
+        self.seq = None
+        self.awaiting_keyframe = False
+        self.type_names = []
+        self.grid = [[[0, 0, "empty"] for _ in range(cols)]
+                     for _ in range(rows)]
+        self.fields = {}
+        # (x, y, old intensity, new intensity) for the cells the last delta
+        # changed; None after a keyframe
+        self.changed = None
+
+    def get(self, name, default=None):
+        return self.fields.get(name, default)
+
+    def apply(self, msg):
+        # Returns False when the caller should send {"type": "RESYNC"}
+        mt = msg.get("type")
+        if mt == "STATE_UPDATE":
+            if msg.get("grid"):
+                self.grid = msg["grid"]
+            self.changed = None
+            self.seq = msg.get("seq")
+            self.awaiting_keyframe = False
+            self.update_fields(msg)
+            return True
+
+        if mt == "STATE_DELTA":
+            seq = msg.get("seq", 0)
+            if self.seq is not None and seq <= self.seq:
+                return True
+            if self.seq is None or msg.get("base") != self.seq:
+                if self.awaiting_keyframe:
+                    return True
+                self.awaiting_keyframe = True
+                return False
+            grid = self.grid
+            changed = []
+            for x, y, fuel, intensity, ctype in msg.get("cells", ()):
+                changed.append((x, y, grid[y][x][1], intensity))
+                grid[y][x] = [fuel, intensity, ctype]
+            self.changed = changed
+            self.seq = seq
+            self.update_fields(msg)
+        return True
+
+    def update_fields(self, msg):
+        for name in STATE_FIELDS:
+            if name in msg:
+                self.fields[name] = msg[name]
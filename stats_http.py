@@ -0,0 +1,69 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stats endpoint. GET only reads; the profiler controls change its
+# state and are POST only:
+#   GET  /stats              server snapshot (timings, histograms, clients)
+#   GET  /profile            sampling profiler report
+#   POST /profile/start?hz=N start sampling (default rate of the profiler)
+#   POST /profile/stop       stop sampling
+#   POST /profile/reset      clear collected samples
+
+
+def serve(host, port, snapshot, profiler):
+    # snapshot() returns a JSON-serialisable dict; runs in a daemon thread
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/stats":
+                return self.send_json(snapshot())
+            if url.path.rstrip("/") == "/profile":
+                return self.send_json(self.profile_report())
+            if url.path.startswith("/profile/"):
+                return self.send_error(405)
+            return self.send_error(404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            action = url.path[len("/profile"):].strip("/")
+            if not url.path.startswith("/profile/"):
+                return self.send_error(404)
+            if action == "start":
+                try:
+                    hz = int(query.get("hz", ["0"])[0])
+                except ValueError:
+                    return self.send_error(400, "hz must be an integer")
+                if hz < 0:
+                    return self.send_error(400, "hz must not be negative")
+                profiler.start(hz or None)
+            elif action == "stop":
+                profiler.stop()
+            elif action == "reset":
+                profiler.reset()
+            else:
+                return self.send_error(404)
+            self.send_json(self.profile_report())
+
+        def profile_report(self):
+            return {"running": profiler.running, "hz": profiler.hz,
+                    "samples": profiler.samples, "idle": profiler.idle,
+                    "top": profiler.top(40)}
+
+        def send_json(self, body):
+            data = json.dumps(body, ensure_ascii=False, indent=1).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,213 @@
+import os
+import random
+
+import pygame
+
+# Shared texture loading for the pygame clients. Every size a client draws
+# is scaled once at start-up and packed into one atlas surface, so draw
+# loops only blit.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEXTURE_DIR = os.path.join(BASE_DIR, "textures")
+FIRE_PATH = os.path.join(BASE_DIR, "fire.png")
+EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+THUMB = 20          # tool previews in the editor panel
+FF_THUMB = 18       # firefighter list in the sandbox panel
+GHOST_ALPHA = 120   # stamp previews under the cursor
+# Fire flicker frames: the fire texture at these brightness levels
+FIRE_LEVELS = (255, 235, 215, 195)
+# Smouldering cells: an orange tint growing with intensity up to
+# SMOULDER_MAX, in SMOULDER_STEPS shades per intensity point
+SMOULDER_COLOR = (255, 80, 0)
+SMOULDER_ALPHA = 28  # per intensity point
+SMOULDER_MAX = 8
+SMOULDER_STEPS = 4
+ATLAS_WIDTH = 1024
+
+# File name -> texture keys it provides
+ALIASES = {
+    "road": ("road", "road_straight"),
+    "road_straight": ("road", "road_straight"),
+    "road_right": ("road_right", "road_turn"),
+    "road_turn": ("road_right", "road_turn"),
+    "wood": ("wood", "wall", "wood_floor"),
+    "fire_fighter": ("firefighter",),
+}
+FF_DIRS = {"up": 0, "right": -90, "down": 180, "left": 90}
+
+
+def stamp_size(key, cell):
+    # Size in pixels of a texture drawn at a stamp's root cell
+    if key == "firecar":
+        return (cell * 4, cell * 8)
+    if key in ("road", "road_straight"):
+        return (cell * 4, cell * 4)
+    if key in ("road_right", "road_turn"):
+        return (cell * 5, cell * 5)
+    return (cell, cell)
+
+
+def multiply_alpha(surface, alpha):
+    surface = surface.copy()
+    surface.fill((255, 255, 255, alpha), special_flags=pygame.BLEND_RGBA_MULT)
+    return surface
+
+
+class Atlas:
+    # textures: key -> texture at its drawn size; thumbs: key -> THUMB
+    # preview; ghosts: key -> half transparent texture; fire: flicker frames
+    # at cell size; ff / ff_thumbs: firefighter sprites by direction, plus
+    # "<dir>_act" highlighted ones in ff; smoulder: tints by intensity
+    # shade. All are subsurfaces of surface.
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.surface = None
+        self.textures = {}
+        self.thumbs = {}
+        self.ghosts = {}
+        self.fire = []
+        self.ff = {}
+        self.ff_thumbs = {}
+        self.smoulder = []
+        self.plain = {}
+
+    def fire_frame(self):
+        return self.fire[random.randrange(len(self.fire))]
+
+    def smoulder_tint(self, intensity):
+        n = int(intensity * SMOULDER_STEPS)
+        return self.smoulder[max(0, min(n, len(self.smoulder) - 1))]
+
+    def solid(self, color, size=None):
+        # A plain surface of color, made on first use and kept
+        size = size or (self.cell, self.cell)
+        key = (tuple(color), size)
+        surface = self.plain.get(key)
+        if surface is None:
+            surface = pygame.Surface(size).convert()
+            surface.fill(color)
+            self.plain[key] = surface
+        return surface
+
+    def pack(self, items):
+        # items: [(table, key, surface)]; copies each surface into the atlas
+        # and stores its subsurface as table[key]. Shelf packing, tallest
+        # first.
+        order = sorted(range(len(items)),
+                       key=lambda n: -items[n][2].get_height())
+        places = {}
+        x = y = shelf = 0
+        for n in order:
+            w, h = items[n][2].get_size()
+            if x + w > ATLAS_WIDTH:
+                x = 0
+                y += shelf
+                shelf = 0
+            places[n] = (x, y)
+            x += w
+            shelf = max(shelf, h)
+        size = (ATLAS_WIDTH, max(1, y + shelf))
+        self.surface = pygame.Surface(size, pygame.SRCALPHA).convert_alpha()
+        self.surface.fill((0, 0, 0, 0))
+        for n, (table, key, image) in enumerate(items):
+            x, y = places[n]
+            self.surface.blit(image, (x, y))
+            table[key] = self.surface.subsurface(
+                pygame.Rect((x, y), image.get_size()))
+
+
+def load_images():
+    images = {}
+    os.makedirs(TEXTURE_DIR, exist_ok=True)
+    for filename in sorted(os.listdir(TEXTURE_DIR)):
+        if not filename.lower().endswith(EXTENSIONS):
+            continue
+        name = os.path.splitext(filename)[0].lower()
+        try:
+            img = pygame.image.load(os.path.join(TEXTURE_DIR, filename))
+        except Exception as e:
+            print("Error loading {}: {}".format(filename, e))
+            continue
+        for key in ALIASES.get(name, (name,)):
+            images[key] = img
+    return images
+
+
+def load(cell, fallback_colors=None):
+    # Call after pygame.display.set_mode. fallback_colors: key -> colour of
+    # a plain texture for keys that have no image.
+    images = load_images()
+    try:
+        fire = pygame.image.load(FIRE_PATH).convert_alpha()
+    except Exception:
+        fire = pygame.Surface((cell, cell), pygame.SRCALPHA)
+        fire.fill((255, 100, 0, 180))
+
+    atlas = Atlas(cell)
+    items = []
+    for key, img in images.items():
+        if key == "firefighter":
+            continue
+        img = img.convert_alpha()
+        size = stamp_size(key, cell)
+        scaled = pygame.transform.scale(img, size)
+        items.append((atlas.textures, key, scaled))
+        items.append((atlas.thumbs, key,
+                      pygame.transform.scale(scaled, (THUMB, THUMB))))
+        if size != (cell, cell):
+            items.append((atlas.ghosts, key,
+                          multiply_alpha(scaled, GHOST_ALPHA)))
+    for key, color in (fallback_colors or {}).items():
+        if key in images:
+            continue
+        plain = pygame.Surface((cell, cell), pygame.SRCALPHA)
+        plain.fill(color)
+        items.append((atlas.textures, key, plain))
+        items.append((atlas.thumbs, key,
+                      pygame.transform.scale(plain, (THUMB, THUMB))))
+
+    fire = pygame.transform.scale(fire, (cell, cell))
+    fire_frames = {}
+    for n, level in enumerate(FIRE_LEVELS):
+        items.append((fire_frames, n, multiply_alpha(fire, level)))
+
+    tints = {}
+    for n in range(SMOULDER_MAX * SMOULDER_STEPS + 1):
+        alpha = min(255, int(n * SMOULDER_ALPHA / SMOULDER_STEPS))
+        tint = pygame.Surface((cell, cell), pygame.SRCALPHA)
+        tint.fill(SMOULDER_COLOR + (alpha,))
+        items.append((tints, n, tint))
+
+    for d, sprite in ff_sprites(images.get("firefighter"), cell).items():
+        items.append((atlas.ff, d, sprite))
+        if not d.endswith("_act"):
+            thumb = pygame.transform.scale(sprite, (FF_THUMB, FF_THUMB))
+            items.append((atlas.ff_thumbs, d, thumb))
+
+    atlas.pack(items)
+    atlas.fire = [fire_frames[n] for n in sorted(fire_frames)]
+    atlas.smoulder = [tints[n] for n in sorted(tints)]
+    return atlas
+
+
+def ff_sprites(img, cell):
+    size = (cell + 8, cell + 8)
+    if img is not None:
+        base = pygame.transform.scale(img.convert_alpha(), size)
+    else:
+        base = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.circle(base, (0, 180, 255),
+                           (cell // 2 + 4, cell // 2 + 4), 10)
+        pygame.draw.rect(base, (200, 50, 50), (cell // 2 - 2, 0, 12, 6))
+    sprites = {}
+    for d, angle in FF_DIRS.items():
+        sprite = pygame.transform.rotate(base, angle) if angle else base
+        sprites[d] = sprite
+        active = sprite.copy()
+        glow = pygame.Surface(active.get_size(), pygame.SRCALPHA)
+        glow.fill((255, 255, 100, 60))
+        active.blit(glow, (0, 0))
+        sprites[d + "_act"] = active
+    return sprites
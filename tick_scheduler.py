@@ -0,0 +1,51 @@
+import time
+
+import metrics
+
+
+class TickScheduler:
+    # Fixed simulation timestep on the monotonic clock, plus an independent
+    # network send rate. Ticks that fall behind are caught up, at most
+    # max_catch_up per wakeup; anything beyond that is dropped and counted.
+
+    def __init__(self, tick_hz, send_hz, max_catch_up=5, clock=time.monotonic):
+        self.tick_dt = 1.0 / tick_hz
+        self.send_dt = 1.0 / send_hz
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        now = clock()
+        self.next_tick = now
+        self.next_send = now
+        self.ticks = 0
+
+    def due_ticks(self, now):
+        late = now - self.next_tick
+        if late < 0:
+            return 0
+        metrics.record("tick_late", late)
+        due = int(late / self.tick_dt) + 1
+        run = min(due, self.max_catch_up)
+        if due > run:
+            metrics.incr("ticks_dropped", due - run)
+        if run > 1:
+            metrics.incr("ticks_caught_up", run - 1)
+        self.next_tick += due * self.tick_dt
+        self.ticks += run
+        return run
+
+    def send_due(self, now):
+        if now < self.next_send:
+            return False
+        # Sends are never caught up, only the latest state matters
+        missed = int((now - self.next_send) / self.send_dt)
+        self.next_send += (missed + 1) * self.send_dt
+        return True
+
+    def finish(self, started):
+        # Call after the work of one wakeup; returns seconds to sleep
+        now = self.clock()
+        work = now - started
+        metrics.record("tick_work", work)
+        if work > self.tick_dt:
+            metrics.incr("tick_overruns")
+        return max(0.0, min(self.next_tick, self.next_send) - now)
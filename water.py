@@ -0,0 +1,63 @@
+# Hose patterns shared by the clients (aiming, particles) and the server,
+# which expands EXTINGUISH_SHAPE commands into cells.
+
+STREAM_LEN = 6
+SPRAY_LEN = 3
+STREAM_POWER = 5
+SPRAY_POWER = 3
+
+DIR_VEC = {
+    "up": (0, -1),
+    "down": (0, 1),
+    "left": (-1, 0),
+    "right": (1, 0),
+}
+
+
+def stream_cells(cx, cy, ddx, ddy, cols, rows):
+    # A jet three cells wide, cut off at the edge of the map
+    cells = []
+    for i in range(1, STREAM_LEN + 1):
+        sx = cx + ddx * i
+        sy = cy + ddy * i
+        if sx < 0 or sx >= cols or sy < 0 or sy >= rows:
+            break
+        cells.append((sx, sy))
+        if ddx == 0:
+            if sx - 1 >= 0:
+                cells.append((sx - 1, sy))
+            if sx + 1 < cols:
+                cells.append((sx + 1, sy))
+        else:
+            if sy - 1 >= 0:
+                cells.append((sx, sy - 1))
+            if sy + 1 < rows:
+                cells.append((sx, sy + 1))
+    return cells
+
+
+def spray_cells(cx, cy, ddx, ddy, cols, rows):
+    # A cone widening by one cell either side per step
+    cells = []
+    for i in range(1, SPRAY_LEN + 1):
+        spread = i + 1
+        for s in range(-spread, spread + 1):
+            if ddx == 0:
+                sx = cx + s
+                sy = cy + ddy * i
+            else:
+                sx = cx + ddx * i
+                sy = cy + s
+            if 0 <= sx < cols and 0 <= sy < rows:
+                cells.append((sx, sy))
+    return cells
+
+
+def shape_cells(x, y, direction, mode, cols, rows):
+    # (cells, power) for a shape command; no cells for an unknown direction
+    vec = DIR_VEC.get(direction)
+    if vec is None:
+        return [], 0
+    if mode == "spray":
+        return spray_cells(x, y, vec[0], vec[1], cols, rows), SPRAY_POWER
+    return stream_cells(x, y, vec[0], vec[1], cols, rows), STREAM_POWER
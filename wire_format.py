@@ -0,0 +1,100 @@
+import json
+import math
+import struct
+import sys
+
+WIRE_JSON = "json"
+WIRE_BIN = "bin1"
+
+# Binary payloads start with MAGIC; JSON payloads always start with "{"
+MAGIC = 0xB1
+KIND_KEYFRAME = 1
+KIND_DELTA = 2
+HEADER = struct.Struct(">BBI")        # magic, kind, json header length
+CELL = struct.Struct("<HBB")          # fuel, type id, intensity
+DELTA_CELL = struct.Struct("<IHBB")   # cell index, fuel, type id, intensity
+
+FUEL_MAX = 0xFFFF
+INTENSITY_MAX = 0xFF
+
+
+def choose_wire(offered):
+    if isinstance(offered, list) and WIRE_BIN in offered:
+        return WIRE_BIN
+    return WIRE_JSON
+
+
+def quantize(values, limit):
+    # ceil keeps client-side checks such as "intensity > 8" and "<= 6" exact
+    return [0 if v <= 0 else limit if v >= limit else math.ceil(v)
+            for v in values]
+
+
+def pack_cells(fuel, ctype, intensity):
+    n = len(ctype)
+    fuel_bytes = struct.pack("<{}H".format(n), *quantize(fuel, FUEL_MAX))
+    out = bytearray(n * CELL.size)
+    out[0::4] = fuel_bytes[0::2]
+    out[1::4] = fuel_bytes[1::2]
+    out[2::4] = bytes(ctype)
+    out[3::4] = bytes(quantize(intensity, INTENSITY_MAX))
+    return out
+
+
+def pack_delta_cells(indices, fuel, ctype, intensity):
+    pack = DELTA_CELL.pack
+    return b"".join(
+        pack(i, f, t, v) for i, f, t, v in zip(
+            indices,
+            quantize([fuel[i] for i in indices], FUEL_MAX),
+            [ctype[i] for i in indices],
+            quantize([intensity[i] for i in indices], INTENSITY_MAX)))
+
+
+def pack_message(kind, header, body):
+    head = json.dumps(header).encode("utf-8")
+    return HEADER.pack(MAGIC, kind, len(head)) + head + body
+
+
+def unpack_cells(view, cols, names):
+    if sys.byteorder == "little":
+        fuel = view.cast("H")[0::2]
+        ctype = view[2::4]
+        intensity = view[3::4]
+        cells = list(zip(fuel, intensity, map(names.__getitem__, ctype)))
+    else:
+        cells = [(f, v, names[t]) for f, t, v in CELL.iter_unpack(view)]
+    return [cells[start:start + cols] for start in range(0, len(cells), cols)]
+
+
+def unpack_delta_cells(view, cols, names):
+    return [(i % cols, i // cols, f, v, names[t])
+            for i, f, t, v in DELTA_CELL.iter_unpack(view)]
+
+
+def decode(body, type_names):
+    # type_names is the receiver's id -> name table, updated in place when
+    # the server sends a new one.
+    if not body or body[0] != MAGIC:
+        return json.loads(body.decode("utf-8"))
+    _, kind, head_len = HEADER.unpack_from(body)
+    start = HEADER.size
+    msg = json.loads(body[start:start + head_len].decode("utf-8"))
+    if "cell_types" in msg:
+        type_names[:] = msg.pop("cell_types")
+    view = memoryview(body)[start + head_len:]
+    cols = msg.get("cols", 1)
+    if kind == KIND_KEYFRAME:
+        msg["grid"] = unpack_cells(view, cols, type_names)
+    elif kind == KIND_DELTA:
+        msg["cells"] = unpack_delta_cells(view, cols, type_names)
+    return msg
+
+
+def decode_header(body):
+    # Message fields without the cell records; cheap for binary messages
+    if not body or body[0] != MAGIC:
+        return json.loads(body.decode("utf-8"))
+    head_len = HEADER.unpack_from(body)[2]
+    start = HEADER.size
+    return json.loads(body[start:start + head_len].decode("utf-8"))